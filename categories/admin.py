@@ -38,7 +38,31 @@ class QuestionAnswerAdmin(admin.ModelAdmin):
 
 
 class MonzoUserAdmin(admin.ModelAdmin):
-    pass
+    list_display = ('id', 'user', 'access_token_expires')
+
+
+class MonzoAccountAdmin(admin.ModelAdmin):
+    list_display = ('id', 'description', 'monzo_user', 'closed', 'last_synced')
+
+
+class MonzoTransactionAdmin(admin.ModelAdmin):
+    list_display = ('id', 'created', 'description', 'amount', 'settled')
+    list_filter = ['include_in_spending']
+
+
+class MerchantAdmin(admin.ModelAdmin):
+    list_display = ('id', 'name', 'category')
+    list_filter = ['category']
+
+
+class SpendRollupAdmin(admin.ModelAdmin):
+    list_display = ('date', 'account_id', 'category', 'top_level', 'count', 'sum_pennies')
+    list_filter = ['account_id']
+
+
+class JobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'kind', 'target', 'status', 'attempts', 'run_after', 'started', 'finished')
+    list_filter = ['kind', 'status']
 
 
 admin.site.register(Category, CategoryAdmin)
@@ -54,3 +78,13 @@ admin.site.register(CashTransaction, CashTransactionAdmin)
 admin.site.register(QuestionAnswer, QuestionAnswerAdmin)
 
 admin.site.register(MonzoUser, MonzoUserAdmin)
+
+admin.site.register(MonzoAccount, MonzoAccountAdmin)
+
+admin.site.register(MonzoTransaction, MonzoTransactionAdmin)
+
+admin.site.register(Merchant, MerchantAdmin)
+
+admin.site.register(Job, JobAdmin)
+
+admin.site.register(SpendRollup, SpendRollupAdmin)
@@ -0,0 +1,178 @@
+# Spend aggregation for the analysis page.
+#
+# Monzo spends are joined to their ingested Transactions through a dict keyed
+# by id, so a window is summarised in a single pass over its spends: O(n) in
+# the number of transactions, and two queries whatever the window size.
+# Category names come from the cached category tree.
+#
+# AnalysisView summarises through whichever function ANALYSIS_BACKEND names.
+# Each takes an account id and a number of days, and returns the context
+# built by summary_context().
+#
+# Summaries are cached per process, each tagged with the AnalysisVersion it was
+# computed at. Anything that changes what the page shows bumps that version
+# (see signals.py), so all processes notice on their next read, and a page
+# costs one small query for as long as nothing changes. Only the most recently
+# used ANALYSIS_CACHE_SIZE windows are kept, since any number of days can be
+# asked for.
+from collections import Counter, OrderedDict
+from datetime import datetime, time, timedelta
+import threading
+from typing import Callable, Dict, Iterable, Tuple
+
+from django.conf import settings
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from . import category_tree
+from .models import AnalysisVersion, MonzoTransaction, Transaction
+
+_cache = OrderedDict()
+_stats = Counter()
+_lock = threading.Lock()
+
+
+def get_backend() -> Callable[[str, int], Dict]:
+    return import_string(settings.ANALYSIS_BACKEND)
+
+
+def cached(user_id: int, account_id: str, days: int, compute: Callable[[], Dict]) -> Dict:
+    # The window moves at midnight, so today is part of the tag too. Reading the
+    # version before computing means a change made meanwhile isn't missed.
+    key = (user_id, account_id, days)
+    tag = (data_version(), timezone.localdate())
+
+    with _lock:
+        entry = _cache.get(key)
+        if entry is not None and entry[0] == tag:
+            _cache.move_to_end(key)
+            _stats['hits'] += 1
+            return entry[1]
+        _stats['misses'] += 1
+
+    summary = compute()
+    with _lock:
+        _cache[key] = (tag, summary)
+        _cache.move_to_end(key)
+        while len(_cache) > settings.ANALYSIS_CACHE_SIZE:
+            _cache.popitem(last=False)
+    return summary
+
+
+def data_version() -> str:
+    return AnalysisVersion.current()
+
+
+def invalidate() -> None:
+    AnalysisVersion.bump()
+
+
+def cache_stats() -> Dict[str, int]:
+    with _lock:
+        return {'hits': _stats['hits'], 'misses': _stats['misses'], 'entries': len(_cache)}
+
+
+def clear_cache() -> None:
+    with _lock:
+        _cache.clear()
+        _stats.clear()
+
+
+def window_start(days: int):
+    # The window is the last `days` local dates, today included
+    return timezone.localdate() - timedelta(days=days - 1)
+
+
+def window(account_id: str, days: int):
+    # The account's spends in the window, for backends working from raw rows
+    start = timezone.make_aware(datetime.combine(window_start(days), time.min))
+    return MonzoTransaction.objects.spending().for_account(account_id).filter(created__gte=start)
+
+
+def summarise_window(account_id: str, days: int) -> Dict:
+    return summarise(*load(window(account_id, days)))
+
+
+def load(spending) -> Tuple[list, Dict[str, Tuple[str, str]]]:
+    # spending is a MonzoTransaction queryset. Returns its (id, amount) pairs,
+    # and the (category, top-level category) names of those that are ingested.
+    return list(spending.values_list('id', 'amount')), load_categories(spending)
+
+
+def load_categories(spending) -> Dict[str, Tuple[str, str]]:
+    # Names come from the cached category tree rather than a join
+    tree = category_tree.get()
+    categories = {}
+    for id, category_id in Transaction.objects.filter(
+            pk__in=spending.values('pk')).values_list('id', 'category_id'):
+        node = tree[category_id]
+        categories[id] = (node.name, tree[node.top_level_id].name)
+    return categories
+
+
+def summarise(spends: Iterable[Tuple[str, int]],
+              categories: Dict[str, Tuple[str, str]]) -> Dict:
+    spending_sum = 0
+    ingested_sum = 0
+    count = 0
+    count_ingested = 0
+    summary = Counter()
+    summary_all_cats = Counter()
+
+    for id, amount in spends:
+        count += 1
+        spending_sum += amount
+
+        names = categories.get(id)
+        if names is None:
+            continue
+        count_ingested += 1
+        ingested_sum += amount
+
+        category, top_level = names
+        # spend amounts are always negative
+        summary[top_level] -= amount
+        summary_all_cats[category] -= amount
+
+    return summary_context(count, count_ingested, abs(spending_sum), abs(ingested_sum),
+                           summary, summary_all_cats)
+
+
+def summarise_totals(totals: Iterable[Tuple[str, str, int, int]]) -> Dict:
+    # The same summary from pre-aggregated (category, top-level category,
+    # count, spend) rows, with no category for spends not yet ingested
+    count = 0
+    count_ingested = 0
+    spending_sum_pennies = 0
+    ingested_sum_pennies = 0
+    summary = Counter()
+    summary_all_cats = Counter()
+
+    for category, top_level, row_count, pennies in totals:
+        count += row_count
+        spending_sum_pennies += pennies
+        if category is None:
+            continue
+        count_ingested += row_count
+        ingested_sum_pennies += pennies
+        summary[top_level] += pennies
+        summary_all_cats[category] += pennies
+
+    return summary_context(count, count_ingested, spending_sum_pennies, ingested_sum_pennies,
+                           summary, summary_all_cats)
+
+
+def summary_context(count: int, count_ingested: int, spending_sum_pennies: int,
+                    ingested_sum_pennies: int, summary: Counter,
+                    summary_all_cats: Counter) -> Dict:
+    return {
+        'total_transactions_count': count,
+        'spending_sum_pennies': spending_sum_pennies,
+        'ingested_sum_pennies': ingested_sum_pennies,
+        'count_ingested': count_ingested,
+        'diff': spending_sum_pennies - ingested_sum_pennies,
+        'uningested_sum_pennies': spending_sum_pennies - ingested_sum_pennies,
+        'count_uningested': count - count_ingested,
+        'summary': summary,
+        'summary_all_cats': summary_all_cats,
+    }
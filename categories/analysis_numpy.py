@@ -0,0 +1,140 @@
+# Columnar spend analysis with NumPy, for long histories.
+#
+# A SpendFrame holds a window of spends as parallel arrays. Categories and
+# merchant codes are stored as integer codes into short label lists, so a
+# group-by is one bincount and rolling windows are differences of a cumulative
+# sum, with no Python loop over the spends once they're loaded.
+#
+# NumPy is optional. Without it this backend raises ImproperlyConfigured and
+# the others in analysis and rollups still work.
+from collections import Counter
+from typing import Dict, Iterable, List, Tuple
+
+from django.core.exceptions import ImproperlyConfigured
+from django.utils import timezone
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from . import analysis
+
+# Code for spends with no category, i.e. not yet ingested
+UNINGESTED = -1
+
+GROUPS = {
+    'category': ('categories', 'category_labels'),
+    'top_level': ('top_levels', 'category_labels'),
+    'mcc': ('mccs', 'mcc_labels'),
+}
+
+
+class SpendFrame:
+    def __init__(self, timestamps, days, amounts, categories, top_levels, mccs,
+                 category_labels: List[str], mcc_labels: List[str]):
+        self.timestamps = timestamps  # datetime64[s], UTC
+        self.days = days  # datetime64[D], local dates
+        self.amounts = amounts  # int64 pennies, positive
+        self.categories = categories  # int codes into category_labels, or UNINGESTED
+        self.top_levels = top_levels
+        self.mccs = mccs  # int codes into mcc_labels
+        self.category_labels = category_labels
+        self.mcc_labels = mcc_labels
+
+    def __len__(self):
+        return len(self.amounts)
+
+    @classmethod
+    def load(cls, spending) -> 'SpendFrame':
+        # spending is a MonzoTransaction queryset, joined in two queries as in
+        # analysis.load
+        rows = spending.values_list('id', 'created', 'amount', 'mcc')
+        return cls.from_rows(rows, analysis.load_categories(spending))
+
+    @classmethod
+    def from_rows(cls, rows: Iterable[Tuple],
+                  categories: Dict[str, Tuple[str, str]]) -> 'SpendFrame':
+        # rows are (id, created, amount, mcc), categories maps the ingested ids
+        # to their (category, top-level category) names
+        if np is None:
+            raise ImproperlyConfigured('The NumPy analysis backend needs numpy installed')
+
+        category_codes = {}
+        mcc_codes = {}
+        created_at, local_days, amounts, leaves, tops, mccs = [], [], [], [], [], []
+        for id, created, amount, mcc in rows:
+            created_at.append(timezone.make_naive(created, timezone.utc))
+            local_days.append(timezone.localdate(created))
+            # spend amounts are always negative
+            amounts.append(-amount)
+            mccs.append(mcc_codes.setdefault(mcc, len(mcc_codes)))
+
+            names = categories.get(id)
+            if names is None:
+                leaves.append(UNINGESTED)
+                tops.append(UNINGESTED)
+            else:
+                leaves.append(category_codes.setdefault(names[0], len(category_codes)))
+                tops.append(category_codes.setdefault(names[1], len(category_codes)))
+
+        return cls(np.array(created_at, dtype='datetime64[s]'),
+                   np.array(local_days, dtype='datetime64[D]'),
+                   np.array(amounts, dtype=np.int64),
+                   np.array(leaves, dtype=np.int32),
+                   np.array(tops, dtype=np.int32),
+                   np.array(mccs, dtype=np.int32),
+                   list(category_codes), list(mcc_codes))
+
+    def group_sum(self, by: str = 'top_level') -> Counter:
+        # Total spend per category, top-level category or mcc
+        codes, labels = (getattr(self, name) for name in GROUPS[by])
+        mask = codes != UNINGESTED
+        sums = np.bincount(codes[mask], weights=self.amounts[mask], minlength=len(labels))
+        counts = np.bincount(codes[mask], minlength=len(labels))
+        return Counter({labels[code]: int(sums[code]) for code in np.flatnonzero(counts)})
+
+    def summarise(self) -> Dict:
+        ingested = self.categories != UNINGESTED
+        spending_sum = int(self.amounts.sum())
+        ingested_sum = int(self.amounts[ingested].sum())
+        return analysis.summary_context(len(self), int(ingested.sum()), spending_sum,
+                                        ingested_sum, self.group_sum('top_level'),
+                                        self.group_sum('category'))
+
+    def daily_totals(self):
+        # (dates, totals) for every local date from the first spend to the last,
+        # including the days with none
+        return self.totals_by(self.days)
+
+    def totals_by(self, periods):
+        if not len(self):
+            return periods[:0], np.zeros(0, dtype=np.int64)
+        first = periods.min()
+        offsets = (periods - first).astype(np.int64)
+        totals = np.bincount(offsets, weights=self.amounts).astype(np.int64)
+        return first + np.arange(len(totals)), totals
+
+    def rolling(self, window: int = 7):
+        # (dates, totals) of the spend over the `window` days up to each date
+        dates, totals = self.daily_totals()
+        cumulative = np.concatenate([[0], np.cumsum(totals)])
+        ends = np.arange(1, len(totals) + 1)
+        return dates, cumulative[ends] - cumulative[np.maximum(ends - window, 0)]
+
+    def percentiles(self, q=(50, 90, 99)) -> Dict:
+        # Spend size percentiles in pennies
+        if not len(self):
+            return {}
+        return dict(zip(q, np.percentile(self.amounts, q).tolist()))
+
+    def month_over_month(self):
+        # (months, totals, deltas) for every local month from the first spend to
+        # the last, deltas being the change from the month before (0 for the first)
+        months, totals = self.totals_by(self.days.astype('datetime64[M]'))
+        deltas = np.diff(totals, prepend=totals[:1])
+        return months, totals, deltas
+
+
+def summarise_window(account_id: str, days: int) -> Dict:
+    return SpendFrame.load(analysis.window(account_id, days)).summarise()
@@ -3,3 +3,7 @@ from django.apps import AppConfig
 
 class CategoriesConfig(AppConfig):
     name = 'categories'
+
+    def ready(self):
+        # connect signal receivers
+        from . import signals
@@ -0,0 +1,92 @@
+# An in-process copy of the category hierarchy.
+#
+# Categories are few and rarely change, but nearly every page wants their
+# names and parents: form dropdowns, the tree view and analysis. get() returns
+# an immutable tree loaded in one query and shared by every thread, and
+# reloads it only once CategoryVersion has changed. Category saves and deletes
+# change it (see signals.py), so every process notices on its next read.
+from types import MappingProxyType
+from typing import Iterable, List, NamedTuple, Optional, Tuple
+
+from .models import Category, CategoryVersion
+
+
+class Node(NamedTuple):
+    id: int
+    name: str
+    parent_id: Optional[int]
+    hidden: bool
+    hierarchical_name: str
+    top_level_id: int
+
+
+class CategoryTree:
+    def __init__(self, version: str, rows: Iterable[Tuple[int, str, Optional[int], bool]]):
+        self.version = version
+        rows = sorted(rows)
+        parents = {id: parent_id for id, _, parent_id, _ in rows}
+        names = {id: name for id, name, _, _ in rows}
+
+        nodes = {}
+        children = {id: [] for id in parents}
+        for id, name, parent_id, hidden in rows:
+            hierarchical_name = f'{names[parent_id]} -> {name}' if parent_id else name
+            nodes[id] = Node(id, name, parent_id, hidden, hierarchical_name,
+                             top_level_of(id, parents))
+            if parent_id:
+                children[parent_id].append(id)
+
+        self.nodes = MappingProxyType(nodes)
+        self.children = MappingProxyType({id: tuple(ids) for id, ids in children.items()})
+        self.top_level = tuple(id for id, parent_id in parents.items() if not parent_id)
+
+    def __getitem__(self, id: int) -> Node:
+        return self.nodes[id]
+
+    def __contains__(self, id) -> bool:
+        return id in self.nodes
+
+    def visible(self) -> List[Node]:
+        return [node for node in self.nodes.values() if not node.hidden]
+
+    def subtree(self, id: int) -> List[int]:
+        # the category and everything below it
+        ids, seen = [id], {id}
+        for id in ids:
+            for child in self.children.get(id, ()):
+                if child not in seen:
+                    seen.add(child)
+                    ids.append(child)
+        return ids
+
+    def nested(self) -> dict:
+        # top-level nodes mapped to their children's nodes
+        return {self.nodes[id]: [self.nodes[child] for child in self.children[id]]
+                for id in self.top_level}
+
+
+def top_level_of(id: int, parents: dict) -> int:
+    seen = set()
+    while parents.get(id) and id not in seen:
+        seen.add(id)
+        id = parents[id]
+    return id
+
+
+_tree = None
+
+
+def get() -> CategoryTree:
+    global _tree
+    version = CategoryVersion.current()
+    tree = _tree
+    if tree is None or tree.version != version:
+        # concurrent rebuilds load the same rows, so either can win
+        tree = CategoryTree(version, Category.objects.values_list(
+            'id', 'name', 'parent_id', 'hidden'))
+        _tree = tree
+    return tree
+
+
+def invalidate() -> None:
+    CategoryVersion.bump()
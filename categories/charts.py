@@ -0,0 +1,73 @@
+# Server-side chart rendering.
+#
+# Charts are rendered to SVG from the analysis summaries and stored under the
+# sha256 of the data they show, so identical charts are only rendered once and
+# their urls never change meaning. That lets them be cached for good, by the
+# browser and anything in between.
+from collections import Counter
+import hashlib
+import json
+from math import cos, pi, sin
+
+from django.urls import reverse
+from django.utils.html import escape
+
+from .models import Chart
+
+PIE_SLICES = 10
+COLOURS = ['#4e79a7', '#f28e2b', '#e15759', '#76b7b2', '#59a14f',
+           '#edc948', '#b07aa1', '#ff9da7', '#9c755f', '#bab0ac']
+
+WIDTH = 480
+HEIGHT = 300
+RADIUS = 130
+CENTRE = (150, 150)
+
+
+def pie_chart_url(summary: Counter) -> str:
+    slices = [[label, value] for label, value in summary.most_common(PIE_SLICES) if value > 0]
+    digest = hashlib.sha256(json.dumps(['pie', slices]).encode()).hexdigest()
+
+    if not Chart.objects.filter(pk=digest).exists():
+        # concurrent renders of one chart are identical, so either can win
+        Chart.objects.get_or_create(pk=digest, defaults={'svg': render_pie(slices)})
+    return reverse('chart', args=[digest])
+
+
+def render_pie(slices) -> str:
+    parts = [f'<svg xmlns="http://www.w3.org/2000/svg" width="{WIDTH}" height="{HEIGHT}" '
+             f'viewBox="0 0 {WIDTH} {HEIGHT}" font-family="sans-serif" font-size="12">']
+
+    total = sum(value for _, value in slices)
+    if not total:
+        parts.append(f'<text x="{CENTRE[0]}" y="{CENTRE[1]}" text-anchor="middle">No data</text>')
+    elif len(slices) == 1:
+        # an arc can't go all the way round
+        parts.append(f'<circle cx="{CENTRE[0]}" cy="{CENTRE[1]}" r="{RADIUS}" '
+                     f'fill="{COLOURS[0]}"/>')
+    else:
+        angle = 0
+        for i, (_, value) in enumerate(slices):
+            sweep = 2 * pi * value / total
+            parts.append(slice_path(angle, angle + sweep, COLOURS[i]))
+            angle += sweep
+
+    # legend, largest first
+    for i, (label, value) in enumerate(slices):
+        y = 20 + i * 22
+        parts.append(f'<rect x="310" y="{y}" width="12" height="12" fill="{COLOURS[i]}"/>')
+        parts.append(f'<text x="328" y="{y + 10}">{escape(label)} '
+                     f'(£{value / 100:.2f})</text>')
+
+    parts.append('</svg>')
+    return ''.join(parts)
+
+
+def slice_path(start: float, end: float, colour: str) -> str:
+    # Angles are clockwise from 12 o'clock
+    cx, cy = CENTRE
+    x1, y1 = cx + RADIUS * sin(start), cy - RADIUS * cos(start)
+    x2, y2 = cx + RADIUS * sin(end), cy - RADIUS * cos(end)
+    large_arc = 1 if end - start > pi else 0
+    return (f'<path d="M{cx},{cy} L{x1:.2f},{y1:.2f} '
+            f'A{RADIUS},{RADIUS} 0 {large_arc} 1 {x2:.2f},{y2:.2f} Z" fill="{colour}"/>')
@@ -0,0 +1,225 @@
+# An offline stand-in for the parts of the Monzo API this app uses.
+#
+# FakeMonzo answers /ping/whoami, /oauth2/token, /accounts, /transactions
+# and /transactions/<id> from a generated or recorded dataset, with optional
+# latency and error injection. It can be plugged into the shared requests
+# session with FakeMonzoAdapter (see MONZO_FAKE_API in settings), or served
+# over HTTP with `./manage.py fake_monzo serve`.
+from bisect import bisect_left, bisect_right
+from datetime import timedelta
+from http import HTTPStatus
+import json
+import random
+import threading
+import time
+from typing import Dict, List, Tuple
+from urllib.parse import parse_qsl, urlsplit
+from uuid import UUID
+
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from requests import Response
+from requests.adapters import BaseAdapter
+from requests.structures import CaseInsensitiveDict
+
+USER_ID = 'user_fake'
+ACCOUNT_ID = 'acc_fake'
+MAX_PAGE_LIMIT = 100
+
+MERCHANT_CATEGORIES = ['groceries', 'eating_out', 'transport', 'shopping',
+                       'entertainment', 'bills', 'personal_care', 'holidays']
+MCCS = ['5411', '5812', '5814', '4111', '5311', '7832', '4900', '5977', '6011']
+
+
+def _id(prefix: str, rng: random.Random) -> str:
+    return prefix + UUID(int=rng.getrandbits(128)).hex[:22]
+
+
+def _timestamp(dt) -> str:
+    return dt.strftime('%Y-%m-%dT%H:%M:%S.') + f'{dt.microsecond // 1000:03}Z'
+
+
+def generate_transactions(count: int = 1000, days: int = 90,
+                          rng: random.Random = None) -> List[Dict]:
+    # Spends spread evenly over the last `days`, from a pool of repeat merchants
+    rng = rng or random.Random()
+    now = timezone.now()
+
+    merchants = []
+    for i in range(max(count // 20, 1)):
+        merchant_id = _id('merch_', rng)
+        merchants.append({
+            'id': merchant_id,
+            'name': f'Merchant {i}',
+            'category': rng.choice(MERCHANT_CATEGORIES),
+            'logo': f'https://example.com/{merchant_id}.png',
+            'emoji': '',
+            'address': {'formatted': f'{i} High Street, London'},
+        })
+
+    transactions = []
+    step = timedelta(days=days) / max(count, 1)
+    for i in range(count):
+        created = now - step * (count - i)
+        top_up = rng.random() < 0.05
+        amount = rng.randint(100, 50000) if top_up else -rng.randint(50, 20000)
+        merchant = None if top_up else rng.choice(merchants)
+        transactions.append({
+            'id': _id('tx_', rng),
+            'account_id': ACCOUNT_ID,
+            'created': _timestamp(created),
+            'description': merchant['name'].upper() if merchant else 'TOP UP',
+            'amount': amount,
+            'currency': 'GBP',
+            'local_amount': amount,
+            'local_currency': 'GBP',
+            'category': merchant['category'] if merchant else 'general',
+            'is_load': top_up,
+            'include_in_spending': not top_up,
+            'metadata': {} if top_up else {'mcc': rng.choice(MCCS)},
+            'merchant': merchant,
+            # the last couple of days are still pending
+            'settled': '' if now - created < timedelta(days=2) else _timestamp(created),
+        })
+
+    return transactions
+
+
+def record(monzo, days: int, path: str) -> int:
+    # Save `days` of expanded transactions from the real API for replaying
+    transactions = list(monzo.iter_transactions(
+        timezone.now() - timedelta(days=days), expand_merchant=True, memo=False))
+    with open(path, 'w') as f:
+        json.dump({'transactions': transactions}, f, indent=2)
+    return len(transactions)
+
+
+class FakeMonzo:
+    def __init__(self, transactions: List[Dict] = None, count: int = 1000, days: int = 90,
+                 latency_ms: float = 0, error_rate: float = 0, seed: int = None):
+        self.random = random.Random(seed)
+        if transactions is None:
+            transactions = generate_transactions(count, days, self.random)
+
+        self.transactions = sorted(transactions, key=lambda t: parse_datetime(t['created']))
+        self.created = [parse_datetime(t['created']) for t in self.transactions]
+        self.index = {t['id']: i for i, t in enumerate(self.transactions)}
+        self.latency = latency_ms / 1000
+        self.error_rate = error_rate
+        self.request_count = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_recording(cls, path: str, **kwargs) -> 'FakeMonzo':
+        with open(path) as f:
+            return cls(transactions=json.load(f)['transactions'], **kwargs)
+
+    def handle(self, method: str, path: str, params: Dict, data: Dict) -> Tuple[int, Dict]:
+        with self._lock:
+            self.request_count += 1
+            fail = self.random.random() < self.error_rate
+
+        if self.latency:
+            time.sleep(self.latency)
+        if fail:
+            return 503, {'code': 'internal_service', 'message': 'injected failure'}
+
+        if method == 'GET' and path == '/ping/whoami':
+            return 200, {'authenticated': True, 'client_id': 'oauth2client_fake',
+                         'user_id': USER_ID}
+        if method == 'POST' and path == '/oauth2/token':
+            return self.token()
+        if method == 'GET' and path == '/accounts':
+            return 200, {'accounts': [{'id': ACCOUNT_ID, 'description': 'Fake account',
+                                       'closed': False}]}
+        if method == 'GET' and path == '/transactions':
+            return self.list_transactions(params)
+        if method == 'GET' and path.startswith('/transactions/'):
+            return self.get_transaction(path.rsplit('/', 1)[1], params)
+        return 404, {'code': 'not_found'}
+
+    def token(self) -> Tuple[int, Dict]:
+        return 200, {
+            'access_token': _id('access_', self.random),
+            'refresh_token': _id('refresh_', self.random),
+            'expires_in': 21600,
+            'token_type': 'Bearer',
+            'user_id': USER_ID,
+        }
+
+    def list_transactions(self, params: Dict) -> Tuple[int, Dict]:
+        start = 0
+        since = params.get('since')
+        if since in self.index:
+            start = self.index[since] + 1
+        elif since:
+            start = bisect_left(self.created, parse_datetime(since))
+
+        end = len(self.transactions)
+        if params.get('before'):
+            end = bisect_right(self.created, parse_datetime(params['before']))
+
+        limit = min(int(params.get('limit', MAX_PAGE_LIMIT)), MAX_PAGE_LIMIT)
+        page = self.transactions[start:min(end, start + limit)]
+        return 200, {'transactions': [self.render(t, params) for t in page]}
+
+    def get_transaction(self, id: str, params: Dict) -> Tuple[int, Dict]:
+        if id not in self.index:
+            return 404, {'code': 'not_found'}
+        transaction = self.transactions[self.index[id]]
+        return 200, {'transaction': self.render(transaction, params)}
+
+    def render(self, transaction: Dict, params: Dict) -> Dict:
+        # Answer as whichever account was asked about, so the dataset
+        # lines up with the MonzoUser stored locally
+        rendered = {**transaction, 'account_id': params.get('account_id', ACCOUNT_ID)}
+        merchant = transaction['merchant']
+        if isinstance(merchant, dict) and params.get('expand[]') != 'merchant':
+            rendered['merchant'] = merchant['id']
+        return rendered
+
+
+class FakeMonzoAdapter(BaseAdapter):
+    # A requests transport that answers from a FakeMonzo instead of the network
+    def __init__(self, fake: FakeMonzo):
+        super().__init__()
+        self.fake = fake
+
+    def send(self, request, **kwargs):
+        url = urlsplit(request.url)
+        params = dict(parse_qsl(url.query))
+        body = request.body or ''
+        if isinstance(body, bytes):
+            body = body.decode()
+        data = dict(parse_qsl(body))
+
+        status, content = self.fake.handle(request.method, url.path, params, data)
+
+        response = Response()
+        response.status_code = status
+        response._content = json.dumps(content).encode()
+        response.headers = CaseInsensitiveDict({'Content-Type': 'application/json'})
+        response.encoding = 'utf-8'
+        response.url = request.url
+        response.request = request
+        return response
+
+    def close(self):
+        pass
+
+
+def wsgi_app(fake: FakeMonzo):
+    def app(environ, start_response):
+        params = dict(parse_qsl(environ.get('QUERY_STRING', '')))
+        length = int(environ.get('CONTENT_LENGTH') or 0)
+        data = dict(parse_qsl(environ['wsgi.input'].read(length).decode()))
+
+        status, content = fake.handle(environ['REQUEST_METHOD'], environ['PATH_INFO'],
+                                      params, data)
+        body = json.dumps(content).encode()
+        start_response(f'{status} {HTTPStatus(status).phrase}', [('Content-Type', 'application/json'),
+                                          ('Content-Length', str(len(body)))])
+        return [body]
+
+    return app
@@ -0,0 +1,56 @@
+# Spend feeds for the transaction list views.
+#
+# A feed is a list of stages run in order, each taking the spends so far and
+# the window being shown and returning the next spends. The first stage
+# fetches, and the last usually joins, so filters and ordering in between
+# narrow the queryset and run in SQL. The join attaches each spend's local
+# Transaction through a dict keyed by id: two queries and one pass, however
+# many spends there are.
+from typing import Callable, List, NamedTuple
+
+from .models import MonzoTransaction, Transaction
+
+
+class Window(NamedTuple):
+    account_id: str
+    days: int
+
+
+Stage = Callable[[object, Window], object]
+
+
+def run(stages: List[Stage], window: Window):
+    spends = None
+    for stage in stages:
+        spends = stage(spends, window)
+    return spends
+
+
+### Stages ###
+
+def spending(spends, window: Window):
+    return MonzoTransaction.objects.spending().for_account(
+        window.account_id).last_days(window.days)
+
+
+def only_mcc(*mccs: str) -> Stage:
+    def stage(spends, window: Window):
+        return spends.filter(mcc__in=mccs)
+    return stage
+
+
+# mastercard mcc 6011 is "automated cash disbursements"
+cash_withdrawals = only_mcc('6011')
+
+
+def latest_first(spends, window: Window):
+    return spends.order_by('-created', '-id')
+
+
+def join_transactions(spends, window: Window) -> list:
+    # Sets .transaction on each spend, None if it isn't ingested yet
+    transactions = {t.id: t for t in Transaction.objects.filter(pk__in=spends.values('pk'))}
+    spends = list(spends)
+    for spend in spends:
+        spend.transaction = transactions.get(spend.id)
+    return spends
@@ -3,11 +3,40 @@ import logging
 from django import forms
 from django.core.exceptions import ValidationError
 
+from . import category_tree
 from .models import *
 
 logger = logging.getLogger(__name__)
 
 
+def use_category_tree(field):
+    # Options come from the cached category tree, so rendering them needs no
+    # queries. The queryset is still what validates a submitted choice.
+    choices = [(node.id, node.hierarchical_name) for node in category_tree.get().visible()]
+    if getattr(field, 'empty_label', None) is not None:
+        choices.insert(0, ('', field.empty_label))
+    field.queryset = Category.objects.filter(hidden=False)
+    field.choices = choices
+
+
+class SelectedChoice:
+    # Select choices of just the blank one and whichever the form already
+    # holds, looked up only if the field is rendered. The page fetches the
+    # rest for the chosen category or question (see ingest_form.html).
+    def __init__(self, bound_field):
+        self.bound_field = bound_field
+
+    def __iter__(self):
+        field = self.bound_field.field
+        yield ('', field.empty_label)
+        try:
+            selected = field.to_python(self.bound_field.value())
+        except ValidationError:
+            return
+        if selected is not None:
+            yield (selected.pk, field.label_from_instance(selected))
+
+
 class CategoryForm(forms.ModelForm):
     class Meta:
         model = Category
@@ -15,8 +44,7 @@ class CategoryForm(forms.ModelForm):
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        self.fields['parent'].queryset = Category.objects.filter(hidden=False)
-        self.fields['parent'].label_from_instance = lambda obj: obj.get_hierarchical_name()
+        use_category_tree(self.fields['parent'])
 
     def clean(self):
         cleaned_data = super().clean()
@@ -39,9 +67,7 @@ class QuestionForm(forms.ModelForm):
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        self.fields['categories'].queryset = Category.objects.filter(
-            hidden=False)
-        self.fields['categories'].label_from_instance = lambda obj: obj.get_hierarchical_name()
+        use_category_tree(self.fields['categories'])
 
     def clean(self):
         logger.error('in clean')
@@ -75,9 +101,7 @@ class TransactionForm(forms.ModelForm):
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        self.fields['category'].queryset = Category.objects.filter(
-            hidden=False)
-        self.fields['category'].label_from_instance = lambda obj: obj.get_hierarchical_name()
+        use_category_tree(self.fields['category'])
 
 
 class CashTransactionForm(TransactionForm):
@@ -98,6 +122,18 @@ class QuestionAnswerForm(forms.ModelForm):
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        self.fields['question'].queryset = Question.objects.all()
         self.fields['question'].required = False
-        self.fields['option_answer'].queryset = Option.objects.all()
+        # a submitted id is checked with a single get(), so the full lists
+        # are never loaded
+        for name in ['question', 'option_answer']:
+            self.fields[name].widget.choices = SelectedChoice(self[name])
+
+    def clean(self):
+        cleaned_data = super().clean()
+
+        question = cleaned_data.get('question')
+        option_answer = cleaned_data.get('option_answer')
+        if option_answer and option_answer.question_id != getattr(question, 'pk', None):
+            raise ValidationError('Option is not an answer to the selected question')
+
+        return cleaned_data
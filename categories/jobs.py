@@ -0,0 +1,184 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+import traceback
+
+from django.conf import settings
+from django.db import IntegrityError, connection, connections, transaction
+from django.utils import timezone
+
+from . import analysis, rollups
+from .models import Job, MonzoAccount, MonzoUser
+from .monzo_integration import EXPIRY_MARGIN, MonzoAuth, MonzoRequest
+from .monzo_sync import is_stale, sync_transactions
+
+RETRY_BACKOFF = timedelta(seconds=30)
+
+
+def enqueue(kind: str, target: str = '', run_after=None) -> Job:
+    # Enqueuing a job that is already pending returns the pending job,
+    # brought forward if it was due later than this request asks for
+    key = f'{kind}:{target}' if target else kind
+    run_after = run_after or timezone.now()
+    try:
+        with transaction.atomic():
+            return Job.objects.create(kind=kind, key=key, target=target, run_after=run_after)
+    except IntegrityError:
+        Job.objects.filter(key=key, status=Job.PENDING,
+                           run_after__gt=run_after).update(run_after=run_after)
+        return Job.objects.get(key=key, status=Job.PENDING)
+
+
+def enqueue_sync_if_stale(account) -> None:
+    # Web requests ask for a sync rather than doing the Monzo I/O themselves.
+    # The account may be a cached copy, so its last sync is read fresh.
+    account.refresh_from_db(fields=['last_synced'])
+    if is_stale(account):
+        enqueue('sync_transactions', account.pk)
+
+
+def claim() -> Job:
+    # Postgres lets concurrent workers skip each other's claimed rows.
+    # SQLite serialises writers, so a plain transaction is enough there.
+    with transaction.atomic():
+        due = Job.objects.filter(status=Job.PENDING, run_after__lte=timezone.now())
+        if connection.features.has_select_for_update_skip_locked:
+            due = due.select_for_update(skip_locked=True)
+        job = due.order_by('run_after').first()
+        if job is None:
+            return None
+
+        job.status = Job.RUNNING
+        job.attempts += 1
+        job.started = timezone.now()
+        job.finished = None
+        job.save()
+        return job
+
+
+def run(job: Job) -> None:
+    try:
+        HANDLERS[job.kind](job.target)
+    except Exception:
+        retry_or_fail(job, traceback.format_exc())
+    else:
+        job.status = Job.SUCCEEDED
+        job.last_error = ''
+    finish(job)
+
+
+def retry_or_fail(job: Job, error: str) -> None:
+    job.last_error = error
+    if job.attempts < job.max_attempts:
+        # back off exponentially before the next attempt
+        job.status = Job.PENDING
+        job.run_after = timezone.now() + RETRY_BACKOFF * 2 ** (job.attempts - 1)
+    else:
+        job.status = Job.FAILED
+
+
+def finish(job: Job) -> None:
+    job.finished = timezone.now()
+    try:
+        with transaction.atomic():
+            job.save()
+    except IntegrityError:
+        # a fresh pending job with this key was enqueued while this one ran
+        job.status = Job.FAILED
+        job.save()
+
+    if job.status != Job.PENDING:
+        schedule_next(job.kind, job.target)
+
+
+def reclaim_stalled() -> int:
+    # A job whose worker crashed or was killed is left running. Once it has
+    # run for longer than any job should, that counts as a failed attempt.
+    cutoff = timezone.now() - timedelta(seconds=settings.WORKER_JOB_TIMEOUT_SECONDS)
+    with transaction.atomic():
+        stalled = Job.objects.filter(status=Job.RUNNING, started__lt=cutoff)
+        if connection.features.has_select_for_update_skip_locked:
+            stalled = stalled.select_for_update(skip_locked=True)
+        stalled = list(stalled)
+        for job in stalled:
+            retry_or_fail(job, 'The worker stopped while running this job')
+            finish(job)
+    return len(stalled)
+
+
+def prune_finished() -> int:
+    # Successful runs are only kept for a while, failures until removed
+    cutoff = timezone.now() - timedelta(days=settings.WORKER_KEEP_SUCCEEDED_DAYS)
+    deleted, _ = Job.objects.filter(status=Job.SUCCEEDED, finished__lt=cutoff).delete()
+    return deleted
+
+
+def run_pending() -> int:
+    ran = 0
+    while True:
+        job = claim()
+        if job is None:
+            return ran
+        run(job)
+        ran += 1
+
+
+def run_pending_concurrently(threads: int) -> int:
+    # Each thread claims its own jobs, so one slow account doesn't hold up
+    # the others
+    def work(_):
+        try:
+            return run_pending()
+        finally:
+            connections.close_all()
+
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        return sum(executor.map(work, range(threads)))
+
+
+def schedule_next(kind: str, target: str = '') -> None:
+    interval = settings.WORKER_SCHEDULE_SECONDS.get(kind)
+    if interval:
+        enqueue(kind, target, run_after=timezone.now() + timedelta(seconds=interval))
+
+
+def schedule_all() -> None:
+    for kind in settings.WORKER_SCHEDULE_SECONDS:
+        targets = SCHEDULE_TARGETS.get(kind)
+        for target in targets() if targets else ['']:
+            enqueue(kind, target)
+
+
+### Handlers ###
+
+def sync_transactions_job(account_id: str) -> None:
+    account = MonzoAccount.objects.select_related('monzo_user').get(pk=account_id)
+    sync_transactions(MonzoRequest(account))
+
+
+def refresh_token_job(monzo_user_id: str) -> None:
+    # Refresh ahead of expiry so web requests never have to
+    auth = MonzoAuth(MonzoUser.objects.get(pk=monzo_user_id))
+    expires = auth.access_token_expires
+    refresh_before = timezone.now() + timedelta(
+        seconds=settings.WORKER_SCHEDULE_SECONDS['refresh_token']) + EXPIRY_MARGIN
+    if expires is None or expires < refresh_before:
+        auth.use_refresh_token()
+
+
+def rebuild_rollups_job(target: str) -> None:
+    rollups.refresh()
+    analysis.invalidate()
+
+
+HANDLERS = {
+    'sync_transactions': sync_transactions_job,
+    'refresh_token': refresh_token_job,
+    'rebuild_rollups': rebuild_rollups_job,
+}
+
+# What each scheduled kind runs for: every open account, every login
+SCHEDULE_TARGETS = {
+    'sync_transactions': lambda: MonzoAccount.objects.filter(
+        closed=False).values_list('pk', flat=True),
+    'refresh_token': lambda: MonzoUser.objects.values_list('pk', flat=True),
+}
@@ -0,0 +1,135 @@
+import random
+import timeit
+from collections import Counter
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from categories import analysis, analysis_numpy, feeds
+from categories.models import Category, MonzoTransaction, Transaction
+
+# The nested scan is quadratic, so it's only timed up to this many spends
+NESTED_MAX_SIZE = 10000
+
+
+def synthetic_spends(size: int, rng: random.Random):
+    # Half of the spends ingested, across 10 top-level and 50 leaf categories
+    spends = [(f'tx_{i:08}', -rng.randint(50, 20000)) for i in range(size)]
+    categories = {}
+    for id, _ in spends[::2]:
+        leaf = rng.randrange(50)
+        categories[id] = (f'category {leaf}', f'top level {leaf % 10}')
+    return spends, categories
+
+
+def nested_summarise(spends, categories):
+    # The join AnalysisView used to do, for comparison
+    ingested = [{'id': id, 'amount': amount} for id, amount in spends if id in categories]
+    summary = Counter()
+    for id, (category, top_level) in categories.items():
+        monzo_transaction = [t for t in ingested if t['id'] == id][0]
+        summary[top_level] -= monzo_transaction['amount']
+    return summary
+
+
+def synthetic_frame(spends, categories, rng: random.Random):
+    # The same spends as columns, spread over the last two years
+    now = timezone.now()
+    rows = [(id, now - timedelta(minutes=rng.randrange(2 * 365 * 24 * 60)), amount,
+             str(rng.choice([5411, 5812, 4111, 6011])))
+            for id, amount in spends]
+    return analysis_numpy.SpendFrame.from_rows(rows, categories)
+
+
+def write_synthetic_feed(size: int, rng: random.Random) -> feeds.Window:
+    # A week of spends on an account of their own, half of them ingested
+    account_id = 'acc_benchmark'
+    now = timezone.now()
+    spends = [
+        MonzoTransaction(id=f'tx_benchmark_{i:08}', account_id=account_id,
+                         created=now - timedelta(minutes=rng.randrange(7 * 24 * 60)),
+                         amount=-rng.randint(50, 20000), local_amount=0,
+                         mcc=rng.choice(['5411', '5812', '6011']), include_in_spending=True)
+        for i in range(size)
+    ]
+    MonzoTransaction.objects.bulk_create(spends)
+
+    category = Category.objects.create(name='benchmark')
+    Transaction.objects.bulk_create([
+        Transaction(id=spend.id, category=category, monzo_created=spend.created)
+        for spend in spends[::2]
+    ])
+    return feeds.Window(account_id, 7)
+
+
+def nested_join(spending):
+    # The join the transaction list views used to do, for comparison
+    spending = list(spending)
+    transactions = list(Transaction.objects.filter(pk__in=[t.id for t in spending]))
+    for spend in spending:
+        spend.transaction = None
+        for ingested in transactions:
+            if ingested.id == spend.id:
+                spend.transaction = ingested
+    return spending[::-1]
+
+
+class Command(BaseCommand):
+    help = 'Time the analysis aggregation at increasing numbers of transactions'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000])
+        parser.add_argument('--repeat', type=int, default=3,
+                            help='runs per size, the fastest is reported')
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--feed', action='store_true',
+                            help='time the transaction list feed instead, against spends '
+                                 'written to the database and rolled back afterwards')
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        if options['feed']:
+            return self.benchmark_feed(rng, options)
+
+        self.stdout.write(f"{'spends':>10} {'seconds':>10} {'µs/spend':>10} "
+                          f"{'nested':>10} {'numpy':>10}")
+
+        for size in options['sizes']:
+            spends, categories = synthetic_spends(size, rng)
+            seconds = self.time(lambda: analysis.summarise(spends, categories), options)
+
+            nested = '-'
+            if size <= NESTED_MAX_SIZE:
+                nested = f'{self.time(lambda: nested_summarise(spends, categories), options):.4f}'
+
+            # the frame is built outside the timing, as loading dominates both
+            vectorised = '-'
+            if analysis_numpy.np is not None:
+                frame = synthetic_frame(spends, categories, rng)
+                vectorised = f'{self.time(frame.summarise, options):.4f}'
+
+            self.stdout.write(f'{size:>10} {seconds:>10.4f} '
+                              f'{seconds / size * 1e6:>10.3f} {nested:>10} {vectorised:>10}')
+
+    def benchmark_feed(self, rng, options):
+        stages = [feeds.spending, feeds.latest_first, feeds.join_transactions]
+        self.stdout.write(f"{'spends':>10} {'seconds':>10} {'µs/spend':>10} {'nested':>10}")
+
+        for size in options['sizes']:
+            with transaction.atomic():
+                window = write_synthetic_feed(size, rng)
+                seconds = self.time(lambda: feeds.run(stages, window), options)
+
+                nested = '-'
+                if size <= NESTED_MAX_SIZE:
+                    spending = feeds.spending(None, window)
+                    nested = f'{self.time(lambda: nested_join(spending), options):.4f}'
+                transaction.set_rollback(True)
+
+            self.stdout.write(f'{size:>10} {seconds:>10.4f} '
+                              f'{seconds / size * 1e6:>10.3f} {nested:>10}')
+
+    def time(self, fn, options) -> float:
+        return min(timeit.repeat(fn, number=1, repeat=options['repeat']))
@@ -0,0 +1,59 @@
+from socketserver import ThreadingMixIn
+from wsgiref.simple_server import WSGIServer, make_server
+
+from django.core.management.base import BaseCommand, CommandError
+
+from categories.fake_monzo import FakeMonzo, record, wsgi_app
+from categories.models import MonzoAccount
+from categories.monzo_integration import get_account_client
+
+
+class ThreadingWSGIServer(ThreadingMixIn, WSGIServer):
+    daemon_threads = True
+
+
+class Command(BaseCommand):
+    help = 'Serve an offline fake of the Monzo API, or record real transactions for it to replay'
+
+    def add_arguments(self, parser):
+        parser.add_argument('action', choices=['serve', 'record'])
+        parser.add_argument('--port', type=int, default=8001)
+        parser.add_argument('--transactions', type=int, default=1000,
+                            help='number of transactions to generate')
+        parser.add_argument('--days', type=int, default=90,
+                            help='days the transactions are spread over, or to record')
+        parser.add_argument('--latency-ms', type=float, default=0)
+        parser.add_argument('--error-rate', type=float, default=0,
+                            help='fraction of requests answered with a 503')
+        parser.add_argument('--seed', type=int)
+        parser.add_argument('--replay', help='recording to serve instead of generated data')
+        parser.add_argument('--output', help='file to record to')
+        parser.add_argument('--account', help='account to record, needed if more than one is linked')
+
+    def handle(self, *args, **options):
+        if options['action'] == 'record':
+            if not options['output']:
+                raise CommandError('--output is required to record')
+            try:
+                monzo = get_account_client(options['account'])
+            except (MonzoAccount.DoesNotExist, MonzoAccount.MultipleObjectsReturned):
+                raise CommandError('pass --account with the id of a linked account')
+            count = record(monzo, options['days'], options['output'])
+            self.stdout.write(f"Recorded {count} transactions to {options['output']}")
+            return
+
+        fake_options = {
+            'latency_ms': options['latency_ms'],
+            'error_rate': options['error_rate'],
+            'seed': options['seed'],
+        }
+        if options['replay']:
+            fake = FakeMonzo.from_recording(options['replay'], **fake_options)
+        else:
+            fake = FakeMonzo(count=options['transactions'], days=options['days'], **fake_options)
+
+        server = make_server('', options['port'], wsgi_app(fake),
+                             server_class=ThreadingWSGIServer)
+        self.stdout.write(f"Serving {len(fake.transactions)} fake transactions on port "
+                          f"{options['port']}, use MONZO_API_ROOT=http://localhost:{options['port']}")
+        server.serve_forever()
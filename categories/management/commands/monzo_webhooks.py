@@ -0,0 +1,36 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.urls import reverse
+
+from categories.models import MonzoAccount
+from categories.monzo_integration import get_account_client
+
+
+class Command(BaseCommand):
+    help = 'List or register the Monzo webhooks for a linked account'
+
+    def add_arguments(self, parser):
+        parser.add_argument('action', choices=['list', 'register'])
+        parser.add_argument('base_url', nargs='?',
+                            help='required to register, e.g. https://django-categories.herokuapp.com')
+        parser.add_argument('--account', help='account id, needed if more than one is linked')
+
+    def handle(self, *args, **options):
+        try:
+            monzo = get_account_client(options['account'])
+        except (MonzoAccount.DoesNotExist, MonzoAccount.MultipleObjectsReturned):
+            raise CommandError('pass --account with the id of a linked account')
+
+        if options['action'] == 'register':
+            if not options['base_url']:
+                raise CommandError('base_url is required to register a webhook')
+            if not settings.MONZO_WEBHOOK_SECRET:
+                raise CommandError('MONZO_WEBHOOK_SECRET is not set')
+            path = reverse('monzo_webhook', args=[settings.MONZO_WEBHOOK_SECRET])
+            url = options['base_url'].rstrip('/') + path
+            webhook = monzo.register_webhook(url)
+            self.stdout.write(f"Registered {webhook['id']}: {webhook['url']}")
+            return
+
+        for webhook in monzo.list_webhooks():
+            self.stdout.write(f"{webhook['id']}: {webhook['url']}")
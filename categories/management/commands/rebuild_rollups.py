@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from categories import analysis, rollups
+
+
+class Command(BaseCommand):
+    help = 'Recompute the daily spend rollups from the mirrored and ingested transactions'
+
+    def handle(self, *args, **options):
+        count = rollups.refresh()
+        analysis.invalidate()
+        self.stdout.write(f'Wrote {count} rollup rows')
@@ -0,0 +1,32 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from categories import jobs
+
+
+class Command(BaseCommand):
+    help = 'Run queued background jobs, such as Monzo syncs and token refreshes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true',
+                            help='run whatever is due, then exit')
+        parser.add_argument('--threads', type=int, default=settings.WORKER_THREADS,
+                            help='jobs to run at once, e.g. syncs of different accounts')
+
+    def handle(self, *args, **options):
+        jobs.schedule_all()
+
+        while True:
+            jobs.reclaim_stalled()
+            jobs.prune_finished()
+            if options['threads'] > 1:
+                ran = jobs.run_pending_concurrently(options['threads'])
+            else:
+                ran = jobs.run_pending()
+            if ran:
+                self.stdout.write(f'Ran {ran} job(s)')
+            if options['once']:
+                return
+            time.sleep(settings.WORKER_POLL_SECONDS)
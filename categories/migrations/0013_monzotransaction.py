@@ -0,0 +1,48 @@
+# Generated by Django 2.2.28 on 2026-10-18 07:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('categories', '0012_cashtransaction_squashed_0013_auto_20190403_0840'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MonzoTransaction',
+            fields=[
+                ('id', models.CharField(max_length=32, primary_key=True, serialize=False)),
+                ('account_id', models.CharField(max_length=40)),
+                ('created', models.DateTimeField(db_index=True)),
+                ('description', models.CharField(blank=True, max_length=200)),
+                ('amount', models.IntegerField()),
+                ('currency', models.CharField(max_length=3)),
+                ('local_amount', models.IntegerField()),
+                ('local_currency', models.CharField(max_length=3)),
+                ('mcc', models.CharField(blank=True, max_length=4)),
+                ('merchant', models.CharField(blank=True, max_length=40)),
+                ('include_in_spending', models.BooleanField(default=False)),
+                ('settled', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'verbose_name_plural': 'MonzoTransactions',
+                'ordering': ['created'],
+            },
+        ),
+        migrations.AddField(
+            model_name='monzouser',
+            name='last_synced',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='monzouser',
+            name='sync_cursor',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='monzotransaction',
+            index=models.Index(fields=['account_id', 'created'], name='categories__account_9df15a_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 2.2.28 on 2026-10-18 07:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('categories', '0013_monzotransaction'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='monzouser',
+            name='access_token_expires',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
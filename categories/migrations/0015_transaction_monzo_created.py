@@ -0,0 +1,30 @@
+# Generated by Django 2.2.28 on 2026-10-18 07:47
+
+from django.db import migrations, models
+
+
+def backfill_monzo_created(apps, schema_editor):
+    Transaction = apps.get_model('categories', 'Transaction')
+    MonzoTransaction = apps.get_model('categories', 'MonzoTransaction')
+
+    created = dict(MonzoTransaction.objects.values_list('id', 'created'))
+    transactions = list(Transaction.objects.filter(pk__in=list(created)))
+    for transaction in transactions:
+        transaction.monzo_created = created[transaction.id]
+    Transaction.objects.bulk_update(transactions, ['monzo_created'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('categories', '0014_monzouser_access_token_expires'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='transaction',
+            name='monzo_created',
+            field=models.DateTimeField(blank=True, db_index=True, null=True),
+        ),
+        migrations.RunPython(backfill_monzo_created, migrations.RunPython.noop),
+    ]
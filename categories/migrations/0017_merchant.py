@@ -0,0 +1,51 @@
+# Generated by Django 2.2.28 on 2026-10-18 07:49
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def create_placeholder_merchants(apps, schema_editor):
+    # Give every merchant id already in the mirror a row to point at. The
+    # details are filled in the next time the merchant is synced.
+    MonzoTransaction = apps.get_model('categories', 'MonzoTransaction')
+    Merchant = apps.get_model('categories', 'Merchant')
+
+    MonzoTransaction.objects.filter(merchant='').update(merchant=None)
+    merchant_ids = MonzoTransaction.objects.exclude(merchant=None).values_list(
+        'merchant', flat=True).distinct()
+    Merchant.objects.bulk_create([Merchant(id=id) for id in merchant_ids])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('categories', '0016_job'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Merchant',
+            fields=[
+                ('id', models.CharField(max_length=40, primary_key=True, serialize=False)),
+                ('name', models.CharField(blank=True, max_length=100)),
+                ('category', models.CharField(blank=True, max_length=30)),
+                ('logo', models.URLField(blank=True, max_length=500)),
+                ('emoji', models.CharField(blank=True, max_length=10)),
+                ('address', models.CharField(blank=True, max_length=200)),
+            ],
+            options={
+                'verbose_name_plural': 'Merchants',
+            },
+        ),
+        migrations.AlterField(
+            model_name='monzotransaction',
+            name='merchant',
+            field=models.CharField(blank=True, max_length=40, null=True),
+        ),
+        migrations.RunPython(create_placeholder_merchants, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='monzotransaction',
+            name='merchant',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, to='categories.Merchant'),
+        ),
+    ]
@@ -0,0 +1,75 @@
+# Generated by Django 2.2.28 on 2026-10-18 07:56
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def copy_accounts(apps, schema_editor):
+    # Each existing MonzoUser becomes the owner of the one account it held
+    MonzoUser = apps.get_model('categories', 'MonzoUser')
+    MonzoAccount = apps.get_model('categories', 'MonzoAccount')
+
+    MonzoAccount.objects.bulk_create([
+        MonzoAccount(id=u.account_id, monzo_user=u,
+                     sync_cursor=u.sync_cursor, last_synced=u.last_synced)
+        for u in MonzoUser.objects.all()
+    ])
+
+
+def drop_untargeted_jobs(apps, schema_editor):
+    # Syncs and refreshes now run per account or user. The worker schedules
+    # targeted ones on start.
+    Job = apps.get_model('categories', 'Job')
+    Job.objects.filter(kind__in=['sync_transactions', 'refresh_token'],
+                       status='pending', target='').delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('categories', '0017_merchant'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='job',
+            name='target',
+            field=models.CharField(blank=True, max_length=40),
+        ),
+        migrations.AddField(
+            model_name='monzouser',
+            name='user',
+            field=models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='monzo_user', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.CreateModel(
+            name='MonzoAccount',
+            fields=[
+                ('id', models.CharField(max_length=40, primary_key=True, serialize=False)),
+                ('description', models.CharField(blank=True, max_length=100)),
+                ('closed', models.BooleanField(default=False)),
+                ('sync_cursor', models.DateTimeField(blank=True, null=True)),
+                ('last_synced', models.DateTimeField(blank=True, null=True)),
+                ('monzo_user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='accounts', to='categories.MonzoUser')),
+            ],
+            options={
+                'verbose_name_plural': 'MonzoAccounts',
+                'ordering': ['id'],
+            },
+        ),
+        migrations.RunPython(copy_accounts, migrations.RunPython.noop),
+        migrations.RunPython(drop_untargeted_jobs, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='monzouser',
+            name='account_id',
+        ),
+        migrations.RemoveField(
+            model_name='monzouser',
+            name='last_synced',
+        ),
+        migrations.RemoveField(
+            model_name='monzouser',
+            name='sync_cursor',
+        ),
+    ]
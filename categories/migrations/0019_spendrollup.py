@@ -0,0 +1,37 @@
+# Generated by Django 2.2.28 on 2026-10-18 08:02
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('categories', '0018_monzoaccount'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SpendRollup',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('account_id', models.CharField(max_length=40)),
+                ('date', models.DateField()),
+                ('count', models.IntegerField(default=0)),
+                ('sum_pennies', models.IntegerField(default=0)),
+                ('category', models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='categories.Category')),
+                ('top_level', models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='categories.Category')),
+            ],
+            options={
+                'verbose_name_plural': 'SpendRollups',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='spendrollup',
+            index=models.Index(fields=['account_id', 'date'], name='categories__account_7bbd52_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='spendrollup',
+            constraint=models.UniqueConstraint(fields=('account_id', 'date', 'category'), name='unique_spend_rollup'),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 2.2.28 on 2026-10-18 08:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('categories', '0019_spendrollup'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Chart',
+            fields=[
+                ('digest', models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ('svg', models.TextField()),
+                ('created', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+    ]
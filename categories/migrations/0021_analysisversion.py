@@ -0,0 +1,26 @@
+# Generated by Django 2.2.28 on 2026-10-18 08:10
+
+from django.db import migrations, models
+
+
+def create_version(apps, schema_editor):
+    AnalysisVersion = apps.get_model('categories', 'AnalysisVersion')
+    AnalysisVersion.objects.create(pk=1)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('categories', '0020_chart'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AnalysisVersion',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(create_version, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 2.2.28 on 2026-10-18 08:18
+
+from django.db import migrations, models
+
+
+def create_version(apps, schema_editor):
+    CategoryVersion = apps.get_model('categories', 'CategoryVersion')
+    CategoryVersion.objects.create(pk=1)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('categories', '0021_analysisversion'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CategoryVersion',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.CharField(blank=True, max_length=32)),
+            ],
+        ),
+        migrations.RunPython(create_version, migrations.RunPython.noop),
+    ]
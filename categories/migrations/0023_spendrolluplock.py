@@ -0,0 +1,44 @@
+# Generated by Django 2.2.28 on 2026-10-18 08:33
+
+from django.db import migrations, models
+
+
+def drop_duplicate_uningested_rollups(apps, schema_editor):
+    # Racing refreshes could each insert a day's uningested row. They're
+    # copies, so the first of each is kept.
+    SpendRollup = apps.get_model('categories', 'SpendRollup')
+    kept = set()
+    duplicates = []
+    for pk, account_id, date in SpendRollup.objects.filter(
+            category__isnull=True).order_by('pk').values_list('pk', 'account_id', 'date'):
+        if (account_id, date) in kept:
+            duplicates.append(pk)
+        kept.add((account_id, date))
+    SpendRollup.objects.filter(pk__in=duplicates).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('categories', '0022_categoryversion'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SpendRollupLock',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('account_id', models.CharField(max_length=40)),
+                ('date', models.DateField()),
+            ],
+        ),
+        migrations.RunPython(drop_duplicate_uningested_rollups, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='spendrollup',
+            constraint=models.UniqueConstraint(condition=models.Q(category__isnull=True), fields=('account_id', 'date'), name='unique_uningested_spend_rollup'),
+        ),
+        migrations.AddConstraint(
+            model_name='spendrolluplock',
+            constraint=models.UniqueConstraint(fields=('account_id', 'date'), name='unique_spend_rollup_lock'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 2.2.28 on 2026-10-18 08:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('categories', '0023_spendrolluplock'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='monzotransaction',
+            name='category',
+            field=models.CharField(blank=True, max_length=30),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 2.2.28 on 2026-10-18 08:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('categories', '0024_monzotransaction_category'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='analysisversion',
+            name='version',
+            field=models.CharField(blank=True, max_length=32),
+        ),
+    ]
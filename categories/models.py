@@ -1,7 +1,29 @@
 import datetime
+from uuid import uuid4
 
+from django.conf import settings
 from django.core.validators import MaxValueValidator
 from django.db import models
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+
+def question_prefetches(category='category'):
+    # The lookups that prefetch a category's own and parent's questions, from
+    # a model with a `category` relation or from Category itself ('')
+    prefix = f'{category}__' if category else ''
+    ordered = Question.objects.order_by('id')
+    return [models.Prefetch(f'{prefix}question_set', queryset=ordered,
+                            to_attr='prefetched_questions'),
+            models.Prefetch(f'{prefix}parent__question_set', queryset=ordered,
+                            to_attr='prefetched_questions')]
+
+
+class CategoryQuerySet(models.QuerySet):
+    def with_questions(self):
+        # Batch-loads questions for every category, so .questions needs no
+        # queries: three in all, whatever the number of categories
+        return self.select_related('parent').prefetch_related(*question_prefetches(''))
 
 
 class Category(models.Model):
@@ -27,6 +49,8 @@ class Category(models.Model):
         default=False
     )
 
+    objects = CategoryQuerySet.as_manager()
+
     class Meta:
         verbose_name_plural = "categories"
 
@@ -44,15 +68,19 @@ class Category(models.Model):
 
     @property
     def questions(self):
-        category_question_ids = self.question_set.all().values_list('id', flat=True)
-        parent_category_question_ids = Question.objects.none()
-        if self.parent:
-            parent_category_question_ids = self.parent.question_set.all().values_list('id',
-                                                                                      flat=True)
-        question_set = category_question_ids.union(
-            parent_category_question_ids)
-        queryset = Question.objects.filter(pk__in=question_set)
-        return queryset
+        # This category's questions and those it inherits from its parent. If
+        # they were prefetched with with_questions() they are merged from
+        # there, otherwise they take one query.
+        own = getattr(self, 'prefetched_questions', None)
+        inherited = []
+        if own is not None and self.parent_id:
+            # the parent may have been reassigned since it was prefetched
+            inherited = getattr(self.parent, 'prefetched_questions', None)
+        if own is None or inherited is None:
+            return Question.objects.for_category(self)
+
+        questions = {q.id: q for q in own + inherited}
+        return [questions[id] for id in sorted(questions)]
 
     @property
     def child_categories(self):
@@ -67,6 +95,14 @@ class Category(models.Model):
         return queryset
 
 
+class QuestionQuerySet(models.QuerySet):
+    def for_category(self, category):
+        # Questions attached to the category or to its parent
+        return self.filter(
+            categories__in=[pk for pk in (category.pk, category.parent_id) if pk is not None]
+        ).distinct().order_by('id')
+
+
 class Question(models.Model):
     OPTION_TYPE_CHOICES = (
         ('N', 'number'),
@@ -87,6 +123,8 @@ class Question(models.Model):
         choices=OPTION_TYPE_CHOICES,
     )
 
+    objects = QuestionQuerySet.as_manager()
+
     def __str__(self):
         return self.title
 
@@ -120,6 +158,13 @@ class Option(models.Model):
         return f'/options/{self.pk}'
 
 
+class TransactionQuerySet(models.QuerySet):
+    def with_questions(self):
+        # Batch-loads each transaction's category and applicable questions
+        return self.select_related('category__parent').prefetch_related(
+            *question_prefetches())
+
+
 class Transaction(models.Model):
     id = models.CharField(
         primary_key=True,
@@ -133,9 +178,24 @@ class Transaction(models.Model):
         on_delete=models.PROTECT,
     )
 
+    # Monzo's created timestamp, null for cash transactions
+    monzo_created = models.DateTimeField(
+        null=True,
+        blank=True,
+        db_index=True,
+    )
+
+    objects = TransactionQuerySet.as_manager()
+
     def __str__(self):
         return self.id
 
+    def save(self, *args, **kwargs):
+        if self.monzo_created is None:
+            self.monzo_created = MonzoTransaction.objects.filter(
+                pk=self.id).values_list('created', flat=True).first()
+        super().save(*args, **kwargs)
+
     def delete(self, *args, **kwargs):
         # delete dependent QuestionAnswers first
         for qa in self.question_answers:
@@ -144,11 +204,7 @@ class Transaction(models.Model):
 
     @property
     def applicable_questions(self):
-        category_questions = Question.objects.filter(
-            categories__in=[self.category])
-        parent_category_questions = Question.objects.filter(
-            categories__in=[self.category.parent])
-        return category_questions.union(parent_category_questions)
+        return self.category.questions
 
     @property
     def question_answers(self):
@@ -226,8 +282,13 @@ class MonzoUser(models.Model):
         unique=True,
     )
 
-    account_id = models.CharField(
-        max_length=40
+    # the Django user who linked this Monzo login
+    user = models.OneToOneField(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='monzo_user',
+        null=True,
+        blank=True,
     )
 
     access_token = models.CharField(
@@ -238,5 +299,424 @@ class MonzoUser(models.Model):
         max_length=300,
     )
 
+    access_token_expires = models.DateTimeField(
+        null=True,
+        blank=True,
+    )
+
     class Meta:
         verbose_name_plural = 'MonzoUsers'
+
+
+class MonzoAccount(models.Model):
+    # Each account is mirrored and synced separately, using its owner's tokens
+    id = models.CharField(
+        primary_key=True,
+        max_length=40,
+    )
+
+    monzo_user = models.ForeignKey(
+        MonzoUser,
+        on_delete=models.CASCADE,
+        related_name='accounts',
+    )
+
+    description = models.CharField(
+        max_length=100,
+        blank=True,
+    )
+
+    closed = models.BooleanField(
+        default=False,
+    )
+
+    # created timestamp that the next incremental sync fetches from
+    sync_cursor = models.DateTimeField(
+        null=True,
+        blank=True,
+    )
+
+    last_synced = models.DateTimeField(
+        null=True,
+        blank=True,
+    )
+
+    class Meta:
+        verbose_name_plural = 'MonzoAccounts'
+        ordering = ['id']
+
+    def __str__(self):
+        return self.description or self.id
+
+
+class Merchant(models.Model):
+    # Merchant details from expanded Monzo transactions, stored once per merchant
+    id = models.CharField(
+        primary_key=True,
+        max_length=40,
+    )
+
+    name = models.CharField(
+        max_length=100,
+        blank=True,
+    )
+
+    category = models.CharField(
+        max_length=30,
+        blank=True,
+    )
+
+    logo = models.URLField(
+        max_length=500,
+        blank=True,
+    )
+
+    emoji = models.CharField(
+        max_length=10,
+        blank=True,
+    )
+
+    address = models.CharField(
+        max_length=200,
+        blank=True,
+    )
+
+    class Meta:
+        verbose_name_plural = 'Merchants'
+
+    def __str__(self):
+        return self.name or self.id
+
+    @classmethod
+    def from_api(cls, data):
+        return cls(
+            id=data['id'],
+            name=data.get('name', ''),
+            category=data.get('category', ''),
+            logo=data.get('logo', ''),
+            emoji=data.get('emoji', ''),
+            address=(data.get('address') or {}).get('formatted', ''),
+        )
+
+
+class MonzoTransactionQuerySet(models.QuerySet):
+    def spending(self):
+        return self.filter(include_in_spending=True)
+
+    def for_account(self, account_id):
+        return self.filter(account_id=account_id)
+
+    def last_days(self, days):
+        since = timezone.now() - datetime.timedelta(days=days)
+        return self.filter(created__gte=since)
+
+    def ingested(self):
+        return self.filter(pk__in=Transaction.objects.values('pk'))
+
+    def uningested(self):
+        return self.exclude(pk__in=Transaction.objects.values('pk'))
+
+
+class MonzoTransaction(models.Model):
+    # Local mirror of the raw transactions returned by Monzo's /transactions
+    id = models.CharField(
+        primary_key=True,
+        max_length=32,
+    )
+
+    account_id = models.CharField(
+        max_length=40,
+    )
+
+    created = models.DateTimeField(
+        db_index=True,
+    )
+
+    description = models.CharField(
+        max_length=200,
+        blank=True,
+    )
+
+    amount = models.IntegerField()
+
+    currency = models.CharField(
+        max_length=3,
+    )
+
+    local_amount = models.IntegerField()
+
+    local_currency = models.CharField(
+        max_length=3,
+    )
+
+    mcc = models.CharField(
+        max_length=4,
+        blank=True,
+    )
+
+    # Monzo's own category for the transaction, e.g. 'groceries'
+    category = models.CharField(
+        max_length=30,
+        blank=True,
+    )
+
+    merchant = models.ForeignKey(
+        Merchant,
+
+        # merchants are never deleted by the sync
+        on_delete=models.PROTECT,
+
+        # transfers and top-ups have no merchant
+        null=True,
+        blank=True,
+    )
+
+    include_in_spending = models.BooleanField(
+        default=False,
+    )
+
+    # null until the transaction has settled
+    settled = models.DateTimeField(
+        null=True,
+        blank=True,
+    )
+
+    objects = MonzoTransactionQuerySet.as_manager()
+
+    class Meta:
+        verbose_name_plural = 'MonzoTransactions'
+        ordering = ['created']
+        indexes = [
+            models.Index(fields=['account_id', 'created']),
+        ]
+
+    def __str__(self):
+        return self.id
+
+    @classmethod
+    def from_api(cls, data):
+        merchant_id = data.get('merchant') or None
+        # expanded transactions carry the whole merchant object
+        if isinstance(merchant_id, dict):
+            merchant_id = merchant_id['id']
+
+        return cls(
+            id=data['id'],
+            account_id=data['account_id'],
+            created=parse_datetime(data['created']),
+            description=data.get('description', ''),
+            amount=data['amount'],
+            currency=data['currency'],
+            local_amount=data.get('local_amount', data['amount']),
+            local_currency=data.get('local_currency', data['currency']),
+            mcc=data.get('metadata', {}).get('mcc', ''),
+            category=data.get('category', ''),
+            merchant_id=merchant_id,
+            include_in_spending=data.get('include_in_spending', False),
+            # Monzo returns an empty string for unsettled transactions
+            settled=parse_datetime(data['settled']) if data.get('settled') else None,
+        )
+
+
+class SpendRollup(models.Model):
+    # Ingested Monzo spending per account, day and category, kept up to date
+    # by categories.rollups so analysis sums a few rows per day in the window
+    account_id = models.CharField(
+        max_length=40,
+    )
+
+    # local date of the spends
+    date = models.DateField()
+
+    # both null for spends that haven't been ingested yet
+    category = models.ForeignKey(
+        Category,
+        on_delete=models.CASCADE,
+        related_name='+',
+        null=True,
+    )
+
+    top_level = models.ForeignKey(
+        Category,
+        on_delete=models.CASCADE,
+        related_name='+',
+        null=True,
+    )
+
+    count = models.IntegerField(
+        default=0,
+    )
+
+    # spend is positive here, unlike Monzo amounts
+    sum_pennies = models.IntegerField(
+        default=0,
+    )
+
+    class Meta:
+        verbose_name_plural = 'SpendRollups'
+        indexes = [
+            models.Index(fields=['account_id', 'date']),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['account_id', 'date', 'category'],
+                name='unique_spend_rollup',
+            ),
+            # nulls are distinct in the constraint above
+            models.UniqueConstraint(
+                fields=['account_id', 'date'],
+                condition=models.Q(category__isnull=True),
+                name='unique_uningested_spend_rollup',
+            ),
+        ]
+
+
+class SpendRollupLock(models.Model):
+    # A row per account and day, locked while that day's rollups are rebuilt
+    # so concurrent refreshes of it take turns
+    account_id = models.CharField(
+        max_length=40,
+    )
+
+    date = models.DateField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['account_id', 'date'],
+                name='unique_spend_rollup_lock',
+            ),
+        ]
+
+
+class Chart(models.Model):
+    # A rendered chart, addressed by the sha256 of the data it shows
+    digest = models.CharField(
+        primary_key=True,
+        max_length=64,
+    )
+
+    svg = models.TextField()
+
+    created = models.DateTimeField(
+        auto_now_add=True,
+    )
+
+
+class VersionToken(models.Model):
+    # A single row whose token changes whenever what it versions does, so
+    # copies cached in every process know they're stale. A fresh token
+    # rather than a count, so a rolled back bump can't be reused.
+    version = models.CharField(
+        max_length=32,
+        blank=True,
+    )
+
+    class Meta:
+        abstract = True
+
+    @classmethod
+    def current(cls) -> str:
+        return cls.objects.values_list('version', flat=True).first() or ''
+
+    @classmethod
+    def bump(cls) -> None:
+        version = uuid4().hex
+        if not cls.objects.filter(pk=1).update(version=version):
+            # the row is created by migration, but may have been flushed
+            cls.objects.update_or_create(pk=1, defaults={'version': version})
+
+
+class AnalysisVersion(VersionToken):
+    # Bumped whenever anything the analysis page shows changes
+    pass
+
+
+class CategoryVersion(VersionToken):
+    # Bumped whenever a Category is saved or deleted, so each process reloads
+    # its category tree
+    pass
+
+
+class Job(models.Model):
+    PENDING = 'pending'
+    RUNNING = 'running'
+    SUCCEEDED = 'succeeded'
+    FAILED = 'failed'
+    STATUS_CHOICES = (
+        (PENDING, 'pending'),
+        (RUNNING, 'running'),
+        (SUCCEEDED, 'succeeded'),
+        (FAILED, 'failed'),
+    )
+
+    kind = models.CharField(
+        max_length=50,
+    )
+
+    # only one pending job may exist per key
+    key = models.CharField(
+        max_length=100,
+    )
+
+    # the account or Monzo user the job acts on, if any
+    target = models.CharField(
+        max_length=40,
+        blank=True,
+    )
+
+    status = models.CharField(
+        max_length=10,
+        choices=STATUS_CHOICES,
+        default=PENDING,
+    )
+
+    run_after = models.DateTimeField(
+        default=timezone.now,
+    )
+
+    attempts = models.IntegerField(
+        default=0,
+    )
+
+    max_attempts = models.IntegerField(
+        default=5,
+    )
+
+    created = models.DateTimeField(
+        auto_now_add=True,
+    )
+
+    started = models.DateTimeField(
+        null=True,
+        blank=True,
+    )
+
+    finished = models.DateTimeField(
+        null=True,
+        blank=True,
+    )
+
+    last_error = models.TextField(
+        blank=True,
+    )
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'run_after']),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['key'],
+                condition=models.Q(status='pending'),
+                name='unique_pending_job_key',
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.kind} ({self.status})'
+
+    @property
+    def duration(self):
+        if self.started and self.finished:
+            return self.finished - self.started
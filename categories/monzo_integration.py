@@ -1,18 +1,52 @@
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
-from typing import Dict, List
+from email.utils import parsedate_to_datetime
+import logging
+import random
+import threading
+import time
+from typing import Dict, Iterable, Iterator, List, Tuple
 from urllib.parse import urlencode, urlunsplit
 
 from django.conf import settings
 from django.core.exceptions import PermissionDenied
+from django.db import connections, transaction
+from django.utils import timezone
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
-from .models import Transaction, MonzoUser
+from .fake_monzo import FakeMonzo, FakeMonzoAdapter
+from .models import MonzoAccount, MonzoUser, Transaction
 from mysite.settings import MONZO_CLIENT_ID, MONZO_CLIENT_SECRET
 
-API_ROOT = 'https://api.monzo.com'
+logger = logging.getLogger(__name__)
+
+API_ROOT = settings.MONZO_API_ROOT
 AUTH_ROOT = 'https://auth.monzo.com'
 OAUTH_TOKEN_ENDPOINT = f'{API_ROOT}/oauth2/token'
+ACCOUNTS_ENDPOINT = f'{API_ROOT}/accounts'
+
+# Monzo caps /transactions pages at 100 results
+PAGE_LIMIT = 100
+LOOKBACK_WINDOW_DAYS = 7
+
+# (connect, read) seconds, so a hung endpoint can't pin a worker
+TIMEOUT = (3.05, 10)
+MAX_RETRIES = 3
+POOL_SIZE = 10
+
+# Retry-After is honoured up to this long, past which the 429 is returned
+# rather than holding a worker
+MAX_RETRY_AFTER = 30
+RATE_LIMIT_RETRIES = 3
+
+# Treat tokens as expired slightly early to allow for clock skew
+EXPIRY_MARGIN = timedelta(seconds=60)
+# How long a whoami check is trusted for when the expiry isn't known
+WHOAMI_TRUST_PERIOD = timedelta(minutes=5)
 
 # Improving this is out-of-scope for now
 OAUTH_STATE_TOKEN = 'foobar'
@@ -27,35 +61,177 @@ class NoAccessTokenException(MonzoException):
     pass
 
 
+def build_session() -> requests.Session:
+    # Retry's default method whitelist only retries reads for idempotent
+    # methods, so token POSTs are never replayed once they've been sent.
+    # Once retries run out the last response is returned for callers to check.
+    # Retry-After is left to request(), which caps how long it will wait.
+    retry = Retry(
+        total=MAX_RETRIES,
+        backoff_factor=0.3,
+        status_forcelist=(500, 502, 503, 504),
+        raise_on_status=False,
+        respect_retry_after_header=False,
+    )
+    adapter = HTTPAdapter(pool_connections=2, pool_maxsize=POOL_SIZE,
+                          max_retries=retry)
+
+    session = requests.Session()
+    session.mount('https://', adapter)
+    # plain http is only used to reach a locally served fake
+    session.mount('http://', adapter)
+
+    # Answer in-process from a fake API instead, e.g. for offline benchmarks
+    if settings.MONZO_FAKE_API is not None:
+        session.mount(API_ROOT, FakeMonzoAdapter(FakeMonzo(**settings.MONZO_FAKE_API)))
+    return session
+
+
+class TokenBucket:
+    # Allows `rate` calls per second on average, in bursts of up to
+    # `capacity`, shared by every thread in the process
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> float:
+        # Blocks until a call is allowed, returning the seconds waited
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity,
+                                   self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return waited
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+            waited += wait
+
+
+def retry_after_seconds(r: requests.Response, attempt: int) -> float:
+    value = r.headers.get('Retry-After')
+    try:
+        delay = float(value)
+    except (TypeError, ValueError):
+        try:
+            delay = (parsedate_to_datetime(value) - timezone.now()).total_seconds()
+        except (TypeError, ValueError):
+            # no usable header, so back off exponentially
+            delay = 0.5 * 2 ** attempt
+    # jitter stops throttled threads retrying in lockstep
+    return max(delay, 0) + random.uniform(0, 0.5)
+
+
+def request(method: str, url: str, **kwargs) -> requests.Response:
+    # Every Monzo call goes through the rate limiter and 429 handling here
+    for attempt in range(RATE_LIMIT_RETRIES + 1):
+        waited = rate_limiter.acquire()
+        if waited:
+            count('throttled')
+            count('throttled_seconds', waited)
+
+        try:
+            r = session.request(method, url, timeout=TIMEOUT, **kwargs)
+        except requests.RequestException as e:
+            # timeouts, dropped connections and exhausted retries
+            raise MonzoException(f'{method} {url} failed: {e}') from e
+        if r.status_code != 429:
+            return r
+
+        count('rate_limited')
+        delay = retry_after_seconds(r, attempt)
+        if attempt == RATE_LIMIT_RETRIES or delay > MAX_RETRY_AFTER:
+            logger.warning('Monzo rate limited %s %s, giving up', method, url)
+            count('rate_limited_failures')
+            return r
+
+        logger.info('Monzo rate limited %s %s, retrying in %.1fs', method, url, delay)
+        time.sleep(delay)
+
+
+# One keep-alive connection pool shared by every Monzo call in the process
+session = build_session()
+rate_limiter = TokenBucket(settings.MONZO_RATE_LIMIT_PER_SECOND,
+                           settings.MONZO_RATE_LIMIT_BURST)
+# Counts of throttled and rate limited calls since the process started
+metrics = Counter()
+_metrics_lock = threading.Lock()
+
+
+def count(metric: str, by: float = 1) -> None:
+    with _metrics_lock:
+        metrics[metric] += by
+
+
+def request_stats() -> Dict[str, float]:
+    with _metrics_lock:
+        return {metric: metrics[metric] for metric in [
+            'throttled', 'throttled_seconds', 'rate_limited', 'rate_limited_failures']}
+
+
 class MonzoAuth:
     WHOAMI_ENDPOINT = f'{API_ROOT}/ping/whoami'
 
-    def __init__(self):
+    def __init__(self, monzo_user: MonzoUser):
         # Read tokens saved in DB
-        self._monzo_user = MonzoUser.objects.all()[0]
-        self._access_token = self._monzo_user.access_token
-        self._refresh_token = self._monzo_user.refresh_token
+        self._monzo_user = monzo_user
+        self.load_tokens(monzo_user)
+        # Cached clients share one MonzoAuth between threads, so revalidating
+        # and refreshing happen one thread at a time
+        self.lock = threading.RLock()
+
+    def load_tokens(self, monzo_user: MonzoUser) -> None:
+        self._access_token = monzo_user.access_token
+        self._refresh_token = monzo_user.refresh_token
+        self._access_token_expires = monzo_user.access_token_expires
 
     @property
     def access_token(self):
-        if self.access_token_valid():
-            print('access_token is valid')
+        # Only ask Monzo about the token once it has expired or been rejected
+        if self.access_token_unexpired():
             return self._access_token
 
-        try:
-            print('access_token NOT valid, attempting refresh')
-            self.use_refresh_token()
-            print('refresh was successful')
-            return self._access_token
-        except PermissionDenied as e:
-            print('refresh was NOT successful, need a redirect to the login page')
-            raise NoAccessTokenException(e)
+        with self.lock:
+            # another thread may have revalidated while this one waited
+            if self.access_token_unexpired():
+                return self._access_token
+
+            if self.access_token_valid():
+                print('access_token is valid')
+                # kept in memory, as the stored expiry may be a fresher refresh's
+                self._access_token_expires = timezone.now() + WHOAMI_TRUST_PERIOD
+                return self._access_token
+
+            try:
+                print('access_token NOT valid, attempting refresh')
+                self.use_refresh_token()
+                print('refresh was successful')
+                return self._access_token
+            except PermissionDenied as e:
+                print('refresh was NOT successful, need a redirect to the login page')
+                raise NoAccessTokenException(e)
 
     @access_token.setter
     def access_token(self, value):
         self._access_token = value
         self._monzo_user.access_token = value
-        self._monzo_user.save()
+        self._monzo_user.save(update_fields=['access_token'])
+
+    @property
+    def access_token_expires(self):
+        return self._access_token_expires
+
+    @access_token_expires.setter
+    def access_token_expires(self, value):
+        self._access_token_expires = value
+        self._monzo_user.access_token_expires = value
+        self._monzo_user.save(update_fields=['access_token_expires'])
 
     @property
     def refresh_token(self):
@@ -65,122 +241,324 @@ class MonzoAuth:
     def refresh_token(self, value):
         self._refresh_token = value
         self._monzo_user.refresh_token = value
-        self._monzo_user.save()
+        self._monzo_user.save(update_fields=['refresh_token'])
+
+    def access_token_unexpired(self) -> bool:
+        if self._access_token_expires is None:
+            return False
+        return timezone.now() < self._access_token_expires - EXPIRY_MARGIN
+
+    def invalidate_access_token(self) -> None:
+        # Called after a 401 so the next access revalidates the token. Only
+        # this copy's expiry is forgotten: the stored one may already belong
+        # to fresher tokens saved by another process.
+        logger.info('access_token was rejected, forgetting its expiry')
+        self._access_token_expires = None
+
+    def save_tokens(self, data: Dict) -> None:
+        self.access_token = data['access_token']
+        self.refresh_token = data['refresh_token']
+        self.access_token_expires = timezone.now() + \
+            timedelta(seconds=data['expires_in'])
+        # clients cached with the old tokens are rebuilt on next use
+        forget_clients(self._monzo_user.pk)
+
+    def save_accounts(self) -> List[MonzoAccount]:
+        # Mirror the accounts this login can see
+        headers = {'Authorization': f'Bearer {self.access_token}'}
+        r = request('GET', ACCOUNTS_ENDPOINT, headers=headers)
+        if r.status_code != 200:
+            raise MonzoException(f'Unexpected status code {r.status_code} listing accounts')
+
+        accounts = []
+        for data in r.json()['accounts']:
+            account, _ = MonzoAccount.objects.update_or_create(id=data['id'], defaults={
+                'monzo_user': self._monzo_user,
+                'description': data.get('description', ''),
+                'closed': data.get('closed', False),
+            })
+            accounts.append(account)
+        return accounts
 
     def access_token_valid(self) -> bool:
         # Call Monzo's whoami endpoint to determine token state
         headers = {'Authorization': f'Bearer {self._access_token}'}
-        r = requests.get(self.WHOAMI_ENDPOINT, headers=headers)
-        data = r.json()
+        r = request('GET', self.WHOAMI_ENDPOINT, headers=headers)
+        # error pages after exhausted retries may not be JSON
+        if r.status_code != 200:
+            print('access_token whoami returned !200')
+            return False
 
-        if r.status_code == 200 and data['authenticated'] is True:
+        if r.json()['authenticated'] is True:
             print('access_token is authenticated')
             return True
 
-        if r.status_code == 200 and data['authenticated'] is not True:
-            print('access_token is NOT authenticated')
-            return False
-
-        if r.status_code != 200:
-            print('access_token whoami returned !200')
-            return False
+        print('access_token is NOT authenticated')
+        return False
 
     def use_refresh_token(self) -> None:
+        # Refresh tokens are single use, so refreshes for one Monzo user are
+        # serialised on its row. If another process got there first, its
+        # tokens are adopted instead of refreshing again.
+        with transaction.atomic():
+            stored = MonzoUser.objects.select_for_update().get(pk=self._monzo_user.pk)
+            if stored.refresh_token != self._refresh_token:
+                logger.info('tokens were refreshed elsewhere, using those')
+                self._monzo_user = stored
+                self.load_tokens(stored)
+                return
+            self.request_refresh()
+
+    def request_refresh(self) -> None:
         data = {
             'grant_type': 'refresh_token',
             'client_id': settings.MONZO_CLIENT_ID,
             'client_secret': settings.MONZO_CLIENT_SECRET,
             'refresh_token': self._refresh_token,
         }
-        r = requests.post(OAUTH_TOKEN_ENDPOINT, data)
-        data = r.json()
-
+        r = request('POST', OAUTH_TOKEN_ENDPOINT, data=data)
         if r.status_code == 200:
-            self.access_token = data['access_token']
-            self.refresh_token = data['refresh_token']
+            self.save_tokens(r.json())
+            return
+
+        # POSTs aren't retried, and a failing gateway may not answer in JSON
+        try:
+            code = r.json().get('code')
+        except ValueError:
+            code = None
 
-        elif data['code'] == 'unauthorized.bad_refresh_token.evicted':
+        if code == 'unauthorized.bad_refresh_token.evicted':
             print('refresh_token has been evicted by another login')
             raise PermissionDenied(
                 'refresh_token has been evicted by another login')
 
-        elif data['code'] == 'unauthorized.bad_refresh_token':
+        elif code == 'unauthorized.bad_refresh_token':
             print('refresh_token is missing/malformed')
             raise PermissionDenied('refresh_token is missing/malformed')
 
         # what else could be done here?
         else:
             print(' unexpected error while refreshing tokens')
-            raise Exception('unexpected error')
+            raise MonzoException(f'Unexpected status code {r.status_code} refreshing tokens')
 
 
 class MonzoRequest:
     TRANSACTIONS_ENDPOINT = f'{API_ROOT}/transactions'
+    WEBHOOKS_ENDPOINT = f'{API_ROOT}/webhooks'
 
-    def __init__(self):
-        # Catch user not in DB?
-        monzo_user = MonzoUser.objects.all()[0]
-        self.params = {'account_id': monzo_user.account_id}
-        access_token = MonzoAuth().access_token
+    def __init__(self, account: MonzoAccount, auth: MonzoAuth = None):
+        self.account = account
+        self.monzo_user = account.monzo_user
+        self.params = {'account_id': account.id}
+        self.auth = auth or MonzoAuth(self.monzo_user)
         # DRY
-        self.headers = {'Authorization': f'Bearer {access_token}'}
+        self.headers = {'Authorization': f'Bearer {self.auth.access_token}'}
+        # A MonzoRequest lives for one web request, so identical calls made
+        # while serving it are answered from here. Pinning "now" keeps the
+        # relative day windows identical between calls.
+        self._responses = {}
+        self.now = datetime.utcnow()
+
+    def get(self, url: str, params: Dict, memo: bool = True) -> requests.Response:
+        key = (url, tuple(sorted(params.items())))
+        if memo and key in self._responses:
+            return self._responses[key]
+
+        headers = self.headers
+        r = request('GET', url, params=params, headers=headers)
+        if r.status_code == 401:
+            # The cached expiry was wrong, so revalidate and retry once
+            with self.auth.lock:
+                # Another thread may have already refreshed the token
+                if self.headers is headers:
+                    self.auth.invalidate_access_token()
+                    self.headers = {'Authorization': f'Bearer {self.auth.access_token}'}
+            r = request('GET', url, params=params, headers=self.headers)
+
+        if memo and r.status_code == 200:
+            self._responses[key] = r
+        return r
+
+    def iter_transactions(self, since: datetime, before: datetime = None,
+                          limit: int = PAGE_LIMIT,
+                          expand_merchant: bool = False,
+                          memo: bool = True) -> Iterator[Dict]:
+        # Walk the window a page at a time, oldest first. Long walks pass
+        # memo=False so pages aren't all held until the request ends.
+        params = {**self.params, 'since': rfc3339(since), 'limit': limit}
+        if before:
+            params['before'] = rfc3339(before)
+        if expand_merchant:
+            params['expand[]'] = 'merchant'
+
+        while True:
+            r = self.get(self.TRANSACTIONS_ENDPOINT, params, memo=memo)
+            page = r.json()['transactions']
+            yield from page
+
+            if len(page) < limit:
+                return
+            # Monzo accepts an object id as the since cursor
+            params['since'] = page[-1]['id']
+
+    def get_transactions(self, since: datetime) -> List:
+        return list(self.iter_transactions(since))
+
+    def iter_days_of_spends(self, days: int = 7, before: datetime = None) -> Iterator[Dict]:
+        before = before or self.now
+        some_days_ago = before - timedelta(days=days)
+        for t in self.iter_transactions(some_days_ago, before):
+            if t['include_in_spending']:
+                yield t
 
     def get_days_of_spends(self, days: int = 7) -> List:
-        some_days_ago = datetime.utcnow() - timedelta(days=days)
-        since = some_days_ago.isoformat(timespec='seconds') + 'Z'
-        params = {**self.params, 'since': since}
-
-        r = requests.get(self.TRANSACTIONS_ENDPOINT,
-                         params=params, headers=self.headers)
-        data = r.json()
-
-        transactions = data['transactions']
-        spending = [t for t in transactions if t['include_in_spending']]
-        return spending
+        return list(self.iter_days_of_spends(days))
 
     def get_transaction(self, id: str) -> Dict:
         params = {**self.params, 'expand[]': 'merchant'}
         url = f'{self.TRANSACTIONS_ENDPOINT}/{id}'
-        r = requests.get(url, params=params, headers=self.headers)
+        r = self.get(url, params)
+        if r.status_code != 200:
+            raise MonzoException(f'Unexpected status code {r.status_code} fetching {id}')
         transaction = r.json()['transaction']
         return transaction
 
+    def get_transactions_by_id(self, ids: List[str],
+                               max_workers: int = POOL_SIZE) -> Tuple[Dict, Dict]:
+        # Fetch expanded transactions concurrently over the shared pool.
+        # Returns (transactions, errors), both keyed by id in input order.
+        def fetch(id):
+            try:
+                return self.get_transaction(id)
+            except Exception as e:
+                return e
+            finally:
+                # a 401 refresh saves tokens from this thread
+                connections.close_all()
+
+        transactions, errors = {}, {}
+        if not ids:
+            return transactions, errors
+
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(ids))) as executor:
+            for id, result in zip(ids, executor.map(fetch, ids)):
+                if isinstance(result, Exception):
+                    errors[id] = result
+                else:
+                    transactions[id] = result
+
+        return transactions, errors
+
     def get_latest_transaction(self) -> Dict:
         spends = self.get_days_of_spends(days=7)
         latest_txid = spends[-1]['id']
         transaction = self.get_transaction(latest_txid)
         return transaction
 
-    def get_latest_uningested_transaction(self) -> Dict:
-        # this should paginate, would fix #6
-        uningested = self.get_days_of_uningested_spends(days=30)
-        latest_txid = uningested[-1]['id']
-        transaction = self.get_transaction(latest_txid)
-        return transaction
+    def get_latest_uningested_transaction(self, days: int = 30) -> Dict:
+        # Step backwards a window at a time so only recent pages are fetched
+        before = self.now
+        oldest = before - timedelta(days=days)
+        while before > oldest:
+            window_days = min(LOOKBACK_WINDOW_DAYS, (before - oldest).days or 1)
+            spends = list(self.iter_days_of_spends(window_days, before=before))
+            ids = [t['id'] for t in spends]
+            ingested_ids = set(Transaction.objects.filter(
+                pk__in=ids).values_list('id', flat=True))
+            uningested = [t for t in spends if t['id'] not in ingested_ids]
+            if uningested:
+                return self.get_transaction(uningested[-1]['id'])
+            before -= timedelta(days=window_days)
+
+        raise MonzoException(f'No uningested transactions in the last {days} days')
+
+    def list_webhooks(self) -> List:
+        r = self.get(self.WEBHOOKS_ENDPOINT, self.params)
+        return r.json()['webhooks']
+
+    def register_webhook(self, url: str) -> Dict:
+        data = {**self.params, 'url': url}
+        r = request('POST', self.WEBHOOKS_ENDPOINT, data=data, headers=self.headers)
+        if r.status_code != 200:
+            raise MonzoException(f'Unexpected status code {r.status_code} registering webhook')
+        return r.json()['webhook']
 
-    def get_days_of_ingested_spends(self, days: int = 7) -> List:
+    def split_days_of_spends(self, days: int = 7) -> Tuple[List, List]:
+        # One fetch and one pass gives both the ingested and uningested spends
         spends = self.get_days_of_spends(days=days)
-        week_spend_ids = set([t['id'] for t in spends])
-        # This model will need the Monzo created date saved to prevent slow queries
-        all_ingested_ids = set(
-            Transaction.objects.values_list('id', flat=True))
+        # Only look up the ids in this window, not every id ever ingested
+        window_ids = [t['id'] for t in spends]
+        ingested_ids = set(Transaction.objects.filter(
+            pk__in=window_ids).values_list('id', flat=True))
+
+        ingested, uningested = [], []
+        for t in spends:
+            if t['id'] in ingested_ids:
+                ingested.append(t)
+            else:
+                uningested.append(t)
+        return ingested, uningested
 
-        week_ingested_ids = week_spend_ids.intersection(all_ingested_ids)
-        week_ingested_monzo_transactions = [
-            t for t in spends if t['id'] in week_ingested_ids]
-        return week_ingested_monzo_transactions
+    def get_days_of_ingested_spends(self, days: int = 7) -> List:
+        return self.split_days_of_spends(days)[0]
 
     def get_days_of_uningested_spends(self, days: int = 7) -> List:
-        spends = self.get_days_of_spends(days)
-        week_spend_ids = set([t['id'] for t in spends])
-        # This model will need the Monzo created date saved to prevent slow queries
-        all_ingested_ids = set(
-            Transaction.objects.values_list('id', flat=True))
+        return self.split_days_of_spends(days)[1]
+
+
+# Authenticated clients keyed by (Django user id, account id), shared by every
+# request this process serves. Only the account and its MonzoAuth are kept:
+# each web request still gets its own MonzoRequest and response memo.
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_client(user, account_id: str = None) -> MonzoRequest:
+    # Defaults to the user's first open account
+    key = (user.pk, account_id)
+    with _clients_lock:
+        cached = _clients.get(key)
+
+    if cached is None:
+        accounts = MonzoAccount.objects.select_related('monzo_user').filter(
+            monzo_user__user=user, closed=False)
+        if account_id:
+            accounts = accounts.filter(pk=account_id)
+        account = accounts.first()
+        if account is None:
+            raise NoAccessTokenException(f'No Monzo account linked to {user}')
+
+        with _clients_lock:
+            cached = _clients.setdefault(key, (account, MonzoAuth(account.monzo_user)))
+
+    account, auth = cached
+    return MonzoRequest(account, auth)
+
+
+def get_account_client(account_id: str = None) -> MonzoRequest:
+    # For commands, where there's no Django user. Without an id there must be
+    # exactly one account linked.
+    accounts = MonzoAccount.objects.select_related('monzo_user')
+    if account_id:
+        return MonzoRequest(accounts.get(pk=account_id))
+    return MonzoRequest(accounts.get())
+
+
+def forget_clients(monzo_user_id: str = None, user_ids: Iterable = ()) -> None:
+    # Drop the clients using a Monzo user's tokens, and any cached for the
+    # given Django users
+    user_ids = set(user_ids)
+    with _clients_lock:
+        for key in [key for key, (account, auth) in _clients.items()
+                    if account.monzo_user_id == monzo_user_id or key[0] in user_ids]:
+            del _clients[key]
+
 
-        week_uningested_ids = week_spend_ids.difference(all_ingested_ids)
-        week_uningested_monzo_transactions = [
-            t for t in spends if t['id'] in week_uningested_ids]
-        return week_uningested_monzo_transactions
+def rfc3339(dt: datetime) -> str:
+    # naive datetimes are assumed to already be UTC
+    if dt.tzinfo:
+        dt = dt.astimezone(timezone.utc)
+    return dt.strftime('%Y-%m-%dT%H:%M:%SZ')
 
 
 def get_login_url(redirect_uri: str) -> str:
@@ -200,7 +578,7 @@ def get_login_url(redirect_uri: str) -> str:
     return url
 
 
-def exchange_authorization_code(authorization_code: str, redirect_uri: str) -> None:
+def exchange_authorization_code(authorization_code: str, redirect_uri: str, user) -> None:
     url = OAUTH_TOKEN_ENDPOINT
     client_id = MONZO_CLIENT_ID
     client_secret = MONZO_CLIENT_SECRET
@@ -213,12 +591,24 @@ def exchange_authorization_code(authorization_code: str, redirect_uri: str) -> N
         'code': authorization_code,
     }
 
-    r = requests.post(url, data)
+    r = request('POST', url, data=data)
     data = r.json()
 
     if r.status_code != 200:
         raise Exception('Unexpected status code when exchanging oauth token')
 
-    monzo_auth = MonzoAuth()
-    monzo_auth.access_token = data['access_token']
-    monzo_auth.refresh_token = data['refresh_token']
+    # Link the Monzo login to whoever completed it, replacing any other login
+    previous_user_ids = set(MonzoUser.objects.filter(
+        pk=data['user_id'], user__isnull=False).values_list('user_id', flat=True))
+    MonzoUser.objects.filter(user=user).exclude(pk=data['user_id']).update(user=None)
+    monzo_user, _ = MonzoUser.objects.update_or_create(id=data['user_id'], defaults={
+        'user': user,
+        'access_token': data['access_token'],
+        'refresh_token': data['refresh_token'],
+    })
+
+    monzo_auth = MonzoAuth(monzo_user)
+    monzo_auth.save_tokens(data)
+    monzo_auth.save_accounts()
+    # clients cached for the old links would keep serving the old accounts
+    forget_clients(monzo_user.pk, previous_user_ids | {user.pk})
@@ -0,0 +1,121 @@
+from datetime import timedelta
+from itertools import islice
+
+from django.conf import settings
+from django.utils import timezone
+
+from . import analysis, rollups
+from .models import Merchant, MonzoTransaction, Transaction
+from .monzo_integration import PAGE_LIMIT
+
+# Pending transactions can still change until they settle, so the cursor is
+# held back to the oldest one created within this window
+SETTLEMENT_WINDOW = timedelta(days=7)
+
+
+def sync_transactions(monzo) -> int:
+    # Pull everything newer than the account's cursor into the local mirror
+    account = monzo.account
+    since = account.sync_cursor
+    if since is None:
+        since = timezone.now() - timedelta(days=settings.MONZO_SYNC_BACKFILL_DAYS)
+
+    # Save each page as it arrives rather than holding the whole window
+    synced = 0
+    pages = monzo.iter_transactions(since, expand_merchant=True, memo=False)
+    for batch in chunked(pages, PAGE_LIMIT):
+        save_transactions(batch)
+        synced += len(batch)
+
+    # only this account's sync state is written, so concurrent syncs of
+    # other accounts aren't overwritten
+    account.sync_cursor = next_cursor(account.id) or since
+    account.last_synced = timezone.now()
+    account.save(update_fields=['sync_cursor', 'last_synced'])
+
+    return synced
+
+
+def is_stale(account) -> bool:
+    last_synced = account.last_synced
+    interval = timedelta(seconds=settings.MONZO_SYNC_INTERVAL_SECONDS)
+    return not last_synced or timezone.now() - last_synced >= interval
+
+
+def save_transactions(data) -> None:
+    # Upsert raw API transactions, and any merchants they carry, into the mirror
+    save_merchants(data)
+
+    transactions = [MonzoTransaction.from_api(t) for t in data]
+    # the sync's cursor is inclusive, so most refetched rows are unchanged
+    saved = upsert(MonzoTransaction, transactions)
+
+    # Transactions can be ingested before their mirror row arrives
+    created = {t.id: t.created for t in saved}
+    ingested = list(Transaction.objects.filter(
+        pk__in=list(created), monzo_created__isnull=True))
+    for transaction in ingested:
+        transaction.monzo_created = created[transaction.id]
+    Transaction.objects.bulk_update(ingested, ['monzo_created'])
+
+    # Amounts and settlement can change, so the days they fall on are rolled up again
+    if saved:
+        rollups.refresh(rollups.days_of(t.created for t in saved))
+        analysis.invalidate()
+
+
+def save_merchants(data) -> None:
+    merchants = {}
+    referenced_ids = set()
+    for t in data:
+        merchant = t.get('merchant')
+        if isinstance(merchant, dict):
+            merchants[merchant['id']] = Merchant.from_api(merchant)
+        elif merchant:
+            referenced_ids.add(merchant)
+
+    # Unexpanded merchants get a placeholder until they're seen expanded,
+    # without overwriting details that are already stored
+    Merchant.objects.bulk_create(
+        [Merchant(id=id) for id in referenced_ids - set(merchants)],
+        ignore_conflicts=True)
+    upsert(Merchant, list(merchants.values()))
+
+
+def upsert(model, objects) -> list:
+    # Insert new rows and update existing ones whose fields differ, returning
+    # the inserted and changed objects. Unchanged rows aren't written.
+    fields = [f for f in model._meta.concrete_fields if not f.primary_key]
+    ids = [o.pk for o in objects]
+    stored = {row[0]: row[1:] for row in model.objects.filter(pk__in=ids).values_list(
+        'pk', *[f.attname for f in fields])}
+
+    new = [o for o in objects if o.pk not in stored]
+    changed = [o for o in objects if o.pk in stored and
+               stored[o.pk] != tuple(getattr(o, f.attname) for f in fields)]
+
+    model.objects.bulk_create(new)
+    model.objects.bulk_update(changed, [f.name for f in fields])
+    return new + changed
+
+
+def next_cursor(account_id):
+    account_transactions = MonzoTransaction.objects.filter(account_id=account_id)
+    pending = account_transactions.filter(
+        settled__isnull=True,
+        created__gte=timezone.now() - SETTLEMENT_WINDOW,
+    ).order_by('created').first()
+    if pending:
+        return pending.created
+
+    latest = account_transactions.order_by('-created').first()
+    return latest.created if latest else None
+
+
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
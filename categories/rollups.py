@@ -0,0 +1,110 @@
+# Daily spend rollups.
+#
+# SpendRollup holds one row per (account, local date, category) with the count
+# and total of that day's spends, plus one row with no category for the spends
+# not yet ingested. Whenever transactions change, refresh() recomputes just the
+# days they fall on, so summarising a window only sums a few rows per day.
+from collections import defaultdict
+from typing import Dict, Iterable
+
+from django.db import transaction
+from django.db.models import F, Sum
+from django.db.models.functions import TruncMonth, TruncWeek
+from django.utils import timezone
+
+from . import analysis, category_tree
+from .models import MonzoTransaction, SpendRollup, SpendRollupLock, Transaction
+
+
+def refresh(days: Iterable = None) -> int:
+    # Recompute the rollups for the given local dates, or for every date
+    spending = MonzoTransaction.objects.spending()
+    stale = SpendRollup.objects.all()
+    if days is not None:
+        days = set(days)
+        if not days:
+            return 0
+        spending = spending.filter(created__date__in=days)
+        stale = stale.filter(date__in=days)
+
+    with transaction.atomic():
+        # Concurrent refreshes of a day take turns, and each computes only
+        # once it holds the lock, so the last to finish saw the latest rows.
+        # Days that gain an account meanwhile are left to whoever added it.
+        keys = {(account_id, timezone.localdate(created)) for account_id, created
+                in spending.values_list('account_id', 'created')}
+        keys |= set(stale.values_list('account_id', 'date'))
+        lock(keys)
+        rollups = [r for r in compute(spending) if (r.account_id, r.date) in keys]
+        SpendRollup.objects.filter(pk__in=[
+            pk for pk, account_id, date in stale.values_list('pk', 'account_id', 'date')
+            if (account_id, date) in keys]).delete()
+        SpendRollup.objects.bulk_create(rollups)
+    return len(rollups)
+
+
+def lock(keys: set) -> None:
+    # Locks the (account id, date) keys until the transaction ends
+    SpendRollupLock.objects.bulk_create(
+        [SpendRollupLock(account_id=account_id, date=date) for account_id, date in keys],
+        ignore_conflicts=True)
+    # always in the same order, so refreshes of overlapping days can't deadlock
+    list(SpendRollupLock.objects.select_for_update()
+         .filter(account_id__in={account_id for account_id, _ in keys},
+                 date__in={date for _, date in keys})
+         .order_by('account_id', 'date'))
+
+
+def compute(spending) -> list:
+    # Spends are joined to their Transactions by id through a dict
+    categories = dict(Transaction.objects.filter(
+        pk__in=spending.values('pk')).values_list('id', 'category_id'))
+    tree = category_tree.get()
+
+    totals = defaultdict(lambda: [0, 0])
+    for id, account_id, created, amount in spending.values_list(
+            'id', 'account_id', 'created', 'amount'):
+        total = totals[(account_id, timezone.localdate(created), categories.get(id))]
+        total[0] += 1
+        # spend amounts are always negative
+        total[1] -= amount
+
+    return [
+        SpendRollup(account_id=account_id, date=date, category_id=category_id,
+                    top_level_id=category_id and tree[category_id].top_level_id,
+                    count=count, sum_pennies=sum_pennies)
+        for (account_id, date, category_id), (count, sum_pennies) in totals.items()
+    ]
+
+
+# Rollup dates are already local, so truncating them gives local boundaries.
+# Weeks start on Monday.
+BUCKETS = {
+    'day': F,
+    'week': TruncWeek,
+    'month': TruncMonth,
+}
+
+
+def series(spend, start, end, bucket: str = 'month', level: str = 'top_level'):
+    # Spend per (bucket, category) between two dates inclusive, grouped and
+    # summed by the database. level is 'top_level' or 'category'. Spends not
+    # yet ingested come out with no category.
+    return (spend
+            .filter(date__range=(start, end))
+            .values(period=BUCKETS[bucket]('date'), category_name=F(f'{level}__name'))
+            .annotate(count=Sum('count'), sum_pennies=Sum('sum_pennies'))
+            .order_by('period', 'category_name'))
+
+
+def days_of(*timestamps: Iterable) -> set:
+    return {timezone.localdate(t) for ts in timestamps for t in ts if t is not None}
+
+
+def summarise(account_id: str, days: int) -> Dict:
+    totals = (SpendRollup.objects
+              .filter(account_id=account_id, date__gte=analysis.window_start(days))
+              .values_list('category__name', 'top_level__name')
+              .annotate(count=Sum('count'), sum_pennies=Sum('sum_pennies'))
+              .order_by())
+    return analysis.summarise_totals(totals)
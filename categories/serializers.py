@@ -1,13 +1,24 @@
+from datetime import timedelta
+
+from django.utils import timezone
+
 from rest_framework import serializers
 
+from . import rollups
+
 from .models import *
 
 
+# Related lists are read through their managers, not the model properties, so
+# the viewsets' prefetches are used rather than a query per row. questions and
+# applicable_questions are the exception: those properties read the
+# with_questions() prefetch themselves.
+
 class CategorySerializer(serializers.HyperlinkedModelSerializer):
     questions = serializers.HyperlinkedRelatedField(
         many=True, read_only=True, view_name='question-detail')
     child_categories = serializers.HyperlinkedRelatedField(
-        many=True, read_only=True, view_name='category-detail')
+        source='category_set', many=True, read_only=True, view_name='category-detail')
 
     class Meta:
         model = Category
@@ -17,7 +28,7 @@ class CategorySerializer(serializers.HyperlinkedModelSerializer):
 
 class QuestionSerializer(serializers.HyperlinkedModelSerializer):
     options = serializers.HyperlinkedRelatedField(
-        many=True, read_only=True, view_name='option-detail')
+        source='option_set', many=True, read_only=True, view_name='option-detail')
 
     class Meta:
         model = Question
@@ -34,7 +45,7 @@ class TransactionSerializer(serializers.HyperlinkedModelSerializer):
     applicable_questions = serializers.HyperlinkedRelatedField(
         many=True, read_only=True, view_name='question-detail')
     question_answers = serializers.PrimaryKeyRelatedField(
-        many=True, read_only=True)
+        source='questionanswer_set', many=True, read_only=True)
 
     class Meta:
         model = Transaction
@@ -47,3 +58,26 @@ class QuestionAnswerSerializer(serializers.HyperlinkedModelSerializer):
         model = QuestionAnswer
         fields = ('id', 'url', 'transaction', 'question',
                   'option_answer', 'number_answer')
+
+
+class SpendSeriesQuerySerializer(serializers.Serializer):
+    # Query parameters for the spend series, defaulting to the last year by month
+    start = serializers.DateField(required=False)
+    end = serializers.DateField(required=False)
+    bucket = serializers.ChoiceField(choices=list(rollups.BUCKETS), default='month')
+    level = serializers.ChoiceField(choices=['top_level', 'category'], default='top_level')
+    account = serializers.CharField(required=False)
+
+    def validate(self, data):
+        data.setdefault('end', timezone.localdate())
+        data.setdefault('start', data['end'] - timedelta(days=365))
+        if data['start'] > data['end']:
+            raise serializers.ValidationError('start must not be after end')
+        return data
+
+
+class SpendSeriesSerializer(serializers.Serializer):
+    period = serializers.DateField()
+    category = serializers.CharField(source='category_name', allow_null=True)
+    count = serializers.IntegerField()
+    sum_pennies = serializers.IntegerField()
@@ -0,0 +1,41 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import analysis, category_tree, rollups
+from .models import CashTransaction, Category, QuestionAnswer, SpendRollup, Transaction
+
+
+@receiver(post_save, sender=Transaction)
+@receiver(post_delete, sender=Transaction)
+def refresh_transaction_rollups(sender, instance, **kwargs):
+    # Ingesting, re-categorising or deleting moves spend between the
+    # categories of one day, so that day is rolled up again
+    rollups.refresh(rollups.days_of([instance.monzo_created]))
+
+
+@receiver(post_save, sender=Transaction)
+@receiver(post_delete, sender=Transaction)
+@receiver(post_save, sender=CashTransaction)
+@receiver(post_delete, sender=CashTransaction)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(post_save, sender=QuestionAnswer)
+@receiver(post_delete, sender=QuestionAnswer)
+def invalidate_analysis(sender, **kwargs):
+    analysis.invalidate()
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def invalidate_category_tree(sender, **kwargs):
+    category_tree.invalidate()
+
+
+@receiver(post_save, sender=Category)
+def update_rollup_top_level(sender, instance, **kwargs):
+    # Moving a category moves everything below it too. The tree was
+    # invalidated above, so this reads the new one.
+    tree = category_tree.get()
+    top_level_id = tree[instance.pk].top_level_id
+    SpendRollup.objects.filter(category__in=tree.subtree(instance.pk)).exclude(
+        top_level=top_level_id).update(top_level=top_level_id)
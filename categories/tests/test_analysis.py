@@ -0,0 +1,63 @@
+from datetime import timedelta
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase
+from django.utils import timezone
+
+import categories.models as models
+from categories import analysis
+
+
+class TestSummarise(TestCase):
+    def test_totals_by_leaf_and_top_level_category(self):
+        spends = [('tx_1', -100), ('tx_2', -250), ('tx_3', -40), ('tx_4', -5)]
+        categories = {
+            'tx_1': ('Groceries', 'Food'),
+            'tx_2': ('Restaurants', 'Food'),
+            'tx_3': ('Transport', 'Transport'),
+        }
+        got = analysis.summarise(spends, categories)
+
+        self.assertEquals(got['total_transactions_count'], 4)
+        self.assertEquals(got['spending_sum_pennies'], 395)
+        self.assertEquals(got['ingested_sum_pennies'], 390)
+        self.assertEquals(got['uningested_sum_pennies'], 5)
+        self.assertEquals(got['diff'], 5)
+        self.assertEquals((got['count_ingested'], got['count_uningested']), (3, 1))
+        self.assertEquals(got['summary'], {'Food': 350, 'Transport': 40})
+        self.assertEquals(got['summary_all_cats'],
+                          {'Groceries': 100, 'Restaurants': 250, 'Transport': 40})
+
+
+class TestLoad(TestCase):
+    def setUp(self):
+        food = models.Category.objects.create(name='Food')
+        groceries = models.Category.objects.create(name='Groceries', parent=food)
+        created = timezone.now() - timedelta(days=1)
+        for i in range(5):
+            models.MonzoTransaction.objects.create(
+                id=f'tx_{i}', account_id='acc_1', created=created,
+                amount=-100, local_amount=-100)
+        for i, category in [(0, food), (1, groceries), (2, groceries)]:
+            models.Transaction.objects.create(id=f'tx_{i}', category=category)
+
+    def test_joins_in_two_queries(self):
+        # plus the category tree's version check
+        with self.assertNumQueries(3):
+            spends, categories = analysis.load(models.MonzoTransaction.objects.all())
+
+        self.assertEquals(len(spends), 5)
+        self.assertEquals(categories, {
+            'tx_0': ('Food', 'Food'),
+            'tx_1': ('Groceries', 'Food'),
+            'tx_2': ('Groceries', 'Food'),
+        })
+
+
+class TestBenchmarkCommand(TestCase):
+    def test_reports_each_size(self):
+        out = StringIO()
+        call_command('benchmark', '--sizes', '10', '20', '--repeat', '1', stdout=out)
+        lines = out.getvalue().splitlines()
+        self.assertEquals([line.split()[0] for line in lines[1:]], ['10', '20'])
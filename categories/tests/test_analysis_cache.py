@@ -0,0 +1,99 @@
+from datetime import timedelta
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+import categories.models as models
+from categories import analysis, monzo_integration
+from categories.monzo_sync import save_transactions
+from categories.tests.test_monzo_sync import monzo_transaction
+
+
+# The manifest storage needs collectstatic to have run before templates render
+@override_settings(STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+class TestAnalysisCache(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('user', password='password')
+        self.client.force_login(self.user)
+        monzo_user = models.MonzoUser.objects.create(
+            id='user_1', user=self.user, access_token='access', refresh_token='refresh',
+            access_token_expires=timezone.now() + timedelta(hours=1))
+        models.MonzoAccount.objects.create(
+            id='acc_1', monzo_user=monzo_user, last_synced=timezone.now())
+        self.food = models.Category.objects.create(name='Food')
+        save_transactions([monzo_transaction('tx_1', timezone.now(), amount=-100)])
+
+        self.addCleanup(monzo_integration._clients.clear)
+        analysis.clear_cache()
+        self.addCleanup(analysis.clear_cache)
+
+    def get(self, days=30):
+        with mock.patch('categories.analysis.get_backend',
+                        wraps=analysis.get_backend) as backend:
+            r = self.client.get(reverse('analysis_view', args=[days]))
+        self.assertEquals(r.status_code, 200)
+        return r, backend.call_count
+
+    def test_repeat_views_are_served_from_the_cache(self):
+        r, computed = self.get()
+        self.assertEquals(computed, 1)
+        self.assertEquals(r.context['total_transactions_count'], 1)
+
+        r, computed = self.get()
+        self.assertEquals(computed, 0)
+        self.assertEquals(r.context['total_transactions_count'], 1)
+        self.assertEquals(r.context['num_days_in_view'], 30)
+
+        self.assertIn('rate_limited', r.context['monzo_requests'])
+        stats = r.context['analysis_cache']
+        self.assertEquals((stats['hits'], stats['entries']), (1, 1))
+
+    def test_windows_are_cached_separately(self):
+        self.get(30)
+        self.assertEquals(self.get(7)[1], 1)
+        self.assertEquals(self.get(30)[1], 0)
+
+    def test_changes_invalidate(self):
+        transaction = models.Transaction.objects.create(id='tx_1', category=self.food)
+        question = models.Question.objects.create(title='How many?', answer_type='N')
+        changes = [
+            lambda: transaction.save(),
+            lambda: models.CashTransaction.objects.create(
+                id='cash_1', category=self.food, amount=-5,
+                description='coffee', merchant_name='cafe'),
+            lambda: models.Category.objects.create(name='Transport'),
+            lambda: models.QuestionAnswer.objects.create(
+                transaction=transaction, question=question, number_answer=2),
+            lambda: save_transactions([monzo_transaction('tx_2', timezone.now(), amount=-7)]),
+        ]
+        for change in changes:
+            self.get()
+            change()
+            self.assertEquals(self.get()[1], 1)
+
+        r, _ = self.get()
+        self.assertEquals(r.context['total_transactions_count'], 2)
+        self.assertEquals(r.context['count_ingested'], 1)
+
+    def test_syncing_nothing_keeps_the_cache(self):
+        self.get()
+        save_transactions([])
+        self.assertEquals(self.get()[1], 0)
+
+    @override_settings(ANALYSIS_CACHE_SIZE=2)
+    def test_least_recently_used_window_is_dropped(self):
+        for days in [1, 2, 1, 3]:
+            self.get(days)
+        self.assertEquals(analysis.cache_stats()['entries'], 2)
+        # 1 was used more recently than 2
+        self.assertEquals(self.get(1)[1], 0)
+        self.assertEquals(self.get(2)[1], 1)
+
+    def test_cached_view_reads_only_the_version(self):
+        self.get()
+        # the session and user, the account's last sync, then the version
+        with self.assertNumQueries(4):
+            self.client.get(reverse('analysis_view', args=[30]))
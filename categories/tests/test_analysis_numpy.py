@@ -0,0 +1,98 @@
+from datetime import datetime, timedelta
+from unittest import skipIf
+
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+import categories.models as models
+from categories import analysis, analysis_numpy, rollups
+from categories.analysis_numpy import SpendFrame, np
+from categories.monzo_sync import save_transactions
+from categories.tests.test_monzo_sync import monzo_transaction
+
+
+def at(*args):
+    return timezone.make_aware(datetime(*args))
+
+
+@skipIf(np is None, 'numpy is not installed')
+class TestSpendFrame(TestCase):
+    def setUp(self):
+        self.spends = [
+            ('tx_1', at(2026, 1, 30, 12), -100, '5411'),
+            ('tx_2', at(2026, 1, 31, 12), -250, '5812'),
+            ('tx_3', at(2026, 2, 2, 12), -40, '4111'),
+            ('tx_4', at(2026, 2, 2, 13), -5, '5411'),
+            ('tx_5', at(2026, 3, 1, 12), -1000, '6011'),
+        ]
+        self.categories = {
+            'tx_1': ('Groceries', 'Food'),
+            'tx_2': ('Restaurants', 'Food'),
+            'tx_3': ('Transport', 'Transport'),
+            'tx_5': ('Cash', 'Cash'),
+        }
+        self.frame = SpendFrame.from_rows(self.spends, self.categories)
+
+    def test_summary_matches_dict_loop(self):
+        loop = analysis.summarise([(id, amount) for id, _, amount, _ in self.spends],
+                                  self.categories)
+        self.assertEquals(self.frame.summarise(), loop)
+
+    def test_group_by_mcc(self):
+        # every spend has a merchant code, ingested or not
+        self.assertEquals(self.frame.group_sum('mcc'),
+                          {'5411': 105, '5812': 250, '4111': 40, '6011': 1000})
+
+    def test_daily_and_rolling_totals(self):
+        dates, totals = self.frame.daily_totals()
+        self.assertEquals(str(dates[0]), '2026-01-30')
+        self.assertEquals(len(dates), 31)
+        self.assertEquals(totals[:4].tolist(), [100, 250, 0, 45])
+
+        dates, totals = self.frame.rolling(window=2)
+        self.assertEquals(totals[:5].tolist(), [100, 350, 250, 45, 45])
+        self.assertEquals(totals[-1], 1000)
+
+    def test_percentiles(self):
+        self.assertEquals(self.frame.percentiles((0, 50, 100)), {0: 5, 50: 100, 100: 1000})
+
+    def test_month_over_month(self):
+        months, totals, deltas = self.frame.month_over_month()
+        self.assertEquals([str(month) for month in months], ['2026-01', '2026-02', '2026-03'])
+        self.assertEquals(totals.tolist(), [350, 45, 1000])
+        self.assertEquals(deltas.tolist(), [0, -305, 955])
+
+    def test_empty(self):
+        frame = SpendFrame.from_rows([], {})
+        self.assertEquals(frame.summarise()['total_transactions_count'], 0)
+        self.assertEquals(len(frame.rolling()[1]), 0)
+        self.assertEquals(len(frame.month_over_month()[0]), 0)
+        self.assertEquals(frame.percentiles(), {})
+
+
+@skipIf(np is None, 'numpy is not installed')
+class TestBackends(TestCase):
+    def setUp(self):
+        food = models.Category.objects.create(name='Food')
+        groceries = models.Category.objects.create(name='Groceries', parent=food)
+        now = timezone.now()
+        save_transactions([
+            monzo_transaction('tx_1', now, amount=-100),
+            monzo_transaction('tx_2', now, amount=-250),
+            monzo_transaction('tx_3', now - timedelta(days=3), amount=-40),
+            monzo_transaction('tx_4', now - timedelta(days=40), amount=-7),
+        ])
+        models.Transaction.objects.create(id='tx_1', category=groceries)
+        models.Transaction.objects.create(id='tx_3', category=food)
+
+    def test_backends_agree(self):
+        for days in [1, 7, 60]:
+            expected = rollups.summarise('acc_1', days)
+            self.assertEquals(analysis.summarise_window('acc_1', days), expected)
+            # the spends, their transactions, and the category tree's version
+            with self.assertNumQueries(3):
+                self.assertEquals(analysis_numpy.summarise_window('acc_1', days), expected)
+
+    @override_settings(ANALYSIS_BACKEND='categories.analysis_numpy.summarise_window')
+    def test_configured_backend(self):
+        self.assertIs(analysis.get_backend(), analysis_numpy.summarise_window)
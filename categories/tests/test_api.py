@@ -0,0 +1,62 @@
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+import categories.models as models
+
+
+class TestListEndpointQueries(TestCase):
+    # A page costs the same number of queries however many rows are on it
+    def setUp(self):
+        user = User.objects.create_user('user', password='password')
+        self.client.force_login(user)
+        self.rows = 0
+        self.add_rows(2)
+
+    def add_rows(self, count):
+        for _ in range(count):
+            i = self.rows
+            self.rows += 1
+            parent = models.Category.objects.create(name=f'parent {i}')
+            category = models.Category.objects.create(name=f'category {i}', parent=parent)
+            question = models.Question.objects.create(title=f'question {i}', answer_type='S')
+            question.categories.add(parent, category)
+            option = models.Option.objects.create(title=f'option {i}', question=question)
+            transaction = models.Transaction.objects.create(id=f'tx_{i}', category=category)
+            models.QuestionAnswer.objects.create(
+                transaction=transaction, question=question, option_answer=option)
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            r = self.client.get(url)
+        self.assertEquals(r.status_code, 200)
+        return len(queries), len(r.json()['results'])
+
+    def test_constant_queries_per_page(self):
+        urls = ['/api/categories/', '/api/questions/', '/api/options/',
+                '/api/questionanswers/', '/api/transactions/']
+        before = {url: self.count_queries(url) for url in urls}
+        self.add_rows(3)
+        for url in urls:
+            (queries, rows), (queries_before, rows_before) = self.count_queries(url), before[url]
+            self.assertGreater(rows, rows_before, url)
+            self.assertEquals(queries, queries_before, url)
+
+    def test_serialized_questions(self):
+        r = self.client.get('/api/transactions/')
+        got = {t['id']: t['applicable_questions'] for t in r.json()['results']}
+        question = models.Question.objects.get(title='question 0')
+        self.assertEquals(got['tx_0'], [f'http://testserver/api/questions/{question.pk}/'])
+
+    def test_reparenting_through_the_api(self):
+        new_parent = models.Category.objects.create(name='new parent')
+        question = models.Question.objects.create(title='new question', answer_type='N')
+        question.categories.add(new_parent)
+        category = models.Category.objects.get(name='category 0')
+
+        r = self.client.patch(f'/api/categories/{category.pk}/',
+                              {'parent': f'http://testserver/api/categories/{new_parent.pk}/'},
+                              content_type='application/json')
+        self.assertEquals(r.status_code, 200)
+        self.assertIn(f'http://testserver/api/questions/{question.pk}/', r.json()['questions'])
@@ -0,0 +1,74 @@
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+import categories.models as models
+from categories import category_tree
+from categories.forms import QuestionForm, TransactionForm
+
+
+class TestCategoryTree(TestCase):
+    def setUp(self):
+        self.food = models.Category.objects.create(name='Food')
+        self.groceries = models.Category.objects.create(name='Groceries', parent=self.food)
+        self.takeaway = models.Category.objects.create(name='Takeaway', parent=self.food,
+                                                       hidden=True)
+        self.transport = models.Category.objects.create(name='Transport')
+
+    def test_nodes(self):
+        tree = category_tree.get()
+        groceries = tree[self.groceries.pk]
+        self.assertEquals(groceries.hierarchical_name, self.groceries.get_hierarchical_name())
+        self.assertEquals(groceries.top_level_id, self.food.pk)
+        self.assertEquals(tree[self.food.pk].hierarchical_name, 'Food')
+        self.assertEquals(tree.children[self.food.pk], (self.groceries.pk, self.takeaway.pk))
+        self.assertEquals(tree.top_level, (self.food.pk, self.transport.pk))
+        self.assertEquals(tree.subtree(self.food.pk),
+                          [self.food.pk, self.groceries.pk, self.takeaway.pk])
+        self.assertEquals([node.name for node in tree.visible()],
+                          ['Food', 'Groceries', 'Transport'])
+        self.assertEquals({node.name: [child.name for child in children]
+                           for node, children in tree.nested().items()},
+                          {'Food': ['Groceries', 'Takeaway'], 'Transport': []})
+
+    def test_reused_until_a_category_changes(self):
+        tree = category_tree.get()
+        # only the version is read
+        with self.assertNumQueries(1):
+            self.assertIs(category_tree.get(), tree)
+
+        self.groceries.parent = self.transport
+        self.groceries.save()
+        tree = category_tree.get()
+        self.assertEquals(tree[self.groceries.pk].hierarchical_name, 'Transport -> Groceries')
+
+        self.takeaway.delete()
+        self.assertNotIn(self.takeaway.pk, category_tree.get())
+
+    def test_form_options_need_no_queries_per_category(self):
+        category_tree.get()
+        for i in range(5):
+            models.Category.objects.create(name=f'extra {i}', parent=self.transport)
+        category_tree.get()
+
+        # the version check for each form
+        with self.assertNumQueries(2):
+            transaction_form = TransactionForm().as_p()
+            question_form = QuestionForm().as_p()
+
+        self.assertIn('>Food -&gt; Groceries</option>', transaction_form)
+        self.assertIn('>Transport -&gt; extra 4</option>', question_form)
+        self.assertNotIn('Takeaway', transaction_form)
+
+    def test_form_still_validates_against_the_database(self):
+        form = TransactionForm({'id': 'tx_1', 'category': self.takeaway.pk})
+        self.assertFalse(form.is_valid())
+        form = TransactionForm({'id': 'tx_1', 'category': self.groceries.pk})
+        self.assertTrue(form.is_valid())
+
+    @override_settings(
+        STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+    def test_tree_view(self):
+        category_tree.get()
+        with self.assertNumQueries(1):
+            r = self.client.get(reverse('category_tree_view'))
+        self.assertContains(r, f'{self.groceries.pk}: Groceries')
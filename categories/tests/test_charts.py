@@ -0,0 +1,53 @@
+from collections import Counter
+
+from django.contrib.auth.models import User
+from django.test import TestCase
+
+import categories.models as models
+from categories import charts
+
+
+class TestPieChart(TestCase):
+    def test_identical_data_is_rendered_once(self):
+        first = charts.pie_chart_url(Counter({'Food': 350, 'Transport': 40}))
+        second = charts.pie_chart_url(Counter({'Transport': 40, 'Food': 350}))
+        other = charts.pie_chart_url(Counter({'Food': 351, 'Transport': 40}))
+
+        self.assertEquals(first, second)
+        self.assertNotEquals(first, other)
+        self.assertEquals(models.Chart.objects.count(), 2)
+
+    def test_rendering(self):
+        svg = charts.render_pie([['Food & Drink', 350], ['Transport', 40]])
+        self.assertEquals(svg.count('<path'), 2)
+        self.assertIn('Food &amp; Drink (£3.50)', svg)
+
+        self.assertIn('<circle', charts.render_pie([['Food', 350]]))
+        self.assertIn('No data', charts.render_pie([]))
+
+    def test_only_the_top_slices_are_shown(self):
+        summary = Counter({f'category {i}': i + 1 for i in range(15)})
+        url = charts.pie_chart_url(summary)
+        svg = models.Chart.objects.get(pk=url.split('/')[-1][:-len('.svg')]).svg
+        self.assertEquals(svg.count('<path'), charts.PIE_SLICES)
+        self.assertNotIn('category 0 ', svg)
+
+
+class TestChartView(TestCase):
+    def setUp(self):
+        user = User.objects.create_user('user', password='password')
+        self.client.force_login(user)
+        self.url = charts.pie_chart_url(Counter({'Food': 350}))
+
+    def test_served_with_long_lived_cache_headers(self):
+        r = self.client.get(self.url)
+        self.assertEquals(r.status_code, 200)
+        self.assertEquals(r['Content-Type'], 'image/svg+xml')
+        self.assertIn('immutable', r['Cache-Control'])
+        self.assertIn('max-age=31536000', r['Cache-Control'])
+
+        again = self.client.get(self.url, HTTP_IF_NONE_MATCH=r['ETag'])
+        self.assertEquals(again.status_code, 304)
+
+    def test_unknown_chart(self):
+        self.assertEquals(self.client.get('/charts/0123abcd.svg').status_code, 404)
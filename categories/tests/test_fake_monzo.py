@@ -0,0 +1,169 @@
+import os
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from wsgiref.simple_server import make_server
+
+from django.contrib.auth.models import User
+from django.test import TestCase
+from django.utils import timezone
+
+import requests
+
+import categories.models as models
+from categories.fake_monzo import FakeMonzo, FakeMonzoAdapter, record, wsgi_app
+from categories.management.commands.fake_monzo import ThreadingWSGIServer
+from categories import monzo_integration
+from categories.monzo_integration import (API_ROOT, MonzoException, MonzoRequest,
+                                          NoAccessTokenException, exchange_authorization_code,
+                                          get_client, session)
+from categories.monzo_sync import sync_transactions
+
+
+class FakeMonzoTestCase(TestCase):
+    def setUp(self):
+        monzo_user = models.MonzoUser.objects.create(
+            id='user_1',
+            access_token='access',
+            refresh_token='refresh',
+        )
+        self.account = models.MonzoAccount.objects.create(id='acc_1', monzo_user=monzo_user)
+
+    def use_fake(self, seed=1, **kwargs):
+        fake = FakeMonzo(seed=seed, **kwargs)
+        session.mount(API_ROOT, FakeMonzoAdapter(fake))
+        self.addCleanup(session.adapters.pop, API_ROOT, None)
+        return fake
+
+
+class TestFakeMonzoAdapter(FakeMonzoTestCase):
+    def test_pages_through_transactions(self):
+        fake = self.use_fake(count=250, days=30)
+        monzo = MonzoRequest(self.account)
+        requests_before = fake.request_count
+
+        got = list(monzo.iter_transactions(timezone.now() - timedelta(days=31)))
+
+        self.assertEquals([t['id'] for t in got], [t['id'] for t in fake.transactions])
+        self.assertEquals(fake.request_count - requests_before, 3)
+        self.assertTrue(all(t['account_id'] == 'acc_1' for t in got))
+
+    def test_before_bounds_the_window(self):
+        self.use_fake(count=100, days=10)
+        before = timezone.now() - timedelta(days=5)
+        got = list(MonzoRequest(self.account).iter_transactions(before - timedelta(days=1), before))
+
+        self.assertEquals(len(got), 10)
+
+    def test_expanded_bulk_fetch(self):
+        fake = self.use_fake(count=20)
+        ids = [t['id'] for t in fake.transactions[:5]] + ['tx_missing']
+
+        transactions, errors = MonzoRequest(self.account).get_transactions_by_id(ids)
+
+        self.assertEquals(list(transactions), ids[:5])
+        self.assertTrue(all(isinstance(t['merchant'], (dict, type(None)))
+                            for t in transactions.values()))
+        self.assertEquals(list(errors), ['tx_missing'])
+
+    def test_sync_into_mirror(self):
+        fake = self.use_fake(count=300, days=30)
+        monzo = MonzoRequest(self.account)
+
+        self.assertEquals(sync_transactions(monzo), 300)
+        self.assertEquals(models.MonzoTransaction.objects.count(), 300)
+        merchant_ids = {t['merchant']['id'] for t in fake.transactions if t['merchant']}
+        self.assertEquals(models.Merchant.objects.count(), len(merchant_ids))
+        # pages were saved as they arrived, not kept for the rest of the request
+        self.assertEquals(monzo._responses, {})
+
+    def test_accounts_sync_separately(self):
+        other = models.MonzoAccount.objects.create(id='acc_2',
+                                                   monzo_user=self.account.monzo_user)
+        first = self.use_fake(count=30, days=30)
+        sync_transactions(MonzoRequest(self.account))
+        self.assertIsNone(models.MonzoAccount.objects.get(pk='acc_2').sync_cursor)
+
+        second = self.use_fake(seed=2, count=20, days=10)
+        sync_transactions(MonzoRequest(other))
+
+        cursors = set()
+        for account_id, fake in [('acc_1', first), ('acc_2', second)]:
+            cursors.add(models.MonzoAccount.objects.get(pk=account_id).sync_cursor)
+            self.assertEquals(
+                models.MonzoTransaction.objects.for_account(account_id).count(),
+                len(fake.transactions))
+        self.assertEquals(len(cursors), 2)
+
+    def test_injected_errors(self):
+        fake = self.use_fake(count=1, error_rate=1)
+        monzo_user = self.account.monzo_user
+        monzo_user.access_token_expires = timezone.now() + timedelta(hours=1)
+        monzo_user.save()
+
+        with self.assertRaises(MonzoException):
+            MonzoRequest(self.account).get_transaction(fake.transactions[0]['id'])
+
+    def test_injected_latency(self):
+        fake = self.use_fake(count=1, latency_ms=20)
+        t0 = time.time()
+        fake.handle('GET', '/ping/whoami', {}, {})
+        self.assertGreaterEqual(time.time() - t0, 0.02)
+
+    def test_record_and_replay(self):
+        fake = self.use_fake(count=50, days=10)
+        path = os.path.join(tempfile.mkdtemp(), 'recording.json')
+        self.addCleanup(os.remove, path)
+
+        self.assertEquals(record(MonzoRequest(self.account), 11, path), 50)
+        replayed = FakeMonzo.from_recording(path)
+
+        self.assertEquals([t['id'] for t in replayed.transactions],
+                          [t['id'] for t in fake.transactions])
+
+    def test_login_links_user_and_accounts(self):
+        self.use_fake(count=1)
+        user = User.objects.create_user('user', password='password')
+        exchange_authorization_code('code', 'https://example.com/oauth-callback/', user)
+
+        monzo_user = models.MonzoUser.objects.get(user=user)
+        self.assertEquals(monzo_user.pk, 'user_fake')
+        self.assertEquals(list(monzo_user.accounts.values_list('pk', flat=True)), ['acc_fake'])
+        self.assertIsNotNone(monzo_user.access_token_expires)
+
+    def test_relinking_forgets_cached_clients(self):
+        self.use_fake(count=1)
+        self.addCleanup(monzo_integration._clients.clear)
+        user = User.objects.create_user('user', password='password')
+        models.MonzoUser.objects.filter(pk='user_1').update(user=user)
+        other = User.objects.create_user('other', password='password')
+        exchange_authorization_code('code', 'https://example.com/oauth-callback/', other)
+        self.assertEquals(get_client(user).account.pk, 'acc_1')
+        self.assertEquals(get_client(other).account.pk, 'acc_fake')
+
+        # the fake's login moves from other to user, unlinking user_1
+        exchange_authorization_code('code', 'https://example.com/oauth-callback/', user)
+        self.assertEquals(get_client(user).account.pk, 'acc_fake')
+        with self.assertRaises(NoAccessTokenException):
+            get_client(other)
+
+
+class TestFakeMonzoServer(TestCase):
+    def test_serves_over_http(self):
+        fake = FakeMonzo(count=150, seed=1)
+        server = make_server('localhost', 0, wsgi_app(fake), server_class=ThreadingWSGIServer)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        root = f'http://localhost:{server.server_port}'
+
+        page = requests.get(f'{root}/transactions', params={'limit': 100}).json()
+        self.assertEquals(len(page['transactions']), 100)
+
+        last_id = page['transactions'][-1]['id']
+        page = requests.get(f'{root}/transactions', params={'since': last_id}).json()
+        self.assertEquals(len(page['transactions']), 50)
+
+        r = requests.get(f'{root}/transactions/tx_missing')
+        self.assertEquals(r.status_code, 404)
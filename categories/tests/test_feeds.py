@@ -0,0 +1,50 @@
+from datetime import timedelta
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase
+from django.utils import timezone
+
+import categories.models as models
+from categories import feeds
+
+
+class TestFeeds(TestCase):
+    def setUp(self):
+        now = timezone.now()
+        for i, (days_ago, mcc, account_id) in enumerate([
+                (1, '5411', 'acc_1'), (2, '6011', 'acc_1'), (3, '5411', 'acc_1'),
+                (10, '6011', 'acc_1'), (1, '6011', 'acc_2')]):
+            models.MonzoTransaction.objects.create(
+                id=f'tx_{i}', account_id=account_id, created=now - timedelta(days=days_ago),
+                amount=-100, local_amount=-100, mcc=mcc, include_in_spending=True)
+        self.category = models.Category.objects.create(name='Food')
+        self.ingested = models.Transaction.objects.create(id='tx_1', category=self.category)
+        self.window = feeds.Window('acc_1', 7)
+
+    def test_latest_first_with_transactions_attached(self):
+        stages = [feeds.spending, feeds.latest_first, feeds.join_transactions]
+        with self.assertNumQueries(2):
+            spends = feeds.run(stages, self.window)
+
+        self.assertEquals([spend.id for spend in spends], ['tx_0', 'tx_1', 'tx_2'])
+        self.assertEquals([spend.transaction for spend in spends], [None, self.ingested, None])
+
+    def test_cash_withdrawals(self):
+        stages = [feeds.spending, feeds.cash_withdrawals, feeds.join_transactions]
+        spends = feeds.run(stages, self.window)
+        self.assertEquals([spend.id for spend in spends], ['tx_1'])
+
+    def test_stages_compose(self):
+        stages = [feeds.spending, feeds.only_mcc('5411'), feeds.latest_first]
+        self.assertEquals(list(feeds.run(stages, self.window).values_list('id', flat=True)),
+                          ['tx_0', 'tx_2'])
+
+
+class TestFeedBenchmark(TestCase):
+    def test_reports_each_size_and_rolls_back(self):
+        out = StringIO()
+        call_command('benchmark', '--feed', '--sizes', '10', '20', '--repeat', '1', stdout=out)
+        lines = out.getvalue().splitlines()
+        self.assertEquals([line.split()[0] for line in lines[1:]], ['10', '20'])
+        self.assertFalse(models.MonzoTransaction.objects.exists())
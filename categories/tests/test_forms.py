@@ -0,0 +1,55 @@
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+import categories.models as models
+from categories.forms import QuestionAnswerForm
+
+
+class TestQuestionAnswerForm(TestCase):
+    def setUp(self):
+        self.questions = [
+            models.Question.objects.create(title=f'question {i}', answer_type='S')
+            for i in range(20)]
+        self.options = [
+            models.Option.objects.create(title=f'option {i}', question=question)
+            for i, question in enumerate(self.questions)]
+
+    def test_unbound_renders_no_catalogue(self):
+        with self.assertNumQueries(0):
+            html = QuestionAnswerForm().as_p()
+        self.assertEquals(html.count('<option'), 2)
+        self.assertNotIn('question 0', html)
+
+    def test_renders_the_selected_choices(self):
+        form = QuestionAnswerForm({'question': self.questions[3].pk,
+                                   'option_answer': self.options[3].pk})
+        html = form.as_p()
+        self.assertIn(f'<option value="{self.questions[3].pk}" selected>question 3</option>', html)
+        self.assertIn(f'<option value="{self.options[3].pk}" selected>option 3</option>', html)
+        self.assertEquals(html.count('<option'), 4)
+
+    def test_validates_single_ids(self):
+        form = QuestionAnswerForm({'question': self.questions[3].pk,
+                                   'option_answer': self.options[3].pk})
+        # a get() for each id, then the model's own check that each exists
+        with self.assertNumQueries(4):
+            self.assertTrue(form.is_valid())
+
+        form = QuestionAnswerForm({'question': 9999})
+        self.assertFalse(form.is_valid())
+        self.assertIn('question', form.errors)
+
+    def test_option_must_answer_the_question(self):
+        form = QuestionAnswerForm({'question': self.questions[3].pk,
+                                   'option_answer': self.options[4].pk})
+        self.assertFalse(form.is_valid())
+        self.assertEquals(form.non_field_errors(),
+                          ['Option is not an answer to the selected question'])
+
+    @override_settings(
+        STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+    def test_new_transaction_page_leaves_choices_to_be_fetched(self):
+        r = self.client.get(reverse('transaction_new'))
+        self.assertEquals(r.status_code, 200)
+        self.assertNotContains(r, 'question 0')
+        self.assertNotContains(r, 'option 0')
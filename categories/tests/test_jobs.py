@@ -0,0 +1,162 @@
+from datetime import timedelta
+from unittest import mock
+
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+import categories.models as models
+from categories import jobs
+
+
+@override_settings(WORKER_SCHEDULE_SECONDS={'scheduled': 60})
+class TestJobs(TestCase):
+    def setUp(self):
+        self.handler = mock.Mock()
+        patcher = mock.patch.dict(jobs.HANDLERS, {'scheduled': self.handler,
+                                                  'one_off': self.handler})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_enqueue_deduplicates_pending_jobs(self):
+        first = jobs.enqueue('one_off')
+        second = jobs.enqueue('one_off')
+        self.assertEquals(first.pk, second.pk)
+        self.assertEquals(models.Job.objects.count(), 1)
+
+    def test_enqueue_alongside_running_job(self):
+        jobs.enqueue('one_off')
+        running = jobs.claim()
+        queued = jobs.enqueue('one_off')
+        self.assertNotEquals(running.pk, queued.pk)
+
+    def test_claim_skips_jobs_not_yet_due(self):
+        jobs.enqueue('one_off', run_after=timezone.now() + timedelta(minutes=1))
+        self.assertIsNone(jobs.claim())
+
+    def test_successful_run_is_recorded(self):
+        jobs.enqueue('one_off')
+        self.assertEquals(jobs.run_pending(), 1)
+
+        job = models.Job.objects.get(kind='one_off')
+        self.assertEquals(job.status, models.Job.SUCCEEDED)
+        self.assertEquals(job.attempts, 1)
+        self.assertIsNotNone(job.duration)
+        self.handler.assert_called_once_with('')
+
+    def test_failed_run_is_retried_with_backoff(self):
+        self.handler.side_effect = ValueError('boom')
+        jobs.enqueue('one_off')
+        jobs.run_pending()
+
+        job = models.Job.objects.get()
+        self.assertEquals(job.status, models.Job.PENDING)
+        self.assertIn('boom', job.last_error)
+        self.assertGreater(job.run_after, timezone.now())
+
+    def test_failed_run_gives_up_after_max_attempts(self):
+        self.handler.side_effect = ValueError('boom')
+        job = jobs.enqueue('one_off')
+        job.max_attempts = 1
+        job.save()
+        jobs.run_pending()
+
+        self.assertEquals(models.Job.objects.get().status, models.Job.FAILED)
+
+    @override_settings(WORKER_JOB_TIMEOUT_SECONDS=60)
+    def test_stalled_job_is_retried(self):
+        jobs.enqueue('one_off')
+        job = jobs.claim()
+        self.assertEquals(jobs.reclaim_stalled(), 0)
+
+        models.Job.objects.update(started=timezone.now() - timedelta(minutes=2))
+        self.assertEquals(jobs.reclaim_stalled(), 1)
+        job.refresh_from_db()
+        self.assertEquals((job.status, job.attempts), (models.Job.PENDING, 1))
+        self.assertIn('worker stopped', job.last_error)
+
+        models.Job.objects.update(status=models.Job.RUNNING, attempts=job.max_attempts,
+                                  started=timezone.now() - timedelta(minutes=2))
+        jobs.reclaim_stalled()
+        self.assertEquals(models.Job.objects.get().status, models.Job.FAILED)
+
+    @override_settings(WORKER_KEEP_SUCCEEDED_DAYS=7)
+    def test_old_successes_are_pruned(self):
+        for _ in range(2):
+            jobs.enqueue('one_off')
+            jobs.run_pending()
+        failed = models.Job.objects.create(kind='one_off', key='failed', status=models.Job.FAILED,
+                                           finished=timezone.now() - timedelta(days=30))
+        models.Job.objects.filter(pk=models.Job.objects.first().pk).update(
+            finished=timezone.now() - timedelta(days=8))
+
+        self.assertEquals(jobs.prune_finished(), 1)
+        self.assertEquals(models.Job.objects.count(), 2)
+        self.assertTrue(models.Job.objects.filter(pk=failed.pk).exists())
+
+    def test_scheduled_job_is_requeued(self):
+        jobs.schedule_all()
+        jobs.run_pending()
+
+        statuses = list(models.Job.objects.order_by('pk').values_list('status', flat=True))
+        self.assertEquals(statuses, [models.Job.SUCCEEDED, models.Job.PENDING])
+        self.assertGreater(models.Job.objects.last().run_after, timezone.now())
+
+
+class TestEnqueueSyncIfStale(TestCase):
+    def setUp(self):
+        monzo_user = models.MonzoUser.objects.create(
+            id='user_1', access_token='access', refresh_token='refresh')
+        self.account = models.MonzoAccount.objects.create(id='acc_1', monzo_user=monzo_user)
+
+    def test_stale_mirror_enqueues_sync(self):
+        jobs.enqueue_sync_if_stale(self.account)
+        job = models.Job.objects.get()
+        self.assertEquals((job.kind, job.target), ('sync_transactions', 'acc_1'))
+
+    def test_fresh_mirror_does_not(self):
+        models.MonzoAccount.objects.update(last_synced=timezone.now())
+        jobs.enqueue_sync_if_stale(self.account)
+        self.assertFalse(models.Job.objects.exists())
+
+    @override_settings(WORKER_SCHEDULE_SECONDS={'sync_transactions': 300})
+    def test_stale_mirror_brings_scheduled_sync_forward(self):
+        jobs.schedule_next('sync_transactions', 'acc_1')
+        self.assertIsNone(jobs.claim())
+
+        jobs.enqueue_sync_if_stale(self.account)
+        job = jobs.claim()
+        self.assertEquals(job.target, 'acc_1')
+        self.assertEquals(models.Job.objects.count(), 1)
+
+    def test_later_request_leaves_pending_job_due(self):
+        jobs.enqueue('sync_transactions', 'acc_1')
+        jobs.enqueue('sync_transactions', 'acc_1',
+                     run_after=timezone.now() + timedelta(minutes=5))
+        self.assertIsNotNone(jobs.claim())
+
+
+class TestPerAccountJobs(TestCase):
+    def setUp(self):
+        for user_id, account_ids in [('user_1', ['acc_1', 'acc_2']), ('user_2', ['acc_3'])]:
+            monzo_user = models.MonzoUser.objects.create(
+                id=user_id, access_token='access', refresh_token='refresh')
+            for account_id in account_ids:
+                models.MonzoAccount.objects.create(id=account_id, monzo_user=monzo_user)
+
+    def test_schedule_all_targets_each_account_and_user(self):
+        with override_settings(WORKER_SCHEDULE_SECONDS={'sync_transactions': 60,
+                                                        'refresh_token': 60}):
+            jobs.schedule_all()
+
+        self.assertEquals(
+            sorted(models.Job.objects.values_list('kind', 'target')),
+            [('refresh_token', 'user_1'), ('refresh_token', 'user_2'),
+             ('sync_transactions', 'acc_1'), ('sync_transactions', 'acc_2'),
+             ('sync_transactions', 'acc_3')])
+
+    def test_syncs_of_different_accounts_are_queued_separately(self):
+        first = jobs.enqueue('sync_transactions', 'acc_1')
+        second = jobs.enqueue('sync_transactions', 'acc_2')
+        again = jobs.enqueue('sync_transactions', 'acc_1')
+        self.assertNotEquals(first.pk, second.pk)
+        self.assertEquals(first.pk, again.pk)
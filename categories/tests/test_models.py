@@ -1,4 +1,5 @@
 from django.test import TestCase
+from django.utils import timezone
 
 import categories.models as models
 from unittest import expectedFailure
@@ -53,6 +54,28 @@ class TestCategoryModel(TestCase):
         want = [q1, q2]
         self.assertEquals(list(got), want)
 
+    def test_category_get_questions_in_one_query(self):
+        question = models.Question.objects.create(title='shared', answer_type='N')
+        question.categories.add(self.parent_category, self.sub_category)
+
+        with self.assertNumQueries(1):
+            self.assertEquals(list(self.sub_category.questions), [question])
+
+    def test_category_questions_prefetched_for_many_categories(self):
+        q1 = models.Question.objects.create(title='parent question', answer_type='N')
+        q1.categories.add(self.parent_category)
+        q2 = models.Question.objects.create(title='sub question', answer_type='N')
+        q2.categories.add(self.sub_category)
+        for i in range(3):
+            models.Category.objects.create(name=f'sibling {i}', parent=self.parent_category)
+
+        with self.assertNumQueries(3):
+            got = {c.name: list(c.questions)
+                   for c in models.Category.objects.with_questions()}
+        self.assertEquals(got['top-level category'], [q1])
+        self.assertEquals(got['second-level category'], [q1, q2])
+        self.assertEquals(got['sibling 2'], [q1])
+
 
 class TestQuestionModel(TestCase):
     def setUp(self):
@@ -134,6 +157,12 @@ class TestTransaction(TestCase):
         want = self.question
         self.assertEquals(got, want)
 
+    def test_transaction_applicable_questions_prefetched(self):
+        with self.assertNumQueries(3):
+            got = {t.id: list(t.applicable_questions)
+                   for t in models.Transaction.objects.with_questions()}
+        self.assertEquals(got, {'123': [self.question], '1234': [self.question]})
+
     def test_transaction_get_question_answers(self):
         got = self.transaction.question_answers[0]
         want = self.qa
@@ -148,3 +177,29 @@ class TestTransaction(TestCase):
         got = self.transaction.is_cash_transaction
         want = False
         self.assertEquals(got, want)
+
+    def test_transaction_monzo_created_from_mirror(self):
+        created = timezone.now().replace(microsecond=0)
+        models.MonzoTransaction.objects.create(
+            id='tx_1', account_id='acc_1', created=created, amount=-1,
+            currency='GBP', local_amount=-1, local_currency='GBP')
+        transaction = models.Transaction.objects.create(
+            id='tx_1', category=self.parent_category)
+        self.assertEquals(transaction.monzo_created, created)
+
+    def test_transaction_monzo_created_without_mirror(self):
+        self.assertIsNone(self.transaction.monzo_created)
+
+
+class TestVersionToken(TestCase):
+    def test_bump_gives_a_fresh_token(self):
+        for model in [models.AnalysisVersion, models.CategoryVersion]:
+            before = model.current()
+            model.bump()
+            self.assertNotEquals(model.current(), before)
+
+    def test_bump_recreates_a_flushed_row(self):
+        models.AnalysisVersion.objects.all().delete()
+        self.assertEquals(models.AnalysisVersion.current(), '')
+        models.AnalysisVersion.bump()
+        self.assertEquals(len(models.AnalysisVersion.current()), 32)
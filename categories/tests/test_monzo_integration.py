@@ -0,0 +1,412 @@
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import threading
+import time
+from unittest import mock
+
+from django.test import TestCase
+from django.utils import timezone
+
+import requests
+
+import categories.models as models
+from categories import monzo_integration
+from categories.monzo_integration import (ACCOUNTS_ENDPOINT, MAX_RETRIES, RATE_LIMIT_RETRIES,
+                                          TIMEOUT, MonzoAuth, MonzoException, MonzoRequest,
+                                          TokenBucket, build_session, request)
+
+
+def fake_response(json, status_code=200):
+    response = mock.Mock(status_code=status_code)
+    response.json.return_value = json
+    return response
+
+
+class MonzoRequestTestCase(TestCase):
+    def setUp(self):
+        monzo_user = models.MonzoUser.objects.create(
+            id='user_1',
+            access_token='access',
+            refresh_token='refresh',
+        )
+        self.account = models.MonzoAccount.objects.create(id='acc_1', monzo_user=monzo_user)
+        with mock.patch.object(MonzoAuth, 'access_token', new_callable=mock.PropertyMock,
+                               return_value='access'):
+            self.monzo = MonzoRequest(self.account)
+
+
+class TestBuildSession(TestCase):
+    def test_retries_idempotent_requests_only(self):
+        retry = build_session().get_adapter('https://api.monzo.com').max_retries
+        self.assertEquals(retry.total, MAX_RETRIES)
+        self.assertTrue(retry.is_retry('GET', 503))
+        self.assertFalse(retry.is_retry('POST', 503))
+        self.assertFalse(retry.raise_on_status)
+        self.assertFalse(retry.respect_retry_after_header)
+
+    def test_network_errors_become_monzo_exceptions(self):
+        for error in [requests.ConnectionError, requests.Timeout, requests.exceptions.RetryError]:
+            with mock.patch('categories.monzo_integration.session.request', side_effect=error):
+                with self.assertRaises(MonzoException):
+                    request('GET', ACCOUNTS_ENDPOINT)
+
+
+class StubTransport:
+    # Stands in for requests.get/requests.post, answering by url
+    def __init__(self, responses):
+        self.responses = responses
+        self.calls = []
+
+    def __call__(self, method, url, *args, **kwargs):
+        assert kwargs['timeout'] == TIMEOUT
+        self.calls.append((url, kwargs.get('headers')))
+        response = self.responses[url]
+        return response.pop(0) if isinstance(response, list) else response
+
+    def urls(self):
+        return [url for url, _ in self.calls]
+
+
+class TestMonzoAuth(TestCase):
+    WHOAMI = MonzoAuth.WHOAMI_ENDPOINT
+    TOKEN = 'https://api.monzo.com/oauth2/token'
+
+    def setUp(self):
+        self.monzo_user = models.MonzoUser.objects.create(
+            id='user_1',
+            access_token='access',
+            refresh_token='refresh',
+        )
+        self.account = models.MonzoAccount.objects.create(id='acc_1', monzo_user=self.monzo_user)
+
+    def stub(self, responses):
+        transport = StubTransport(responses)
+        patcher = mock.patch('categories.monzo_integration.session.request', transport)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        return transport
+
+    def set_expiry(self, delta):
+        self.monzo_user.access_token_expires = timezone.now() + delta
+        self.monzo_user.save()
+
+    def test_unexpired_token_skips_whoami(self):
+        self.set_expiry(timedelta(hours=1))
+        transport = self.stub({})
+        self.assertEquals(MonzoAuth(self.monzo_user).access_token, 'access')
+        self.assertEquals(transport.calls, [])
+
+    def test_expired_token_checks_whoami(self):
+        self.set_expiry(timedelta(hours=-1))
+        transport = self.stub({self.WHOAMI: fake_response({'authenticated': True})})
+        auth = MonzoAuth(self.monzo_user)
+        self.assertEquals(auth.access_token, 'access')
+        self.assertEquals(auth.access_token, 'access')
+        self.assertEquals(transport.urls(), [self.WHOAMI])
+
+    def test_whoami_trust_keeps_the_stored_expiry(self):
+        self.set_expiry(timedelta(hours=-1))
+        self.stub({self.WHOAMI: fake_response({'authenticated': True})})
+        auth = MonzoAuth(self.monzo_user)
+        # a worker refreshes while this copy still holds the old token
+        fresh = timezone.now() + timedelta(hours=6)
+        models.MonzoUser.objects.filter(pk='user_1').update(access_token_expires=fresh)
+
+        self.assertEquals(auth.access_token, 'access')
+        self.assertTrue(auth.access_token_unexpired())
+        self.monzo_user.refresh_from_db()
+        self.assertEquals(self.monzo_user.access_token_expires, fresh)
+
+    def test_rejected_token_is_refreshed_and_expiry_stored(self):
+        transport = self.stub({
+            self.WHOAMI: fake_response({'authenticated': False}),
+            self.TOKEN: fake_response({'access_token': 'new access',
+                                       'refresh_token': 'new refresh',
+                                       'expires_in': 21600}),
+        })
+        self.assertEquals(MonzoAuth(self.monzo_user).access_token, 'new access')
+        self.assertEquals(transport.urls(), [self.WHOAMI, self.TOKEN])
+
+        self.monzo_user.refresh_from_db()
+        self.assertEquals(self.monzo_user.refresh_token, 'new refresh')
+        self.assertGreater(self.monzo_user.access_token_expires,
+                           timezone.now() + timedelta(hours=5))
+
+    def test_refresh_failing_without_json(self):
+        gateway_error = fake_response({}, status_code=502)
+        gateway_error.json.side_effect = ValueError
+        self.stub({self.WHOAMI: fake_response({'authenticated': False}),
+                   self.TOKEN: gateway_error})
+        with self.assertRaises(MonzoException):
+            MonzoAuth(self.monzo_user).access_token
+
+    def test_refresh_made_elsewhere_is_adopted(self):
+        transport = self.stub({self.WHOAMI: fake_response({'authenticated': False})})
+        auth = MonzoAuth(self.monzo_user)
+        models.MonzoUser.objects.filter(pk='user_1').update(
+            access_token='their access', refresh_token='their refresh',
+            access_token_expires=timezone.now() + timedelta(hours=6))
+
+        self.assertEquals(auth.access_token, 'their access')
+        self.assertEquals(transport.urls(), [self.WHOAMI])
+
+    def test_invalidating_keeps_the_stored_expiry(self):
+        self.set_expiry(timedelta(hours=1))
+        auth = MonzoAuth(self.monzo_user)
+        # a worker refreshes while this copy still holds the old token
+        fresh = timezone.now() + timedelta(hours=6)
+        models.MonzoUser.objects.filter(pk='user_1').update(
+            access_token='their access', refresh_token='their refresh',
+            access_token_expires=fresh)
+
+        auth.invalidate_access_token()
+        self.assertFalse(auth.access_token_unexpired())
+        self.monzo_user.refresh_from_db()
+        self.assertEquals(self.monzo_user.access_token_expires, fresh)
+
+    def test_401_revalidates_and_retries(self):
+        self.set_expiry(timedelta(hours=1))
+        transactions_url = MonzoRequest.TRANSACTIONS_ENDPOINT
+        transport = self.stub({
+            transactions_url: [fake_response({}, status_code=401),
+                               fake_response({'transactions': []})],
+            self.WHOAMI: fake_response({'authenticated': False}),
+            self.TOKEN: fake_response({'access_token': 'new access',
+                                       'refresh_token': 'new refresh',
+                                       'expires_in': 21600}),
+        })
+        monzo = MonzoRequest(self.account)
+        self.assertEquals(monzo.get_transactions(datetime.utcnow()), [])
+        self.assertEquals(transport.urls(), [transactions_url, self.WHOAMI,
+                                             self.TOKEN, transactions_url])
+        self.assertEquals(transport.calls[-1][1], {'Authorization': 'Bearer new access'})
+
+
+class TestIterTransactions(MonzoRequestTestCase):
+    def setUp(self):
+        super().setUp()
+        self.transactions = [{'id': f'tx_{i:03}', 'include_in_spending': i % 2 == 0}
+                             for i in range(7)]
+        self.requests = []
+
+        def get(method, url, params, headers, timeout):
+            self.requests.append(dict(params))
+            since = params['since']
+            remaining = [t for t in self.transactions if not since.startswith('tx_')
+                         or t['id'] > since]
+            return fake_response({'transactions': remaining[:params['limit']]})
+
+        patcher = mock.patch('categories.monzo_integration.session.request', side_effect=get)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_walks_every_page(self):
+        got = list(self.monzo.iter_transactions(datetime.utcnow(), limit=3))
+        self.assertEquals(got, self.transactions)
+        self.assertEquals([r['since'] for r in self.requests[1:]], ['tx_002', 'tx_005'])
+
+    def test_stops_early(self):
+        transactions = self.monzo.iter_transactions(datetime.utcnow(), limit=3)
+        next(transactions)
+        self.assertEquals(len(self.requests), 1)
+
+    def test_iter_days_of_spends_filters_spending(self):
+        got = [t['id'] for t in self.monzo.iter_days_of_spends(days=7)]
+        self.assertEquals(got, ['tx_000', 'tx_002', 'tx_004', 'tx_006'])
+        self.assertIn('before', self.requests[0])
+
+
+class TestGetLatestUningestedTransaction(MonzoRequestTestCase):
+    def test_stops_at_first_window_with_uningested_spend(self):
+        category = models.Category.objects.create(name='category')
+        models.Transaction.objects.create(id='tx_new', category=category)
+        windows = {
+            0: [{'id': 'tx_new', 'include_in_spending': True}],
+            1: [{'id': 'tx_old', 'include_in_spending': True}],
+        }
+        calls = []
+
+        def iter_days_of_spends(days, before):
+            calls.append(before)
+            return iter(windows.get(len(calls) - 1, []))
+
+        with mock.patch.object(self.monzo, 'iter_days_of_spends', side_effect=iter_days_of_spends), \
+                mock.patch.object(self.monzo, 'get_transaction', side_effect=lambda id: {'id': id}):
+            got = self.monzo.get_latest_uningested_transaction(days=30)
+
+        self.assertEquals(got, {'id': 'tx_old'})
+        self.assertEquals(len(calls), 2)
+        self.assertEquals(calls[0] - calls[1], timedelta(days=7))
+
+
+class TestGetTransactionsById(MonzoRequestTestCase):
+    def test_keeps_input_order_and_reports_failures(self):
+        ids = [f'tx_{i}' for i in range(8)]
+        threads = set()
+
+        def get(method, url, params, headers, timeout):
+            threads.add(threading.get_ident())
+            id = url.rsplit('/', 1)[1]
+            # finish in reverse order to check results are re-ordered
+            time.sleep(0.001 * (8 - int(id[3:])))
+            if id == 'tx_3':
+                return fake_response({'code': 'not_found'}, status_code=404)
+            return fake_response({'transaction': {'id': id}})
+
+        with mock.patch('categories.monzo_integration.session.request', side_effect=get):
+            transactions, errors = self.monzo.get_transactions_by_id(ids, max_workers=4)
+
+        self.assertEquals(list(transactions), [id for id in ids if id != 'tx_3'])
+        self.assertEquals([t['id'] for t in transactions.values()], list(transactions))
+        self.assertEquals(list(errors), ['tx_3'])
+        self.assertIsInstance(errors['tx_3'], MonzoException)
+        self.assertGreater(len(threads), 1)
+
+    def test_no_ids(self):
+        self.assertEquals(self.monzo.get_transactions_by_id([]), ({}, {}))
+
+
+class TestRequestScopedCache(MonzoRequestTestCase):
+    def test_identical_calls_hit_the_network_once(self):
+        category = models.Category.objects.create(name='category')
+        models.Transaction.objects.create(id='tx_1', category=category)
+        transactions = [{'id': 'tx_1', 'include_in_spending': True},
+                        {'id': 'tx_2', 'include_in_spending': True}]
+
+        with mock.patch('categories.monzo_integration.session.request',
+                        return_value=fake_response({'transactions': transactions})) as get:
+            self.monzo.get_days_of_spends(days=30)
+            ingested = self.monzo.get_days_of_ingested_spends(days=30)
+            uningested = self.monzo.get_days_of_uningested_spends(days=30)
+
+        self.assertEquals(get.call_count, 1)
+        self.assertEquals([t['id'] for t in ingested], ['tx_1'])
+        self.assertEquals([t['id'] for t in uningested], ['tx_2'])
+
+    def test_failed_responses_are_not_cached(self):
+        with mock.patch('categories.monzo_integration.session.request',
+                        return_value=fake_response({}, status_code=404)) as get:
+            for _ in range(2):
+                with self.assertRaises(MonzoException):
+                    self.monzo.get_transaction('tx_1')
+
+        self.assertEquals(get.call_count, 2)
+
+
+class TestTokenBucket(TestCase):
+    def test_allows_bursts_then_throttles(self):
+        bucket = TokenBucket(rate=100, capacity=5)
+        waits = [bucket.acquire() for _ in range(7)]
+        self.assertEquals(waits[:5], [0] * 5)
+        self.assertTrue(all(w > 0 for w in waits[5:]))
+
+    def test_shared_between_threads(self):
+        bucket = TokenBucket(rate=200, capacity=1)
+        t0 = time.monotonic()
+        threads = [threading.Thread(target=bucket.acquire) for _ in range(11)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        # one call from the burst, then ten at 200 per second
+        self.assertGreaterEqual(time.monotonic() - t0, 0.045)
+
+
+class TestRateLimitedRequest(TestCase):
+    def setUp(self):
+        patcher = mock.patch('categories.monzo_integration.time.sleep')
+        self.sleep = patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = mock.patch.dict(monzo_integration.metrics, clear=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = mock.patch.object(monzo_integration.rate_limiter, 'acquire', return_value=0)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def rate_limited(self, retry_after):
+        response = fake_response({'code': 'too_many_requests'}, status_code=429)
+        response.headers = {'Retry-After': retry_after}
+        return response
+
+    def test_honours_retry_after(self):
+        responses = [self.rate_limited('2'), fake_response({})]
+        with mock.patch('categories.monzo_integration.session.request',
+                        side_effect=responses):
+            r = monzo_integration.request('GET', 'https://api.monzo.com/ping/whoami')
+
+        self.assertEquals(r.status_code, 200)
+        delay = self.sleep.call_args[0][0]
+        self.assertTrue(2 <= delay <= 2.5)
+        self.assertEquals(monzo_integration.metrics['rate_limited'], 1)
+
+    def test_retry_after_http_date(self):
+        when = timezone.now() + timedelta(seconds=10)
+        response = self.rate_limited(when.strftime('%a, %d %b %Y %H:%M:%S GMT'))
+        delay = monzo_integration.retry_after_seconds(response, attempt=0)
+        self.assertTrue(8 <= delay <= 10.5)
+
+    def test_gives_up_on_long_retry_after(self):
+        with mock.patch('categories.monzo_integration.session.request',
+                        return_value=self.rate_limited('3600')) as request:
+            r = monzo_integration.request('GET', 'https://api.monzo.com/ping/whoami')
+
+        self.assertEquals(r.status_code, 429)
+        self.assertEquals(request.call_count, 1)
+        self.assertEquals(monzo_integration.metrics['rate_limited_failures'], 1)
+
+    def test_gives_up_after_retries(self):
+        with mock.patch('categories.monzo_integration.session.request',
+                        return_value=self.rate_limited('0')) as request:
+            r = monzo_integration.request('GET', 'https://api.monzo.com/ping/whoami')
+
+        self.assertEquals(r.status_code, 429)
+        self.assertEquals(request.call_count, RATE_LIMIT_RETRIES + 1)
+
+    def test_adapter_leaves_retry_after_to_request(self):
+        # through the real session, so urllib3's own retries run too
+        hits = []
+
+        class RateLimited(BaseHTTPRequestHandler):
+            def do_GET(self):
+                hits.append(self.path)
+                self.send_response(429)
+                self.send_header('Retry-After', '2')
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+
+            def log_message(self, *args):
+                pass
+
+        server = ThreadingHTTPServer(('localhost', 0), RateLimited)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+
+        with mock.patch('categories.monzo_integration.MAX_RETRY_AFTER', 1):
+            r = monzo_integration.request('GET', f'http://localhost:{server.server_port}/ping')
+
+        self.assertEquals(r.status_code, 429)
+        self.assertEquals(len(hits), 1)
+        self.assertEquals(monzo_integration.metrics['rate_limited_failures'], 1)
+
+    def test_counts_throttled_calls(self):
+        monzo_integration.rate_limiter.acquire.return_value = 0.25
+        with mock.patch('categories.monzo_integration.session.request',
+                        return_value=fake_response({})):
+            monzo_integration.request('GET', 'https://api.monzo.com/ping/whoami')
+
+        self.assertEquals(monzo_integration.metrics['throttled'], 1)
+        self.assertEquals(monzo_integration.metrics['throttled_seconds'], 0.25)
+
+    def test_counts_from_every_thread(self):
+        def throttled():
+            for _ in range(1000):
+                monzo_integration.count('throttled')
+
+        threads = [threading.Thread(target=throttled) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEquals(monzo_integration.request_stats()['throttled'], 8000)
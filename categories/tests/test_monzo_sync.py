@@ -0,0 +1,170 @@
+from datetime import timedelta
+
+from django.test import TestCase
+from django.utils import timezone
+
+import categories.models as models
+from categories import analysis
+from categories.monzo_sync import save_transactions, sync_transactions
+
+
+def monzo_transaction(id, created, amount=-100, settled=True, include_in_spending=True):
+    return {
+        'id': id,
+        'account_id': 'acc_1',
+        'created': created.strftime('%Y-%m-%dT%H:%M:%S.000Z'),
+        'description': f'description {id}',
+        'amount': amount,
+        'currency': 'GBP',
+        'local_amount': amount,
+        'local_currency': 'GBP',
+        'category': 'groceries',
+        'metadata': {'mcc': '5411'},
+        'merchant': {'id': 'merch_1', 'name': 'Merchant', 'category': 'groceries',
+                     'address': {'formatted': '1 High Street'}},
+        'include_in_spending': include_in_spending,
+        'settled': created.strftime('%Y-%m-%dT%H:%M:%S.000Z') if settled else '',
+    }
+
+
+class StubMonzoRequest:
+    def __init__(self, account, transactions):
+        self.account = account
+        self.transactions = transactions
+        self.requested_since = []
+
+    def iter_transactions(self, since, expand_merchant=False, memo=True):
+        self.requested_since.append(since)
+        return (t for t in self.transactions
+                if t['created'] >= since.strftime('%Y-%m-%dT%H:%M:%S'))
+
+
+class TestSyncTransactions(TestCase):
+    def setUp(self):
+        monzo_user = models.MonzoUser.objects.create(
+            id='user_1',
+            access_token='access',
+            refresh_token='refresh',
+        )
+        self.account = models.MonzoAccount.objects.create(id='acc_1', monzo_user=monzo_user)
+        self.now = timezone.now().replace(microsecond=0)
+
+    def test_sync_creates_mirror_rows(self):
+        monzo = StubMonzoRequest(self.account, [
+            monzo_transaction('tx_1', self.now - timedelta(days=2)),
+            monzo_transaction('tx_2', self.now - timedelta(days=1), include_in_spending=False),
+        ])
+        got = sync_transactions(monzo)
+        self.assertEquals(got, 2)
+        self.assertEquals(models.MonzoTransaction.objects.count(), 2)
+        self.assertEquals(
+            list(models.MonzoTransaction.objects.spending().values_list('id', flat=True)),
+            ['tx_1'])
+        self.assertEquals(models.MonzoTransaction.objects.get(pk='tx_1').category, 'groceries')
+
+    def test_sync_advances_cursor_to_latest_settled(self):
+        latest = self.now - timedelta(days=1)
+        monzo = StubMonzoRequest(self.account, [
+            monzo_transaction('tx_1', self.now - timedelta(days=2)),
+            monzo_transaction('tx_2', latest),
+        ])
+        sync_transactions(monzo)
+        self.account.refresh_from_db()
+        self.assertEquals(self.account.sync_cursor, latest)
+
+        sync_transactions(monzo)
+        self.assertEquals(monzo.requested_since[-1], latest)
+
+    def test_sync_holds_cursor_at_pending_and_updates_settlement(self):
+        pending_created = self.now - timedelta(days=2)
+        pending = monzo_transaction('tx_1', pending_created, settled=False)
+        monzo = StubMonzoRequest(self.account, [
+            pending,
+            monzo_transaction('tx_2', self.now - timedelta(days=1)),
+        ])
+        sync_transactions(monzo)
+        self.account.refresh_from_db()
+        self.assertEquals(self.account.sync_cursor, pending_created)
+
+        pending['settled'] = pending['created']
+        pending['amount'] = -250
+        sync_transactions(monzo)
+        got = models.MonzoTransaction.objects.get(pk='tx_1')
+        self.assertEquals(got.amount, -250)
+        self.assertIsNotNone(got.settled)
+
+    def test_resync_of_unchanged_rows_changes_nothing(self):
+        monzo = StubMonzoRequest(self.account, [
+            monzo_transaction('tx_1', self.now - timedelta(days=2)),
+            monzo_transaction('tx_2', self.now - timedelta(days=1)),
+        ])
+        sync_transactions(monzo)
+        version = analysis.data_version()
+        rollup_ids = list(models.SpendRollup.objects.values_list('pk', flat=True))
+
+        # the inclusive cursor refetches tx_2
+        sync_transactions(monzo)
+        self.assertEquals(analysis.data_version(), version)
+        self.assertEquals(list(models.SpendRollup.objects.values_list('pk', flat=True)),
+                          rollup_ids)
+
+        monzo.transactions[1]['amount'] = -250
+        sync_transactions(monzo)
+        self.assertNotEquals(analysis.data_version(), version)
+        rollup = models.SpendRollup.objects.get(
+            date=timezone.localdate(self.now - timedelta(days=1)))
+        self.assertEquals(rollup.sum_pennies, 250)
+
+    def test_sync_fills_in_monzo_created_on_ingested_transactions(self):
+        category = models.Category.objects.create(name='category')
+        models.Transaction.objects.create(id='tx_1', category=category)
+        created = self.now - timedelta(days=1)
+        sync_transactions(StubMonzoRequest(self.account, [
+            monzo_transaction('tx_1', created)]))
+        self.assertEquals(models.Transaction.objects.get(pk='tx_1').monzo_created, created)
+
+    def test_sync_stores_each_merchant_once(self):
+        monzo = StubMonzoRequest(self.account, [
+            monzo_transaction('tx_1', self.now - timedelta(days=2)),
+            monzo_transaction('tx_2', self.now - timedelta(days=1)),
+        ])
+        sync_transactions(monzo)
+
+        merchant = models.Merchant.objects.get()
+        self.assertEquals(merchant.name, 'Merchant')
+        self.assertEquals(merchant.address, '1 High Street')
+        self.assertEquals(merchant.monzotransaction_set.count(), 2)
+
+    def test_unexpanded_merchant_does_not_overwrite_details(self):
+        expanded = monzo_transaction('tx_1', self.now - timedelta(days=2))
+        unexpanded = monzo_transaction('tx_2', self.now - timedelta(days=1))
+        unexpanded['merchant'] = 'merch_1'
+        placeholder = monzo_transaction('tx_3', self.now - timedelta(days=1))
+        placeholder['merchant'] = 'merch_2'
+        save_transactions([expanded])
+        save_transactions([unexpanded, placeholder])
+
+        self.assertEquals(models.Merchant.objects.get(pk='merch_1').name, 'Merchant')
+        self.assertEquals(models.Merchant.objects.get(pk='merch_2').name, '')
+        self.assertEquals(models.MonzoTransaction.objects.get(pk='tx_3').merchant_id, 'merch_2')
+
+
+class TestMonzoTransactionQuerySet(TestCase):
+    def setUp(self):
+        category = models.Category.objects.create(name='category')
+        now = timezone.now()
+        save_transactions([monzo_transaction(id, now - timedelta(days=days_ago))
+                           for id, days_ago in [('tx_1', 1), ('tx_2', 2), ('tx_old', 40)]])
+        models.Transaction.objects.create(id='tx_1', category=category)
+
+    def test_last_days(self):
+        got = models.MonzoTransaction.objects.last_days(30).values_list('id', flat=True)
+        self.assertEquals(list(got), ['tx_2', 'tx_1'])
+
+    def test_ingested(self):
+        got = models.MonzoTransaction.objects.ingested().values_list('id', flat=True)
+        self.assertEquals(list(got), ['tx_1'])
+
+    def test_uningested(self):
+        got = models.MonzoTransaction.objects.last_days(30).uningested()
+        self.assertEquals(list(got.values_list('id', flat=True)), ['tx_2'])
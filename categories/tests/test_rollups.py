@@ -0,0 +1,121 @@
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+
+from django.core.management import call_command
+from django.db import IntegrityError, transaction
+from django.test import TestCase
+from django.utils import timezone
+
+import categories.models as models
+from categories import analysis, rollups
+from categories.monzo_sync import save_transactions
+from categories.tests.test_monzo_sync import monzo_transaction
+
+
+class TestSpendRollups(TestCase):
+    def setUp(self):
+        self.food = models.Category.objects.create(name='Food')
+        self.groceries = models.Category.objects.create(name='Groceries', parent=self.food)
+        self.transport = models.Category.objects.create(name='Transport')
+
+        self.now = timezone.now()
+        save_transactions([
+            monzo_transaction('tx_1', self.now, amount=-100),
+            monzo_transaction('tx_2', self.now, amount=-250),
+            monzo_transaction('tx_3', self.now - timedelta(days=3), amount=-40),
+            monzo_transaction('tx_4', self.now, amount=500, include_in_spending=False),
+        ])
+
+    def rows(self):
+        return sorted(models.SpendRollup.objects.values_list(
+            'date', 'category__name', 'top_level__name', 'count', 'sum_pennies'),
+            key=lambda row: (row[0], row[1] or ''))
+
+    def test_synced_spends_start_uningested(self):
+        today = timezone.localdate(self.now)
+        self.assertEquals(self.rows(), [
+            (today - timedelta(days=3), None, None, 1, 40),
+            (today, None, None, 2, 350),
+        ])
+
+    def test_ingest_recategorise_and_delete(self):
+        today = timezone.localdate(self.now)
+        transaction = models.Transaction.objects.create(id='tx_1', category=self.groceries)
+        self.assertIn((today, 'Groceries', 'Food', 1, 100), self.rows())
+        self.assertIn((today, None, None, 1, 250), self.rows())
+
+        transaction.category = self.transport
+        transaction.save()
+        self.assertIn((today, 'Transport', 'Transport', 1, 100), self.rows())
+        self.assertNotIn('Groceries', [row[1] for row in self.rows()])
+
+        transaction.delete()
+        self.assertIn((today, None, None, 2, 350), self.rows())
+
+    def test_mirror_arriving_after_ingest(self):
+        models.Transaction.objects.create(id='tx_5', category=self.transport)
+        save_transactions([monzo_transaction('tx_5', self.now, amount=-7)])
+        self.assertIn((timezone.localdate(self.now), 'Transport', 'Transport', 1, 7), self.rows())
+
+    def test_reparenting_moves_top_level(self):
+        models.Transaction.objects.create(id='tx_1', category=self.groceries)
+        self.groceries.parent = self.transport
+        self.groceries.save()
+        self.assertIn('Transport', [row[2] for row in self.rows() if row[1] == 'Groceries'])
+
+    def test_moving_a_parent_moves_its_children(self):
+        models.Transaction.objects.create(id='tx_1', category=self.groceries)
+        self.food.parent = self.transport
+        self.food.save()
+        self.assertIn('Transport', [row[2] for row in self.rows() if row[1] == 'Groceries'])
+        self.assertEquals(rollups.summarise('acc_1', 1), analysis.summarise_window('acc_1', 1))
+
+    def test_rebuild_matches_incremental(self):
+        models.Transaction.objects.create(id='tx_1', category=self.groceries)
+        models.Transaction.objects.create(id='tx_3', category=self.food)
+        incremental = self.rows()
+
+        out = StringIO()
+        call_command('rebuild_rollups', stdout=out)
+        self.assertEquals(self.rows(), incremental)
+        self.assertEquals(out.getvalue(), f'Wrote {len(incremental)} rollup rows\n')
+
+    def test_one_uningested_row_per_day(self):
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            models.SpendRollup.objects.create(
+                account_id='acc_1', date=timezone.localdate(self.now), count=1, sum_pennies=1)
+
+    def test_refresh_locks_the_days_it_rebuilds(self):
+        today = timezone.localdate(self.now)
+        self.assertEquals(set(models.SpendRollupLock.objects.values_list('account_id', 'date')),
+                          {('acc_1', today), ('acc_1', today - timedelta(days=3))})
+
+        def arrives_meanwhile(keys):
+            lock(keys)
+            spend = monzo_transaction('tx_5', self.now)
+            spend['account_id'] = 'acc_2'
+            models.MonzoTransaction.from_api(spend).save()
+
+        lock = rollups.lock
+        with mock.patch.object(rollups, 'lock', side_effect=arrives_meanwhile):
+            rollups.refresh([today])
+        # acc_2's day wasn't locked, so it's left to the refresh of whoever added it
+        self.assertFalse(models.SpendRollup.objects.filter(account_id='acc_2').exists())
+        rollups.refresh([today])
+        self.assertTrue(models.SpendRollup.objects.filter(account_id='acc_2').exists())
+
+    def test_summarise_window(self):
+        models.Transaction.objects.create(id='tx_1', category=self.groceries)
+        models.Transaction.objects.create(id='tx_3', category=self.food)
+
+        with self.assertNumQueries(1):
+            got = rollups.summarise('acc_1', 1)
+        self.assertEquals(got['total_transactions_count'], 2)
+        self.assertEquals(got['ingested_sum_pennies'], 100)
+        self.assertEquals(got['uningested_sum_pennies'], 250)
+        self.assertEquals(got['summary_all_cats'], {'Groceries': 100})
+
+        got = rollups.summarise('acc_1', 30)
+        self.assertEquals(got['summary'], {'Food': 140})
+        self.assertEquals(got['count_uningested'], 1)
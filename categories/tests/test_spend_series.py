@@ -0,0 +1,73 @@
+from datetime import date
+
+from django.contrib.auth.models import User
+from django.test import TestCase
+from django.urls import reverse
+
+import categories.models as models
+
+
+class TestSpendSeriesView(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('user', password='password')
+        self.client.force_login(self.user)
+        monzo_user = models.MonzoUser.objects.create(
+            id='user_1', user=self.user, access_token='access', refresh_token='refresh')
+        for account_id in ['acc_1', 'acc_2']:
+            models.MonzoAccount.objects.create(id=account_id, monzo_user=monzo_user)
+
+        food = models.Category.objects.create(name='Food')
+        groceries = models.Category.objects.create(name='Groceries', parent=food)
+        for account_id, day, category, sum_pennies in [
+                ('acc_1', date(2026, 1, 31), groceries, 100),   # Saturday
+                ('acc_1', date(2026, 2, 1), groceries, 200),    # Sunday
+                ('acc_1', date(2026, 2, 2), food, 400),         # Monday
+                ('acc_1', date(2026, 2, 2), None, 800),
+                ('acc_2', date(2026, 2, 2), food, 1600),
+                ('acc_someone_else', date(2026, 2, 2), food, 3200)]:
+            models.SpendRollup.objects.create(
+                account_id=account_id, date=day, category=category,
+                top_level=category and (category.parent or category),
+                count=1, sum_pennies=sum_pennies)
+
+    def get(self, **params):
+        params = {'start': '2026-01-01', 'end': '2026-02-28', **params}
+        return self.client.get(reverse('spend_series'), params)
+
+    def results(self, **params):
+        r = self.get(**params)
+        self.assertEquals(r.status_code, 200)
+        return [(row['period'], row['category'], row['count'], row['sum_pennies'])
+                for row in r.json()['results']]
+
+    def test_monthly_top_level(self):
+        self.assertEquals(self.results(), [
+            ('2026-01-01', 'Food', 1, 100),
+            ('2026-02-01', None, 1, 800),
+            ('2026-02-01', 'Food', 3, 2200),
+        ])
+
+    def test_weekly_leaf_categories_for_one_account(self):
+        self.assertEquals(self.results(bucket='week', level='category', account='acc_1'), [
+            ('2026-01-26', 'Groceries', 2, 300),
+            ('2026-02-02', None, 1, 800),
+            ('2026-02-02', 'Food', 1, 400),
+        ])
+
+    def test_daily_range_is_inclusive(self):
+        self.assertEquals(
+            self.results(bucket='day', start='2026-02-01', end='2026-02-01'),
+            [('2026-02-01', 'Food', 1, 200)])
+
+    def test_grouped_in_one_query(self):
+        # the session and user, then the series itself
+        with self.assertNumQueries(3):
+            self.client.get(reverse('spend_series'), {'bucket': 'week'})
+
+    def test_invalid_parameters(self):
+        self.assertEquals(self.get(bucket='year').status_code, 400)
+        self.assertEquals(self.get(start='2026-03-01').status_code, 400)
+
+    def test_requires_login(self):
+        self.client.logout()
+        self.assertEquals(self.get().status_code, 403)
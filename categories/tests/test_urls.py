@@ -131,6 +131,10 @@ class TestUrls(SimpleTestCase):
         url = reverse('ingest_view')
         self.assertEquals(resolve(url).func, views_experimental.ingest_view)
 
+    def test_resolves_monzo_webhook(self):
+        url = reverse('monzo_webhook', args=['secret'])
+        self.assertEquals(resolve(url).func, views_experimental.monzo_webhook_view)
+
     def test_resolves_login(self):
         url = reverse('login_view')
         self.assertEquals(resolve(url).func, views.login_view)
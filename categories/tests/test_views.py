@@ -0,0 +1,154 @@
+from datetime import timedelta
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+import requests
+
+import categories.models as models
+from categories import analysis, monzo_integration
+from categories.monzo_integration import MonzoAuth, NoAccessTokenException, get_client
+
+
+# The manifest storage needs collectstatic to have run before templates render
+@override_settings(STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+class TestLoginRedirectMixin(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('user', password='password')
+        self.client.force_login(self.user)
+        self.monzo_user = models.MonzoUser.objects.create(
+            id='user_1',
+            user=self.user,
+            access_token='access',
+            refresh_token='refresh',
+            access_token_expires=timezone.now() + timedelta(hours=1),
+        )
+        models.MonzoAccount.objects.create(id='acc_1', monzo_user=self.monzo_user)
+        self.addCleanup(monzo_integration._clients.clear)
+        self.addCleanup(analysis.clear_cache)
+
+    def test_unexpired_token_is_checked_without_the_network(self):
+        with mock.patch('categories.monzo_integration.session.request') as transport:
+            r = self.client.get(reverse('monzo_transactions'))
+
+        self.assertEquals(r.status_code, 200)
+        transport.assert_not_called()
+
+    def test_client_is_built_once_per_request(self):
+        with mock.patch('categories.views_experimental.get_client',
+                        wraps=get_client) as get:
+            self.client.get(reverse('monzo_transactions'))
+            self.client.get(reverse('analysis_view'))
+
+        self.assertEquals(get.call_count, 2)
+
+    def test_user_without_a_linked_account_is_sent_to_login(self):
+        other = User.objects.create_user('other', password='password')
+        self.client.force_login(other)
+        r = self.client.get(reverse('monzo_transactions'))
+
+        self.assertRedirects(r, reverse('login_view'), fetch_redirect_response=False)
+        self.assertEquals(self.client.session['final_redirect'], reverse('monzo_transactions'))
+
+    def test_missing_token_redirects_to_login(self):
+        with mock.patch('categories.views_experimental.get_client',
+                        side_effect=NoAccessTokenException):
+            r = self.client.get(reverse('monzo_transactions'))
+
+        self.assertRedirects(r, reverse('login_view'), fetch_redirect_response=False)
+
+    def test_unreachable_monzo_is_a_bad_gateway(self):
+        models.MonzoTransaction.objects.create(
+            id='tx_1', account_id='acc_1', created=timezone.now(), amount=-100,
+            currency='GBP', local_amount=-100, local_currency='GBP', include_in_spending=True)
+        with mock.patch('categories.monzo_integration.session.request',
+                        side_effect=requests.ConnectionError):
+            r = self.client.get(reverse('latest_transaction'))
+
+        self.assertEquals(r.status_code, 502)
+
+    def test_unreachable_monzo_during_the_token_check(self):
+        models.MonzoUser.objects.update(access_token_expires=timezone.now() - timedelta(hours=1))
+        for url in [reverse('analysis_view'), reverse('ingest_view')]:
+            with mock.patch('categories.monzo_integration.session.request',
+                            side_effect=requests.ConnectionError):
+                r = self.client.get(url)
+            self.assertEquals(r.status_code, 502)
+            monzo_integration._clients.clear()
+
+    def test_ingest_shows_monzos_category(self):
+        merchant = models.Merchant.objects.create(id='merch_1', category='groceries')
+        models.MonzoTransaction.objects.create(
+            id='tx_1', account_id='acc_1', created=timezone.now(), amount=-100,
+            currency='GBP', local_amount=-100, local_currency='GBP', category='eating_out',
+            merchant=merchant, include_in_spending=True)
+        r = self.client.get(reverse('ingest_view'))
+
+        self.assertContains(r, 'Category: Eating_Out')
+
+    def test_empty_mirror_waits_for_the_first_sync(self):
+        for url in [reverse('latest_transaction'), reverse('ingest_view')]:
+            r = self.client.get(url)
+            self.assertContains(r, 'Waiting for the first sync')
+
+    def test_nothing_left_to_ingest(self):
+        models.MonzoAccount.objects.update(last_synced=timezone.now())
+        category = models.Category.objects.create(name='category')
+        models.MonzoTransaction.objects.create(
+            id='tx_1', account_id='acc_1', created=timezone.now(), amount=-100,
+            currency='GBP', local_amount=-100, local_currency='GBP', include_in_spending=True)
+        models.Transaction.objects.create(id='tx_1', category=category)
+
+        r = self.client.get(reverse('ingest_view'))
+        self.assertContains(r, 'Nothing to ingest')
+
+
+class TestClientCache(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('user', password='password')
+        self.monzo_user = models.MonzoUser.objects.create(
+            id='user_1',
+            user=self.user,
+            access_token='access',
+            refresh_token='refresh',
+            access_token_expires=timezone.now() + timedelta(hours=1),
+        )
+        for account_id in ['acc_1', 'acc_2']:
+            models.MonzoAccount.objects.create(id=account_id, monzo_user=self.monzo_user)
+        self.addCleanup(monzo_integration._clients.clear)
+
+    def test_cached_client_needs_no_queries(self):
+        with self.assertNumQueries(1):
+            first = get_client(self.user)
+        with self.assertNumQueries(0):
+            second = get_client(self.user)
+
+        self.assertEquals(first.account.pk, 'acc_1')
+        self.assertIs(first.auth, second.auth)
+        # each request still gets its own response memo
+        self.assertIsNot(first, second)
+
+    def test_clients_are_cached_per_account(self):
+        monzo = get_client(self.user, 'acc_2')
+        self.assertEquals(monzo.params, {'account_id': 'acc_2'})
+        self.assertIsNot(monzo.auth, get_client(self.user).auth)
+
+    def test_token_change_invalidates_cached_clients(self):
+        cached = get_client(self.user).auth
+        MonzoAuth(self.monzo_user).save_tokens(
+            {'access_token': 'new access', 'refresh_token': 'new refresh', 'expires_in': 21600})
+
+        monzo = get_client(self.user)
+        self.assertIsNot(monzo.auth, cached)
+        self.assertEquals(monzo.headers, {'Authorization': 'Bearer new access'})
+
+    def test_closed_and_other_users_accounts_are_not_served(self):
+        models.MonzoAccount.objects.filter(pk='acc_1').update(closed=True)
+        self.assertEquals(get_client(self.user).account.pk, 'acc_2')
+
+        other = User.objects.create_user('other', password='password')
+        with self.assertRaises(NoAccessTokenException):
+            get_client(other, 'acc_2')
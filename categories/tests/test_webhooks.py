@@ -0,0 +1,94 @@
+import json
+import os
+from io import StringIO
+from unittest import mock
+
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+import categories.models as models
+
+FIXTURES_DIR = os.path.join(os.path.dirname(__file__), 'fixtures')
+
+
+def load_payload(name):
+    with open(os.path.join(FIXTURES_DIR, name)) as f:
+        return json.load(f)
+
+
+@override_settings(MONZO_WEBHOOK_SECRET='secret')
+class TestMonzoWebhookView(TestCase):
+    def setUp(self):
+        self.payload = load_payload('transaction_created.json')
+        monzo_user = models.MonzoUser.objects.create(
+            id='user_1',
+            access_token='access',
+            refresh_token='refresh',
+        )
+        models.MonzoAccount.objects.create(id=self.payload['data']['account_id'],
+                                           monzo_user=monzo_user)
+        self.url = reverse('monzo_webhook', args=['secret'])
+
+    def replay(self, payload, url=None):
+        return self.client.post(url or self.url, json.dumps(payload),
+                                content_type='application/json')
+
+    def test_transaction_created_is_mirrored(self):
+        r = self.replay(self.payload)
+        self.assertEquals(r.status_code, 200)
+
+        got = models.MonzoTransaction.objects.get(pk=self.payload['data']['id'])
+        self.assertEquals(got.amount, -350)
+        self.assertEquals(got.mcc, '5814')
+        self.assertEquals(got.merchant.name, 'The De Beauvoir Deli Co.')
+        self.assertIsNone(got.settled)
+
+    def test_redelivery_is_idempotent(self):
+        self.replay(self.payload)
+        self.payload['data']['settled'] = '2015-09-05T14:28:40Z'
+        self.replay(self.payload)
+
+        self.assertEquals(models.MonzoTransaction.objects.count(), 1)
+        self.assertIsNotNone(models.MonzoTransaction.objects.get().settled)
+
+    def test_wrong_secret_is_rejected(self):
+        r = self.replay(self.payload, url=reverse('monzo_webhook', args=['wrong']))
+        self.assertEquals(r.status_code, 404)
+        self.assertFalse(models.MonzoTransaction.objects.exists())
+
+    def test_unknown_account_is_rejected(self):
+        self.payload['data']['account_id'] = 'acc_someone_else'
+        r = self.replay(self.payload)
+        self.assertEquals(r.status_code, 400)
+        self.assertFalse(models.MonzoTransaction.objects.exists())
+
+    def test_malformed_payload_is_rejected(self):
+        r = self.client.post(self.url, 'not json', content_type='application/json')
+        self.assertEquals(r.status_code, 400)
+
+    def test_other_event_types_are_acknowledged(self):
+        r = self.replay({'type': 'something.else', 'data': {}})
+        self.assertEquals(r.status_code, 200)
+        self.assertFalse(models.MonzoTransaction.objects.exists())
+
+
+@override_settings(MONZO_WEBHOOK_SECRET='secret')
+class TestMonzoWebhooksCommand(TestCase):
+    def setUp(self):
+        patcher = mock.patch('categories.management.commands.monzo_webhooks.get_account_client')
+        self.monzo = patcher.start().return_value
+        self.addCleanup(patcher.stop)
+
+    def test_list(self):
+        self.monzo.list_webhooks.return_value = [{'id': 'webhook_1', 'url': 'https://a/b'}]
+        out = StringIO()
+        call_command('monzo_webhooks', 'list', stdout=out)
+        self.assertEquals(out.getvalue(), 'webhook_1: https://a/b\n')
+
+    def test_register(self):
+        self.monzo.register_webhook.side_effect = lambda url: {'id': 'webhook_1', 'url': url}
+        out = StringIO()
+        call_command('monzo_webhooks', 'register', 'https://example.com/', stdout=out)
+        self.monzo.register_webhook.assert_called_once_with(
+            'https://example.com/monzo/webhook/secret/')
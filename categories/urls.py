@@ -12,6 +12,8 @@ router.register(r'transactions', views.TransactionDrfViewSet)
 
 
 urlpatterns = [
+    path('api/spend-series/',
+         views.SpendSeriesView.as_view(), name='spend_series'),
     path('api/', include(router.urls)),
 
     path('',
@@ -80,6 +82,10 @@ urlpatterns = [
          views_experimental.AnalysisView.as_view(), name='analysis_view'),
     path('ingest/',
          views_experimental.ingest_view, name='ingest_view'),
+    path('monzo/webhook/<str:secret>/',
+         views_experimental.monzo_webhook_view, name='monzo_webhook'),
+    path('charts/<slug:digest>.svg',
+         views_experimental.chart_view, name='chart'),
     path('categorytree/',
          views_experimental.category_tree_view, name='category_tree_view'),
 
@@ -9,7 +9,10 @@ from django.views import generic
 from django.views.decorators.http import require_http_methods
 
 from rest_framework import permissions, viewsets
+from rest_framework.response import Response
+from rest_framework.views import APIView
 
+from . import rollups
 from .forms import *
 from .models import *
 from .serializers import *
@@ -20,7 +23,9 @@ from .monzo_integration import get_login_url, exchange_authorization_code, OAUTH
 ### Category Views ###
 
 class CategoryDrfViewSet(viewsets.ModelViewSet):
-    queryset = Category.objects.all().order_by('-id')
+    # prefetched for CategorySerializer's questions and child_categories
+    queryset = Category.objects.with_questions().prefetch_related(
+        'category_set').order_by('-id')
     serializer_class = CategorySerializer
     permission_classes = (permissions.IsAuthenticatedOrReadOnly,)
 
@@ -82,7 +87,7 @@ class CategoryDeleteView(generic.edit.DeleteView):
 ### Question Views ###
 
 class QuestionDrfViewSet(viewsets.ModelViewSet):
-    queryset = Question.objects.all().order_by('-id')
+    queryset = Question.objects.prefetch_related('categories', 'option_set').order_by('-id')
     serializer_class = QuestionSerializer
     permission_classes = (permissions.IsAuthenticatedOrReadOnly,)
 
@@ -133,6 +138,7 @@ class QuestionDeleteView(generic.edit.DeleteView):
 ### Option Views ###
 
 class OptionDrfViewSet(viewsets.ModelViewSet):
+    # foreign keys are hyperlinked from their ids, so need no joins
     queryset = Option.objects.all().order_by('-id')
     serializer_class = OptionSerializer
     permission_classes = (permissions.IsAuthenticatedOrReadOnly,)
@@ -192,6 +198,7 @@ class OptionDeleteView(generic.edit.DeleteView):
 ### QuestionAnswer Views ###
 
 class QuestionAnswerDrfViewSet(viewsets.ModelViewSet):
+    # foreign keys are hyperlinked from their ids, so need no joins
     queryset = QuestionAnswer.objects.all().order_by('-id')
     serializer_class = QuestionAnswerSerializer
     permission_classes = (permissions.IsAuthenticatedOrReadOnly,)
@@ -200,7 +207,9 @@ class QuestionAnswerDrfViewSet(viewsets.ModelViewSet):
 ### Transaction Views ###
 
 class TransactionDrfViewSet(viewsets.ModelViewSet):
-    queryset = Transaction.objects.all().order_by('-id')
+    # prefetched for TransactionSerializer's applicable_questions and question_answers
+    queryset = Transaction.objects.with_questions().prefetch_related(
+        'questionanswer_set').order_by('-id')
     serializer_class = TransactionSerializer
     permission_classes = (permissions.IsAuthenticated,)
 
@@ -274,6 +283,33 @@ def new_cash_transaction(request):
         return render(request, 'transaction_new.html', context=context)
 
 
+### Analysis API ###
+
+class SpendSeriesView(APIView):
+    # Spend per category bucketed by day, week or month, from the rollups
+    permission_classes = (permissions.IsAuthenticated,)
+
+    def get(self, request):
+        query = SpendSeriesQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        params = query.validated_data
+
+        accounts = MonzoAccount.objects.filter(monzo_user__user=request.user)
+        if 'account' in params:
+            accounts = accounts.filter(pk=params['account'])
+        spend = SpendRollup.objects.filter(account_id__in=accounts.values('pk'))
+
+        series = rollups.series(spend, params['start'], params['end'],
+                                params['bucket'], params['level'])
+        return Response({
+            'start': params['start'],
+            'end': params['end'],
+            'bucket': params['bucket'],
+            'level': params['level'],
+            'results': SpendSeriesSerializer(series, many=True).data,
+        })
+
+
 ### Composite Views ###
 
 class IndexView(generic.TemplateView):
@@ -300,7 +336,7 @@ def oauth_callback_view(request):
 
     authorization_code = request.GET.get('code')
     redirect_uri = request.build_absolute_uri(reverse('oauth_callback'))
-    exchange_authorization_code(authorization_code, redirect_uri)
+    exchange_authorization_code(authorization_code, redirect_uri, request.user)
 
     return redirect(request.session['final_redirect'])
 
@@ -1,29 +1,53 @@
+from django.conf import settings
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.forms import formset_factory
-from django.shortcuts import redirect, render
+from django.http import HttpResponse, HttpResponseBadRequest, HttpResponseNotFound
+from django.shortcuts import get_object_or_404, redirect, render
 from django.urls import reverse
+from django.utils.crypto import constant_time_compare
 from django.views import generic
-from django.views.decorators.http import require_http_methods
+from django.views.decorators.cache import cache_control
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import etag, require_http_methods
 
-from collections import Counter
+import json
 import time
 
+from . import analysis, category_tree, charts, feeds
 from .forms import *
 from .models import *
-from .monzo_integration import MonzoRequest, NoAccessTokenException
+from .monzo_integration import (MonzoException, MonzoRequest, NoAccessTokenException,
+                                get_client, request_stats)
+from .jobs import enqueue_sync_if_stale
+from .monzo_sync import save_transactions
 from .views import login_view, process_transaction_post
 
 
+def get_monzo_request(request) -> MonzoRequest:
+    # Built once per request, so the auth check and the view share one client.
+    # Its token check is local unless the cached expiry has passed.
+    if not hasattr(request, 'monzo'):
+        request.monzo = get_client(request.user, request.GET.get('account'))
+    return request.monzo
+
+
+def monzo_unavailable(e: MonzoException) -> HttpResponse:
+    # Monzo being unreachable isn't an error in this app
+    return HttpResponse(f'Monzo request failed: {e}', status=502)
+
+
 class LoginRedirectMixin():
     def dispatch(self, request, *args, **kwargs):
+        # the token check can call Monzo too, when the cached expiry has passed
         try:
-            MonzoRequest()
+            get_monzo_request(request)
+            return super().dispatch(request, *args, **kwargs)
         except NoAccessTokenException:
             self.request.session['final_redirect'] = request.path
             return redirect('login_view')
-
-        return super().dispatch(request, *args, **kwargs)
+        except MonzoException as e:
+            return monzo_unavailable(e)
 
 
 class LatestTransactionView(LoginRequiredMixin, LoginRedirectMixin, generic.TemplateView):
@@ -34,8 +58,16 @@ class LatestTransactionView(LoginRequiredMixin, LoginRedirectMixin, generic.Temp
         context = super().get_context_data(**kwargs)
 
         t0 = time.time()
-        monzo = MonzoRequest()
-        latest = monzo.get_latest_transaction()
+        monzo = self.request.monzo
+        enqueue_sync_if_stale(monzo.account)
+        try:
+            latest_txid = MonzoTransaction.objects.spending().for_account(
+                monzo.account.pk).latest('created').id
+        except MonzoTransaction.DoesNotExist:
+            # the worker hasn't synced the account yet
+            context['synced'] = monzo.account.last_synced is not None
+            return context
+        latest = monzo.get_transaction(latest_txid)
         req_secs = time.time() - t0
 
         context['monzo_transaction'] = latest
@@ -52,9 +84,9 @@ class LatestTransactionView(LoginRequiredMixin, LoginRedirectMixin, generic.Temp
         return context
 
 
-class MonzoTransactionsView(LoginRequiredMixin, LoginRedirectMixin, generic.TemplateView):
-    http_method_names = ['get']
-    template_name = 'monzo_transactions.html'
+class SpendFeedMixin():
+    # Lists the spends of the last `days` days through a feed of stages, see feeds.py
+    feed = []
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
@@ -65,24 +97,11 @@ class MonzoTransactionsView(LoginRequiredMixin, LoginRedirectMixin, generic.Temp
             num_days_in_view = 7
 
         t0 = time.time()
-        monzo = MonzoRequest()
-        spending = monzo.get_days_of_spends(days=num_days_in_view)
+        account = self.request.monzo.account
+        enqueue_sync_if_stale(account)
+        spending = feeds.run(self.feed, feeds.Window(account.pk, num_days_in_view))
         req_1_secs = time.time() - t0
 
-        ids = [t['id'] for t in spending]
-        # get any Transaction objects with a matching ID
-        transactions = list(Transaction.objects.filter(pk__in=ids))
-
-        # Attach Transaction object to monzo spends if it exists
-        for spend in spending:
-            spend['transaction'] = None
-            for transaction in transactions:
-                if transaction.id == spend['id']:
-                    spend['transaction'] = transaction
-
-        # Put the latest transactions at the front of the list
-        spending = spending[::-1]
-
         context['num_days_in_view'] = num_days_in_view
         context['object_list'] = spending
         context['req_1_secs'] = req_1_secs
@@ -90,76 +109,31 @@ class MonzoTransactionsView(LoginRequiredMixin, LoginRedirectMixin, generic.Temp
         return context
 
 
-class CashTransactionsView(LoginRequiredMixin, LoginRedirectMixin, generic.TemplateView):
+class MonzoTransactionsView(LoginRequiredMixin, LoginRedirectMixin, SpendFeedMixin,
+                            generic.TemplateView):
+    http_method_names = ['get']
+    template_name = 'monzo_transactions.html'
+    feed = [feeds.spending, feeds.latest_first, feeds.join_transactions]
+
+
+class CashTransactionsView(LoginRequiredMixin, LoginRedirectMixin, SpendFeedMixin,
+                           generic.TemplateView):
     http_method_names = ['get']
     template_name = 'cash_transactions.html'
+    feed = [feeds.spending, feeds.cash_withdrawals, feeds.latest_first,
+            feeds.join_transactions]
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
 
-        try:
-            num_days_in_view = context['days']
-        except KeyError:
-            num_days_in_view = 7
-
-        t0 = time.time()
-        monzo = MonzoRequest()
-        spending = monzo.get_days_of_spends(days=num_days_in_view)
-        req_1_secs = time.time() - t0
-
-        # only diff is here
-        # filter on mastercard mcc 6011 for "automated cash disbursements"
-        spending = [s for s in spending if 'mcc' in s['metadata'].keys()
-                    and s['metadata']['mcc'] == '6011']
-        ids = [t['id'] for t in spending]
-
-        # get any Transaction objects with a matching ID
-        transactions = list(Transaction.objects.filter(pk__in=ids))
-
-        # Attach Transaction object to monzo spends if it exists
-        for spend in spending:
-            spend['transaction'] = None
-            for transaction in transactions:
-                if transaction.id == spend['id']:
-                    spend['transaction'] = transaction
-
-        # Put the latest transactions at the front of the list
-        spending = spending[::-1]
-
         today = datetime.date.today()
-        one_week_ago = today - datetime.timedelta(days=num_days_in_view)
-        cash_transactions = CashTransaction.objects.filter(
+        one_week_ago = today - datetime.timedelta(days=context['num_days_in_view'])
+        context['cash_transactions'] = CashTransaction.objects.filter(
             spend_date__gte=one_week_ago)
 
-        context['num_days_in_view'] = num_days_in_view
-        context['object_list'] = spending
-        context['cash_transactions'] = cash_transactions
-        context['req_1_secs'] = req_1_secs
-
         return context
 
 
-def get_pichart_url(summary):
-    pi_labels = []
-    pi_data = []
-    for category, value in summary.most_common(10):
-        pi_labels.append(category)
-        pi_data.append(value)
-    pi_labels_string = str(pi_labels).replace(
-        ' ', '').replace('&', '%26')
-    pi_data_string = str(pi_data).replace(' ', '')
-
-    return (
-        "https://quickchart.io/chart?c={"
-        "type:'pie',"
-        "data:{labels:"
-        f"{pi_labels_string}"
-        ",datasets:[{data:"
-        f"{pi_data_string}"
-        "}]}}"
-    )
-
-
 class AnalysisView(LoginRequiredMixin, LoginRedirectMixin, generic.TemplateView):
     http_method_names = ['get']
     template_name = 'analysis.html'
@@ -172,70 +146,27 @@ class AnalysisView(LoginRequiredMixin, LoginRedirectMixin, generic.TemplateView)
         except KeyError:
             num_days_in_view = 30
 
-        monzo = MonzoRequest()
-        spending = monzo.get_days_of_spends(days=num_days_in_view)
-
-        # sums
-        spending_sum_pennies = abs(sum([t['amount'] for t in spending]))
-
-        ingested_transactions_monzo = monzo.get_days_of_ingested_spends(
-            days=num_days_in_view)
-
-        ingested_sum_pennies = abs(
-            sum([t['amount'] for t in ingested_transactions_monzo]))
-
-        diff = spending_sum_pennies - ingested_sum_pennies
-
-        uningested_transactions = monzo.get_days_of_uningested_spends(
-            days=num_days_in_view)
-        uningested_sum_pennies = abs(
-            sum([t['amount'] for t in uningested_transactions]))
+        account = self.request.monzo.account
+        enqueue_sync_if_stale(account)
+        context_add = analysis.cached(
+            self.request.user.pk, account.pk, num_days_in_view,
+            lambda: self.summarise(account.pk, num_days_in_view))
 
-        # some category stuff
-        ingested_transactions_monzo = monzo.get_days_of_ingested_spends(
-            days=num_days_in_view)
-        ingested_transaction_ids = [t['id']
-                                    for t in ingested_transactions_monzo]
-        ingested_transactions = list(
-            Transaction.objects.filter(pk__in=ingested_transaction_ids))
+        return {**context, **context_add,
+                'num_days_in_view': num_days_in_view,
+                'analysis_cache': analysis.cache_stats(),
+                'monzo_requests': request_stats()}
 
-        summary = Counter()
-        for transaction in ingested_transactions:
-            # Get top-level category for each transaction
-            category = transaction.category.parent if transaction.category.parent else transaction.category
-            monzo_transaction = [
-                t for t in ingested_transactions_monzo if t['id'] == transaction.id][0]
-            # spend amounts are always negative
-            summary[category.name] -= monzo_transaction['amount']
+    def summarise(self, account_id, num_days_in_view):
+        # by default a range-sum over the daily rollups, see ANALYSIS_BACKEND
+        context_add = analysis.get_backend()(account_id, num_days_in_view)
 
         # charts
-        top_level_category_pi_chart_url = get_pichart_url(summary)
-
-        summary_all_cats = Counter()
-        for transaction in ingested_transactions:
-            monzo_transaction = [
-                t for t in ingested_transactions_monzo if t['id'] == transaction.id][0]
-            # spend amounts are always negative
-            summary_all_cats[transaction.category.name] -= monzo_transaction['amount']
-
-        # charts
-        top_10_category_pi_chart_url = get_pichart_url(summary_all_cats)
-
-        context_add = {
-            'num_days_in_view': num_days_in_view,
-            'total_transactions_count': len(spending),
-            'spending_sum_pennies': spending_sum_pennies,
-            'ingested_sum_pennies': ingested_sum_pennies,
-            'count_ingested': len(ingested_transactions_monzo),
-            'diff': diff,
-            'uningested_sum_pennies': uningested_sum_pennies,
-            'count_uningested': len(uningested_transactions),
-            'summary': summary,
-            'top_level_category_pi_chart_url': top_level_category_pi_chart_url,
-            'summary_all_cats': summary_all_cats,
-            'top_10_category_pi_chart_url': top_10_category_pi_chart_url}
-
-        return {**context, **context_add}
+        context_add['top_level_category_pi_chart_url'] = charts.pie_chart_url(
+            context_add['summary'])
+        context_add['top_10_category_pi_chart_url'] = charts.pie_chart_url(
+            context_add['summary_all_cats'])
+        return context_add
 
 
 @login_required(login_url='/admin/')
@@ -248,13 +179,24 @@ def ingest_view(request):
         return process_transaction_post(request, QuestionAnswerFormSet)
 
     try:
-        monzo = MonzoRequest()
+        monzo = get_monzo_request(request)
     except NoAccessTokenException:
         request.session['final_redirect'] = reverse('ingest_view')
         return login_view(request)
+    except MonzoException as e:
+        return monzo_unavailable(e)
 
-    transaction = monzo.get_latest_uningested_transaction()
-    form_transaction = TransactionForm(initial={'id': transaction['id']})
+    enqueue_sync_if_stale(monzo.account)
+    # merchant details come from the local cache rather than an expanded fetch
+    uningested = MonzoTransaction.objects.spending().for_account(
+        monzo.account.pk).last_days(30).uningested()
+    try:
+        transaction = uningested.select_related('merchant').latest('created')
+    except MonzoTransaction.DoesNotExist:
+        # not synced yet, or everything recent has been ingested
+        context = {'synced': monzo.account.last_synced is not None}
+        return render(request, 'ingest.html', context)
+    form_transaction = TransactionForm(initial={'id': transaction.id})
     formset_questionanswer = QuestionAnswerFormSet()
     context = {'transaction': transaction,
                'form_transaction': form_transaction,
@@ -262,15 +204,45 @@ def ingest_view(request):
     return render(request, 'ingest.html', context)
 
 
-@require_http_methods(['GET'])
-def category_tree_view(request):
-    categories = Category.objects.all()
+@csrf_exempt
+@require_http_methods(['POST'])
+def monzo_webhook_view(request, secret):
+    # Monzo doesn't sign webhooks, so the registered url carries a shared secret
+    if not settings.MONZO_WEBHOOK_SECRET or \
+            not constant_time_compare(secret, settings.MONZO_WEBHOOK_SECRET):
+        return HttpResponseNotFound()
 
-    top_level_categories = {c: [] for c in categories if not c.parent}
-    sub_level_categories = [c for c in categories if c.parent]
+    try:
+        payload = json.loads(request.body)
+        # acknowledge other event types so Monzo doesn't retry them
+        if payload['type'] != 'transaction.created':
+            return HttpResponse()
+        data = payload['data']
+        # parsing up front rejects malformed transactions
+        monzo_transaction = MonzoTransaction.from_api(data)
+    except (KeyError, TypeError, ValueError):
+        return HttpResponseBadRequest()
+
+    if not MonzoAccount.objects.filter(pk=monzo_transaction.account_id).exists():
+        return HttpResponseBadRequest()
+
+    # Upserting by id makes redelivered webhooks harmless. The payload's
+    # merchant is already expanded, so nothing slow is left to do here.
+    save_transactions([data])
+    return HttpResponse()
+
+
+# A chart's url is the hash of its content, so it can be cached indefinitely
+@login_required(login_url='/admin/')
+@cache_control(private=True, max_age=365 * 24 * 60 * 60, immutable=True)
+@require_http_methods(['GET'])
+@etag(lambda request, digest: digest)
+def chart_view(request, digest):
+    chart = get_object_or_404(Chart, pk=digest)
+    return HttpResponse(chart.svg, content_type='image/svg+xml')
 
-    for category in sub_level_categories:
-        top_level_categories[category.parent].append(category)
 
-    context = {'object_list': top_level_categories}
+@require_http_methods(['GET'])
+def category_tree_view(request):
+    context = {'object_list': category_tree.get().nested()}
     return render(request, 'category_list_tree.html', context)
@@ -141,6 +141,9 @@ MONZO_CLIENT_ID = config.get('monzo', 'client_id') \
 MONZO_CLIENT_SECRET = config.get('monzo', 'client_secret') \
     if config.has_option('monzo', 'client_secret') \
     else os.environ.get('MONZO_CLIENT_SECRET')
+MONZO_WEBHOOK_SECRET = config.get('monzo', 'webhook_secret') \
+    if config.has_option('monzo', 'webhook_secret') \
+    else os.environ.get('MONZO_WEBHOOK_SECRET')
 
 LOGIN_URL = '/admin/'
 
@@ -148,3 +151,37 @@ REST_FRAMEWORK = {
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 10
 }
+
+# Point at a locally served fake with e.g. MONZO_API_ROOT=http://localhost:8001,
+# or set MONZO_FAKE_API to FakeMonzo kwargs to answer in-process
+MONZO_API_ROOT = os.environ.get('MONZO_API_ROOT', 'https://api.monzo.com')
+MONZO_FAKE_API = None
+
+# Client-side budget for calls to Monzo, shared by all threads in a process
+MONZO_RATE_LIMIT_PER_SECOND = 10
+MONZO_RATE_LIMIT_BURST = 20
+
+# Local mirror of Monzo transactions
+MONZO_SYNC_INTERVAL_SECONDS = 60
+MONZO_SYNC_BACKFILL_DAYS = 90
+
+# Summarises AnalysisView windows. categories.rollups.summarise sums the daily
+# rollups. categories.analysis.summarise_window and
+# categories.analysis_numpy.summarise_window (needs numpy) work from the raw
+# transactions.
+ANALYSIS_BACKEND = 'categories.rollups.summarise'
+# summaries kept per process, the least recently used going first
+ANALYSIS_CACHE_SIZE = 100
+
+# Background worker, see `./manage.py run_worker`
+WORKER_POLL_SECONDS = 5
+# jobs run at once per worker; SQLite only manages one writer, so keep this
+# at 1 unless running against Postgres
+WORKER_THREADS = 1
+WORKER_SCHEDULE_SECONDS = {
+    'sync_transactions': 300,
+    'refresh_token': 3600,
+}
+# a job running for longer than this is assumed to have lost its worker
+WORKER_JOB_TIMEOUT_SECONDS = 1800
+WORKER_KEEP_SUCCEEDED_DAYS = 7